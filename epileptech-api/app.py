@@ -1,4 +1,8 @@
 from app.main import app
+from app.database.database import init_db
 
 if __name__ == "__main__":
+    # The development server applies migrations itself; deployments run
+    # `python -m app.database.migrate` once instead
+    init_db()
     app.run(host="0.0.0.0", port=9000, debug=True)
\ No newline at end of file
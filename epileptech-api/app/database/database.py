@@ -1,8 +1,10 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, monitoring
 from pymongo.errors import ServerSelectionTimeoutError
 import os
 from dotenv import load_dotenv
 import logging
+from app.utils.metrics import observe_mongo_command
+from app.utils.profiling import native_lock
 
 # Load environment variables from .env file
 load_dotenv()
@@ -15,28 +17,217 @@ logger = logging.getLogger(__name__)
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 DB_NAME = os.getenv("DB_NAME", "test")
 
-# MongoDB client instance
-client = MongoClient(MONGODB_URL)
-db = client[DB_NAME]
+# Connection pool settings (per process)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", "30000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+
+# Bump when the index definitions below change
+SCHEMA_VERSION = 4
+
+class MongoCommandListener(monitoring.CommandListener):
+    """
+    pymongo command listener recording per-command latency
+
+    MongoClient only accepts listeners derived from pymongo's listener classes.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        observe_mongo_command(event, "ok")
+
+    def failed(self, event):
+        observe_mongo_command(event, "error")
+
+class MongoConnectionManager:
+    """
+    Owns the process's MongoClient
+
+    The client is created on first use rather than at import time, so workers
+    boot without touching the network. A client is never shared across a
+    fork: pre-forking servers get a fresh pool in every child process.
+    """
+
+    def __init__(self, url=MONGODB_URL, db_name=DB_NAME):
+        self.url = url
+        self.db_name = db_name
+        self._client = None
+        self._pid = None
+        self._probe = None
+        self._probe_key = None
+        self._lock = native_lock()
+
+    def _create_client(self, server_selection_timeout_ms=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+                       max_pool_size=MONGO_MAX_POOL_SIZE):
+        if self.url.startswith("mongomock://"):
+            # In-memory stand-in for load tests and local runs without MongoDB
+            # (pip install mongomock); data lives only as long as this process
+            import mongomock
+            logger.warning("Using an in-memory mongomock database")
+            return mongomock.MongoClient()
+        return MongoClient(
+            self.url,
+            maxPoolSize=max_pool_size,
+            minPoolSize=min(MONGO_MIN_POOL_SIZE, max_pool_size),
+            serverSelectionTimeoutMS=server_selection_timeout_ms,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+            connect=False,
+            event_listeners=[MongoCommandListener()],
+        )
+
+    @property
+    def client(self):
+        pid = os.getpid()
+        if self._client is None or self._pid != pid:
+            with self._lock:
+                if self._client is None or self._pid != pid:
+                    # A client inherited from the parent must not be used or closed here
+                    self._client = self._create_client()
+                    self._pid = pid
+        return self._client
+
+    @property
+    def db(self):
+        return self.client[self.db_name]
+
+    def _probe_client(self, timeout_ms):
+        """Single-connection client that gives up on server selection after timeout_ms"""
+        if self.url.startswith("mongomock://"):
+            # A second mongomock client would be a separate, empty database
+            return self.client
+        key = (os.getpid(), timeout_ms)
+        stale = None
+        with self._lock:
+            if self._probe_key != key:
+                if self._probe_key is not None and self._probe_key[0] == key[0]:
+                    stale = self._probe
+                self._probe = self._create_client(server_selection_timeout_ms=timeout_ms, max_pool_size=1)
+                self._probe_key = key
+            probe = self._probe
+        # Closing talks to the server, which must not happen while holding the native lock
+        if stale is not None:
+            stale.close()
+        return probe
+
+    def reset_after_fork(self):
+        """Drop the inherited clients; the child creates its own on next use"""
+        self._client = None
+        self._pid = None
+        self._probe = None
+        self._probe_key = None
+        self._lock = native_lock()
+
+    def close(self):
+        with self._lock:
+            owned = self._pid == os.getpid()
+            clients = [self._client if owned else None,
+                       self._probe if self._probe_key and self._probe_key[0] == os.getpid() else None]
+            self._client = None
+            self._pid = None
+            self._probe = None
+            self._probe_key = None
+        for client in clients:
+            if client is not None:
+                client.close()
+
+    def ping(self, timeout_ms=2000):
+        """
+        Check that MongoDB is reachable within about timeout_ms
+
+        The ping goes through a probe client of its own: the main client would
+        wait up to MONGO_SERVER_SELECTION_TIMEOUT_MS for a server first.
+
+        Returns:
+            (ok, error): Whether the ping succeeded and the error message if not
+        """
+        try:
+            self._probe_client(timeout_ms).admin.command('ping', maxTimeMS=timeout_ms)
+            return True, None
+        except Exception as e:
+            # Includes client construction errors, so readiness reports them instead of raising
+            return False, str(e)
+
+connection_manager = MongoConnectionManager()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=connection_manager.reset_after_fork)
+
+class LazyCollection:
+    """Collection handle that resolves against the current process's client"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(connection_manager.db[self.name], attr)
+
+    def __repr__(self):
+        return f"<LazyCollection {self.name}>"
 
 # Collections
-users_collection = db["users"]
-eeg_reports_collection = db["eeg_reports"]
-patients_collection = db["patients"]
+users_collection = LazyCollection("users")
+eeg_reports_collection = LazyCollection("eeg_reports")
+patients_collection = LazyCollection("patients")
+migrations_collection = LazyCollection("migrations")
+shadow_predictions_collection = LazyCollection("model_shadow_predictions")
+reprocessing_results_collection = LazyCollection("eeg_reprocessing_results")
+reprocessing_runs_collection = LazyCollection("reprocessing_runs")
+blobs_collection = LazyCollection("blobs")
 
-def init_db():
-    """Initialize database connection and create indexes"""
+def ensure_indexes():
+    """Create the indexes the application relies on"""
+    users_collection.create_index("username", unique=True)
+    users_collection.create_index("email", unique=True)
+    eeg_reports_collection.create_index("eeg_id", unique=True)
+    patients_collection.create_index("patient_id", unique=True)
+    shadow_predictions_collection.create_index([("shadows.name", 1), ("created_at", -1)])
+    shadow_predictions_collection.create_index("eeg_id")
+    reprocessing_results_collection.create_index([("run_id", 1), ("eeg_id", 1)], unique=True)
+    reprocessing_results_collection.create_index([("run_id", 1), ("status", 1)])
+    blobs_collection.create_index([("refs", 1), ("released_at", 1)])
+
+def run_migrations(force=False):
+    """
+    Create indexes once per schema version
+
+    Meant to run from a deploy/startup task (python -m app.database.migrate),
+    not from every worker. A marker document records the applied version, so
+    repeated runs are cheap no-ops.
+
+    Returns:
+        applied: True if indexes were (re)created
+    """
     try:
-        # Check if the connection is successful
-        client.admin.command('ping')
-        logger.info("Connected to MongoDB!")
-        
-        # Create indexes
-        users_collection.create_index("username", unique=True)
-        users_collection.create_index("email", unique=True)
-        eeg_reports_collection.create_index("eeg_id", unique=True)
-        patients_collection.create_index("patient_id", unique=True)
-        
+        marker = migrations_collection.find_one({"_id": "schema"})
+        if not force and marker and marker.get("version", 0) >= SCHEMA_VERSION:
+            logger.info(f"Database schema already at version {marker['version']}")
+            return False
+
+        ensure_indexes()
+        migrations_collection.update_one(
+            {"_id": "schema"},
+            {"$set": {"version": SCHEMA_VERSION}},
+            upsert=True
+        )
+        logger.info(f"Database schema migrated to version {SCHEMA_VERSION}")
+        return True
+
     except ServerSelectionTimeoutError:
         logger.error("Cannot connect to MongoDB!")
-        raise Exception("Database connection error")
\ No newline at end of file
+        raise Exception("Database connection error")
+
+def init_db():
+    """Initialize database connection and create indexes"""
+    ok, error = connection_manager.ping()
+    if not ok:
+        logger.error(f"Cannot connect to MongoDB! {error}")
+        raise Exception("Database connection error")
+    logger.info("Connected to MongoDB!")
+    run_migrations()
@@ -0,0 +1,26 @@
+"""
+Apply database migrations (index creation) once per deployment
+
+Usage (from the epileptech-api directory):
+    python -m app.database.migrate [--force]
+"""
+import sys
+import argparse
+from app.database.database import connection_manager, run_migrations
+
+def main():
+    parser = argparse.ArgumentParser(description="Create MongoDB indexes for EpilepTech")
+    parser.add_argument("--force", action="store_true", help="Recreate indexes even if already applied")
+    args = parser.parse_args()
+
+    ok, error = connection_manager.ping()
+    if not ok:
+        print(f"Cannot connect to MongoDB: {error}", file=sys.stderr)
+        return 1
+
+    run_migrations(force=args.force)
+    connection_manager.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
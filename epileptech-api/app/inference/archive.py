@@ -0,0 +1,156 @@
+"""
+Tiered storage: move processed recordings to the compressed archive format
+
+Once a recording has been classified, its raw EDF is only read again for
+reprocessing and re-runs. This job finds records that completed at least
+ARCHIVE_AFTER_DAYS ago and still point at a raw EDF. For each one it:
+
+1. writes a .eegz archive (app.utils.eeg_archive) from the EDF;
+2. restores the archive and checks it byte for byte against the original's SHA-256;
+3. stores the archive in the blob store and repoints the record's file_path at it;
+4. releases the record's reference to the EDF (legacy temp_uploads files are deleted).
+
+The record keeps a file_archive summary (sizes, ratio, the original SHA-256).
+process_eeg_file reads archives transparently, so processing and reprocessing
+need no changes. Files that are not EDF (BDF, zip, gz uploads) are skipped.
+A record modified while it was being archived is left as it is.
+
+Usage (from the epileptech-api directory):
+    python -m app.inference.archive --older-than-days 7 --limit 500
+    python -m app.inference.archive --eeg-id EEG123 --dry-run   # any age
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from app.database.database import eeg_reports_collection
+from app.utils.blob_storage import blob_store, blob_uri, delete_file, is_blob_uri, local_file, parse_blob_uri
+from app.utils.eeg_archive import ARCHIVE_SUFFIX, EEGArchive, FORMAT_VERSION, is_archive, write_archive
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS", "7"))
+
+
+def archive_record(record, dry_run=False):
+    """
+    Convert one record's recording to an archive and repoint the record at it
+
+    Args:
+        record: eeg_reports document with eeg_id and file_path
+        dry_run: Compress and verify, but store and change nothing
+
+    Returns:
+        result: {"status": "archived" | "skipped" | "failed", ...}
+    """
+    eeg_id, file_path = record["eeg_id"], record["file_path"]
+    if is_blob_uri(file_path) and parse_blob_uri(file_path).endswith(ARCHIVE_SUFFIX):
+        return {"status": "skipped", "reason": "already archived"}
+
+    fd, archive_path = tempfile.mkstemp(suffix=ARCHIVE_SUFFIX)
+    os.close(fd)
+    try:
+        with local_file(file_path) as source_path:
+            if is_archive(source_path):
+                return {"status": "skipped", "reason": "already archived"}
+            try:
+                stats = write_archive(source_path, archive_path)
+            except ValueError as e:
+                return {"status": "skipped", "reason": str(e)}
+
+        # Never drop the original unless the archive restores it exactly
+        with EEGArchive(archive_path) as archive:
+            if not archive.verify():
+                return {"status": "failed", "reason": "archive does not restore the original"}
+        if dry_run:
+            return {"status": "archived", "dry_run": True, **stats}
+
+        with open(archive_path, "rb") as f:
+            archive_key = blob_store.put(f, filename=f"{eeg_id}{ARCHIVE_SUFFIX}",
+                                         content_type="application/x-eeg-archive")
+        summary = {
+            "format": f"eegz/{FORMAT_VERSION}",
+            "original_sha256": stats["source_sha256"],
+            "original_size": stats["source_size"],
+            "archive_size": stats["archive_size"],
+            "ratio": stats["ratio"],
+            "archived_at": datetime.now(),
+        }
+        result = eeg_reports_collection.update_one(
+            {"eeg_id": eeg_id, "file_path": file_path},
+            {"$set": {"file_path": blob_uri(archive_key), "file_archive": summary}}
+        )
+        if not result.modified_count:
+            blob_store.release(archive_key)
+            return {"status": "skipped", "reason": "record changed while archiving"}
+        delete_file(file_path)
+        return {"status": "archived", **stats}
+    except Exception as e:
+        logger.error(f"Error archiving EEG {eeg_id}: {str(e)}")
+        return {"status": "failed", "reason": str(e)}
+    finally:
+        os.remove(archive_path)
+
+
+def run(older_than_days=ARCHIVE_AFTER_DAYS, query=None, limit=None, dry_run=False):
+    """
+    Archive every completed record older than `older_than_days` that is not archived yet
+
+    Returns:
+        counts: {"archived", "skipped", "failed", "source_bytes", "archive_bytes"}
+    """
+    query = dict(query or {})
+    query.setdefault("status", "completed")
+    query.setdefault("processed_at", {"$lte": datetime.now() - timedelta(days=older_than_days)})
+    query["file_path"] = {"$exists": True}
+    query["file_archive"] = {"$exists": False}
+    cursor = eeg_reports_collection.find(query, {"eeg_id": 1, "file_path": 1}).sort("processed_at", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+
+    counts = {"archived": 0, "skipped": 0, "failed": 0, "source_bytes": 0, "archive_bytes": 0}
+    start = time.perf_counter()
+    try:
+        for record in cursor:
+            result = archive_record(record, dry_run)
+            counts[result["status"]] += 1
+            if result["status"] == "archived":
+                counts["source_bytes"] += result["source_size"]
+                counts["archive_bytes"] += result["archive_size"]
+                logger.info(f"Archived {record['eeg_id']}: {result['source_size']} -> {result['archive_size']} "
+                            f"bytes ({result['ratio']:.2f}x)")
+            else:
+                logger.info(f"{result['status'].capitalize()} {record['eeg_id']}: {result.get('reason')}")
+    finally:
+        cursor.close()
+
+    ratio = counts["source_bytes"] / counts["archive_bytes"] if counts["archive_bytes"] else 0.0
+    print(f"{'Would archive' if dry_run else 'Archived'} {counts['archived']} recordings in "
+          f"{time.perf_counter() - start:.1f} s: {counts['source_bytes']} -> {counts['archive_bytes']} bytes "
+          f"({ratio:.2f}x); skipped {counts['skipped']}, failed {counts['failed']}", flush=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move processed EEG recordings to compressed archives")
+    parser.add_argument("--older-than-days", type=float, default=ARCHIVE_AFTER_DAYS,
+                        help="Only records processed at least this long ago")
+    parser.add_argument("--eeg-id", nargs="+", help="Only these records")
+    parser.add_argument("--limit", type=int, help="Archive at most this many records")
+    parser.add_argument("--dry-run", action="store_true", help="Compress and verify without storing anything")
+    args = parser.parse_args()
+
+    # Records named explicitly are archived whatever their age
+    query = {"eeg_id": {"$in": args.eeg_id}, "processed_at": {"$exists": True}} if args.eeg_id else {}
+    counts = run(args.older_than_days, query, args.limit, args.dry_run)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,156 @@
+"""
+Client used by the API tier to reach the inference service
+
+When INFERENCE_URL is set, classification, report generation and PDF rendering
+are sent to the inference service over HTTP. When it is unset, the same calls
+run in-process, which keeps single-process development setups working.
+"""
+import os
+import sys
+import time
+import logging
+import subprocess
+import threading
+
+from app.inference.schema import (
+    OP_CLASSIFY, OP_PDF, OP_REPORT, SCHEMA_VERSION, SchemaError,
+    decode_pdf, make_message, validate_response,
+)
+from app.inference import pipeline
+from app.utils.blob_storage import is_blob_uri
+from app.utils.executors import run_cpu_bound
+from app.utils.tracing import current_trace, span
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INFERENCE_URL = os.environ.get("INFERENCE_URL", "").rstrip("/")
+INFERENCE_TIMEOUT_SECONDS = float(os.environ.get("INFERENCE_TIMEOUT_SECONDS", "300"))
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class InferenceError(RuntimeError):
+    """Raised when the inference service fails or returns an invalid response"""
+
+
+class InferenceClient:
+    """HTTP client for the inference service"""
+
+    def __init__(self, base_url, timeout=INFERENCE_TIMEOUT_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self):
+        # requests sessions are not thread-safe, so keep one per thread
+        session = getattr(self._local, "session", None)
+        if session is None:
+            import requests
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def _call(self, op, **fields):
+        url = f"{self.base_url}/v{SCHEMA_VERSION}/{op}"
+        with span("inference_rpc", op=op):
+            try:
+                response = self._session().post(url, json=make_message(**fields), timeout=self.timeout)
+                message = response.json()
+                validate_response(op, message)
+            except SchemaError as e:
+                raise InferenceError(f"Invalid {op} response from inference service: {str(e)}")
+            except Exception as e:
+                raise InferenceError(f"Inference service unavailable for {op}: {str(e)}")
+
+        # Fold the service's own stage timings into this request's trace
+        trace = current_trace()
+        if trace is not None:
+            trace.add_stages(message.get("stages"), parent="inference_rpc")
+
+        if response.status_code != 200 or message.get("error"):
+            raise InferenceError(message.get("error") or f"Inference {op} failed with HTTP {response.status_code}")
+        return message
+
+    def health(self):
+        response = self._session().get(f"{self.base_url}/health", timeout=5)
+        response.raise_for_status()
+        return response.json()
+
+    def classify_file(self, file_path, waveform_key=None):
+        # Blob URIs resolve against the shared store on the service side
+        file_ref = file_path if is_blob_uri(file_path) else os.path.abspath(file_path)
+        message = self._call(OP_CLASSIFY, file_path=file_ref, waveform_key=waveform_key)
+        return message["classification"], message["confidence"], message["seizure_intervals"]
+
+    def generate_report(self, eeg_case):
+        return self._call(OP_REPORT, eeg_case=eeg_case)["report_text"]
+
+    def render_pdf(self, report_text, eeg_case=None, generated_at=None):
+        message = self._call(
+            OP_PDF,
+            report_text=report_text,
+            eeg_case=eeg_case,
+            generated_at=generated_at.isoformat() if generated_at else None,
+        )
+        return decode_pdf(message["pdf_base64"])
+
+
+class LocalInference:
+    """Runs inference in the calling process; used when no service is configured"""
+
+    def health(self):
+        return make_message(**pipeline.model_health())
+
+    def classify_file(self, file_path, waveform_key=None):
+        return run_cpu_bound(pipeline.classify_file, file_path, waveform_key)
+
+    def generate_report(self, eeg_case):
+        return run_cpu_bound(pipeline.generate_report, eeg_case)
+
+    def render_pdf(self, report_text, eeg_case=None, generated_at=None):
+        return run_cpu_bound(pipeline.render_pdf, report_text, eeg_case, generated_at)
+
+
+# Backend used by the API routes
+inference = InferenceClient(INFERENCE_URL) if INFERENCE_URL else LocalInference()
+
+
+def spawn_local_server(port=0, host="127.0.0.1", preload=False, startup_timeout=60.0):
+    """
+    Start the inference service in a child process and wait until it is healthy
+
+    Args:
+        port: Port to bind; 0 picks a free one
+        host: Interface to bind
+        preload: Whether the service should warm up the model at startup
+        startup_timeout: Seconds to wait for the health check
+
+    Returns:
+        (process, client): The child process and a client connected to it
+    """
+    if port == 0:
+        import socket
+        with socket.socket() as sock:
+            sock.bind((host, 0))
+            port = sock.getsockname()[1]
+
+    command = [sys.executable, "-m", "app.inference.server", "--host", host, "--port", str(port)]
+    if not preload:
+        command.append("--no-preload")
+    process = subprocess.Popen(command, cwd=API_ROOT)
+    client = InferenceClient(f"http://{host}:{port}")
+
+    deadline = time.monotonic() + startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise InferenceError(f"Inference service exited with code {process.returncode}")
+        try:
+            client.health()
+            return process, client
+        except Exception:
+            time.sleep(0.2)
+
+    process.terminate()
+    raise InferenceError("Inference service did not become healthy in time")
@@ -0,0 +1,116 @@
+"""
+Inference steps shared by the in-process backend and the inference service
+"""
+import os
+import time
+import logging
+from app.utils.lazy_loader import lazy_import
+from app.utils.metrics import record_fallback, record_llm_throughput
+from app.utils.tracing import span
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+gnn_classifier = lazy_import("app.models.gnn_classifier")
+file_handlers = lazy_import("app.utils.file_handlers")
+llm_report_generator = lazy_import("app.models.llm_report_generator")
+pdf_renderer = lazy_import("app.utils.pdf_renderer")
+waveform = lazy_import("app.utils.waveform")
+signal_filters = lazy_import("app.utils.signal_filters")
+blob_storage = lazy_import("app.utils.blob_storage")
+
+
+def model_health():
+    """
+    Health of the classification model, reported by both backends
+
+    Returns:
+        health: {"status": "ok" | "degraded", "model_loaded", "model_file_exists"}
+    """
+    # Without a weights file classify_eeg silently falls back to an untrained model
+    model_path = os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
+    model_file_exists = os.path.exists(model_path)
+    return {
+        "status": "ok" if model_file_exists else "degraded",
+        "model_loaded": gnn_classifier.is_loaded,
+        "model_file_exists": model_file_exists,
+    }
+
+
+def decode_file(file_path):
+    """
+    Read an EEG file, recording its shape and whether the dummy-data fallback was used
+
+    When PREPROCESS_ENABLED, the signal is also resampled to the canonical rate and
+    band-pass/notch filtered before anything else sees it. `file_path` may be a
+    blob:// URI from the blob store.
+    """
+    with span("decode") as stage:
+        with blob_storage.local_file(file_path) as path:
+            eeg_data = file_handlers.process_eeg_file(path)
+        stage.set(
+            n_channels=eeg_data.get("n_channels"),
+            sampling_rate=eeg_data.get("sampling_rate"),
+            duration_s=eeg_data.get("duration"),
+            fallback=bool(eeg_data.get("is_dummy_data", False)),
+        )
+    if eeg_data.get("is_dummy_data"):
+        record_fallback("dummy_data")
+    if signal_filters.PREPROCESS_ENABLED:
+        with span("filter") as stage:
+            eeg_data = signal_filters.preprocess_signal(eeg_data)
+            stage.set(
+                original_sampling_rate=eeg_data["preprocessing"]["original_sampling_rate"],
+                sampling_rate=eeg_data["sampling_rate"],
+            )
+    return eeg_data
+
+
+def build_waveform(eeg_data, key):
+    """Store the viewer's min/max pyramid; a failure here never fails classification"""
+    with span("waveform_pyramid") as stage:
+        try:
+            meta = waveform.build_pyramid(eeg_data, key)
+            stage.set(levels=len(meta["levels"]))
+        except Exception as e:
+            logger.warning(f"Could not build waveform pyramid for {key}: {str(e)}")
+            stage.set(error=str(e))
+
+
+def classify_file(file_path, waveform_key=None):
+    """
+    Decode and classify an EEG file
+
+    Args:
+        file_path: Path or blob:// URI of the uploaded recording
+        waveform_key: The eeg_id; when given, the waveform pyramid is built under it
+            and shadow predictions are stored against it
+
+    Returns:
+        (classification, confidence, seizure_intervals)
+    """
+    eeg_data = decode_file(file_path)
+    if waveform_key:
+        build_waveform(eeg_data, waveform_key)
+    with span("classify"):
+        return gnn_classifier.classify_eeg(eeg_data, eeg_id=waveform_key)
+
+
+def generate_report(eeg_case):
+    """Generate the report text for a classified case"""
+    backend = "local" if llm_report_generator.USE_LOCAL_MODEL else "api"
+    with span("llm_generate", backend=backend) as stage:
+        start = time.perf_counter()
+        report_text = llm_report_generator.generate_report(eeg_case)
+        record_llm_throughput("report", report_text, time.perf_counter() - start)
+        stage.set(report_chars=len(report_text or ""))
+    return report_text
+
+
+def render_pdf(report_text, eeg_case=None, generated_at=None):
+    """Render a report to PDF bytes"""
+    with span("pdf_render") as stage:
+        pdf_bytes = pdf_renderer.render_report_pdf(report_text, eeg_case, generated_at)
+        stage.set(pdf_bytes=len(pdf_bytes))
+    return pdf_bytes
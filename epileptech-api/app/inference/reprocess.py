@@ -0,0 +1,227 @@
+"""
+Bulk re-classification of the stored EEG archive
+
+POST /api/eeg/process/<eeg_id> handles one record and skips records that are
+already completed. After a model or feature change, this command re-runs
+every stored recording. It fans the work out over a process pool and stores
+the results per run in eeg_reprocessing_results. It never writes to
+eeg_reports, so the results users see are left alone until a run is reviewed.
+
+Each result is keyed by (run_id, eeg_id) and records the model version and
+the previous classification (with a "changed" flag). The reprocessing_runs
+document records the signal/feature settings the run used. Progress is checkpointed through those documents: run
+the same --run-id again after an interruption, and records with a completed
+result are skipped (failed ones are retried).
+
+Usage (from the epileptech-api directory):
+    python -m app.inference.reprocess --concurrency 4
+    python -m app.inference.reprocess --run-id 20250101-120000 --concurrency 4   # resume
+    python -m app.inference.reprocess --status completed --limit 100 --report
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from app.database.database import (
+    eeg_reports_collection, reprocessing_results_collection, reprocessing_runs_collection,
+)
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+REPROCESS_CONCURRENCY = int(os.environ.get("REPROCESS_CONCURRENCY", str(max(1, (os.cpu_count() or 2) // 2))))
+# Settings that change what a run produces, stored with every run
+SETTINGS_ENV_VARS = (
+    "GNN_MODEL_PATH", "GNN_BACKEND", "SIGNAL_DTYPE", "PREPROCESS_ENABLED", "CANONICAL_SFREQ",
+    "BANDPASS_LOW_HZ", "BANDPASS_HIGH_HZ", "NOTCH_HZ", "PREPROCESS_REFERENCE", "USE_LOCAL_MODEL",
+)
+
+
+def _init_worker(concurrency):
+    # Before torch/NumPy load in this worker: share the host between the pool's processes
+    from app.utils.cpu_budget import apply_process_budget
+    apply_process_budget(workers=concurrency)
+
+
+def reprocess_one(task):
+    """
+    Classify one stored recording (and optionally regenerate its report) in a pool worker
+
+    Args:
+        task: {"eeg_id", "file_path", "eeg_case" (only with reports)}
+
+    Returns:
+        result: Fields of the eeg_reprocessing_results document
+    """
+    from app.inference import pipeline
+    start = time.perf_counter()
+    try:
+        classification, confidence, seizure_intervals = pipeline.classify_file(task["file_path"])
+        result = {
+            "status": "completed",
+            "classification": classification,
+            "confidence": confidence,
+            "seizure_intervals": seizure_intervals,
+            "model_version": pipeline.gnn_classifier.model_version(),
+        }
+        if task.get("eeg_case") is not None:
+            eeg_case = dict(task["eeg_case"], classification=classification, confidence=confidence,
+                            seizure_intervals=seizure_intervals)
+            result["report"] = pipeline.generate_report(eeg_case)
+    except Exception as e:
+        logger.error(f"Error reprocessing EEG {task['eeg_id']}: {str(e)}")
+        result = {"status": "failed", "error": str(e)}
+    result["duration_s"] = time.perf_counter() - start
+    return result
+
+
+def _completed_ids(run_id):
+    return set(reprocessing_results_collection.distinct("eeg_id", {"run_id": run_id, "status": "completed"}))
+
+
+def _tasks(query, skip_ids, limit, with_report):
+    """Yield (task, previous result) for every record still to do, streaming from the cursor"""
+    from app.models.llm_report_generator import eeg_case_from_record
+    projection = None if with_report else {"eeg_id": 1, "file_path": 1, "result": 1, "confidence": 1}
+    cursor = eeg_reports_collection.find(query, projection, no_cursor_timeout=True).sort("_id", 1)
+    yielded = 0
+    try:
+        for record in cursor:
+            if record["eeg_id"] in skip_ids:
+                continue
+            if limit and yielded >= limit:
+                break
+            yielded += 1
+            task = {"eeg_id": record["eeg_id"], "file_path": record["file_path"]}
+            if with_report:
+                task["eeg_case"] = eeg_case_from_record(record)
+            yield task, {"result": record.get("result"), "confidence": record.get("confidence")}
+    finally:
+        cursor.close()
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run(run_id, concurrency=REPROCESS_CONCURRENCY, query=None, limit=None, with_report=False, progress_every=5.0):
+    """
+    Reprocess the records matching `query` under `run_id`, resuming if the run exists
+
+    Returns:
+        counts: {"completed", "failed", "changed", "skipped"}
+    """
+    query = dict(query or {})
+    query.setdefault("file_path", {"$exists": True})
+    skip_ids = _completed_ids(run_id)
+    remaining = eeg_reports_collection.count_documents({"$and": [query, {"eeg_id": {"$nin": list(skip_ids)}}]})
+    if limit:
+        remaining = min(remaining, limit)
+    settings = {name: os.environ.get(name) for name in SETTINGS_ENV_VARS}
+
+    reprocessing_runs_collection.update_one(
+        {"_id": run_id},
+        {
+            "$set": {"status": "running", "resumed_at": datetime.now(), "concurrency": concurrency,
+                     "settings": settings, "with_report": with_report},
+            "$setOnInsert": {"started_at": datetime.now()},
+        },
+        upsert=True,
+    )
+    logger.info(f"Run {run_id}: {remaining} records to process, {len(skip_ids)} already done, "
+                f"{concurrency} workers")
+
+    counts = {"completed": 0, "failed": 0, "changed": 0, "skipped": len(skip_ids)}
+    start = last_report = time.perf_counter()
+    status = "interrupted"
+    # spawn: workers start clean instead of inheriting the parent's MongoDB client threads
+    executor = ProcessPoolExecutor(max_workers=concurrency, mp_context=multiprocessing.get_context("spawn"),
+                                   initializer=_init_worker, initargs=(concurrency,))
+    tasks = _tasks(query, skip_ids, limit, with_report)
+    pending = {}
+    try:
+        while True:
+            # Keep the pool busy without queueing the whole archive in memory
+            while len(pending) < 2 * concurrency:
+                item = next(tasks, None)
+                if item is None:
+                    break
+                task, previous = item
+                pending[executor.submit(reprocess_one, task)] = (task["eeg_id"], previous)
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                eeg_id, previous = pending.pop(future)
+                result = future.result()
+                document = dict(result, run_id=run_id, eeg_id=eeg_id, previous=previous, processed_at=datetime.now())
+                if result["status"] == "completed":
+                    document["changed"] = result["classification"] != previous["result"]
+                    counts["changed"] += int(document["changed"])
+                counts[result["status"]] += 1
+                reprocessing_results_collection.update_one(
+                    {"run_id": run_id, "eeg_id": eeg_id}, {"$set": document}, upsert=True
+                )
+
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                last_report = now
+                processed = counts["completed"] + counts["failed"]
+                rate = processed / (now - start)
+                eta = _format_eta((remaining - processed) / rate) if rate else "?"
+                print(f"[{run_id}] {processed}/{remaining}  {rate:.2f} rec/s  ETA {eta}  "
+                      f"failed {counts['failed']}  changed {counts['changed']}", flush=True)
+        status = "finished"
+    finally:
+        if status != "finished":
+            for future in pending:
+                future.cancel()
+        executor.shutdown(wait=status == "finished", cancel_futures=True)
+        elapsed = time.perf_counter() - start
+        reprocessing_runs_collection.update_one(
+            {"_id": run_id},
+            {"$set": {"status": status, "updated_at": datetime.now(), "elapsed_s": elapsed},
+             "$inc": {f"counts.{key}": value for key, value in counts.items() if key != "skipped"}},
+        )
+        processed = counts["completed"] + counts["failed"]
+        print(f"[{run_id}] {status}: {processed} processed in {_format_eta(elapsed)} "
+              f"({processed / elapsed if elapsed else 0:.2f} rec/s); completed {counts['completed']}, "
+              f"failed {counts['failed']}, changed {counts['changed']}, skipped {counts['skipped']}", flush=True)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-classify stored EEG recordings into a versioned run")
+    parser.add_argument("--run-id", default=datetime.now().strftime("%Y%m%d-%H%M%S"),
+                        help="Results are stored under this id; reuse it to resume")
+    parser.add_argument("--concurrency", type=int, default=REPROCESS_CONCURRENCY, help="Worker processes")
+    parser.add_argument("--status", help="Only records with this status, e.g. completed")
+    parser.add_argument("--eeg-id", nargs="+", help="Only these records")
+    parser.add_argument("--limit", type=int, help="Process at most this many records")
+    parser.add_argument("--report", action="store_true", help="Also regenerate the report text")
+    parser.add_argument("--progress-every", type=float, default=5.0, help="Seconds between progress lines")
+    args = parser.parse_args()
+
+    query = {}
+    if args.status:
+        query["status"] = args.status
+    if args.eeg_id:
+        query["eeg_id"] = {"$in": args.eeg_id}
+    try:
+        counts = run(args.run_id, max(1, args.concurrency), query, args.limit, args.report, args.progress_every)
+    except KeyboardInterrupt:
+        print(f"Interrupted; resume with --run-id {args.run_id}", file=sys.stderr)
+        return 130
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
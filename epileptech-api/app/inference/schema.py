@@ -0,0 +1,76 @@
+"""
+Request/response schema shared by the API tier and the inference service
+
+Every message is a JSON object carrying a "version" field. The major version
+must match exactly; new optional fields may be added without bumping it.
+"""
+import base64
+
+SCHEMA_VERSION = 1
+
+# Operations exposed by the inference service
+OP_CLASSIFY = "classify"
+OP_REPORT = "report"
+OP_PDF = "pdf"
+
+OPERATIONS = {
+    # op: (required request fields, response fields)
+    OP_CLASSIFY: (("file_path",), ("classification", "confidence", "seizure_intervals")),
+    OP_REPORT: (("eeg_case",), ("report_text",)),
+    OP_PDF: (("report_text",), ("pdf_base64",)),
+}
+
+
+class SchemaError(ValueError):
+    """Raised when a message does not match the inference schema"""
+
+
+def make_message(**fields):
+    """Build a versioned message"""
+    return {"version": SCHEMA_VERSION, **fields}
+
+
+def _check_version(message):
+    if not isinstance(message, dict):
+        raise SchemaError("Message must be a JSON object")
+    version = message.get("version")
+    if version != SCHEMA_VERSION:
+        raise SchemaError(f"Unsupported schema version {version!r}, expected {SCHEMA_VERSION}")
+
+
+def validate_request(op, message):
+    """
+    Validate an incoming request for an operation
+
+    Raises:
+        SchemaError: If the operation is unknown or fields are missing
+    """
+    if op not in OPERATIONS:
+        raise SchemaError(f"Unknown operation {op!r}")
+    _check_version(message)
+    missing = [field for field in OPERATIONS[op][0] if field not in message]
+    if missing:
+        raise SchemaError(f"Missing fields for {op}: {', '.join(missing)}")
+
+
+def validate_response(op, message):
+    """
+    Validate a response returned by the inference service
+
+    Raises:
+        SchemaError: If the version is wrong or fields are missing
+    """
+    _check_version(message)
+    if message.get("error"):
+        return
+    missing = [field for field in OPERATIONS[op][1] if field not in message]
+    if missing:
+        raise SchemaError(f"Missing fields in {op} response: {', '.join(missing)}")
+
+
+def encode_pdf(pdf_bytes):
+    return base64.b64encode(pdf_bytes).decode("ascii")
+
+
+def decode_pdf(pdf_base64):
+    return base64.b64decode(pdf_base64)
@@ -0,0 +1,158 @@
+"""
+Inference service: owns EEG classification, report generation and PDF rendering
+
+Runs as its own process so API workers never load torch or the LLM. Start it with:
+    python -m app.inference.server --host 127.0.0.1 --port 9100
+
+Endpoints (all JSON, see app.inference.schema):
+    GET  /health
+    GET  /metrics                                              -> Prometheus text format
+    POST /v1/classify   {"file_path", "waveform_key"?}         -> classification results
+    POST /v1/report     {"eeg_case"}                           -> {"report_text"}
+    POST /v1/pdf        {"report_text", "eeg_case", "generated_at"} -> {"pdf_base64"}
+"""
+import os
+import json
+import logging
+import argparse
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.inference.schema import (
+    OP_CLASSIFY, OP_PDF, OP_REPORT, SCHEMA_VERSION, SchemaError,
+    encode_pdf, make_message, validate_request,
+)
+from app.inference import pipeline
+from app.utils.cpu_budget import apply_process_budget
+from app.utils.lazy_loader import warm_up
+from app.utils.metrics import CONTENT_TYPE, registry
+from app.utils.tracing import start_trace
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INFERENCE_HOST = os.environ.get("INFERENCE_HOST", "127.0.0.1")
+INFERENCE_PORT = int(os.environ.get("INFERENCE_PORT", "9100"))
+# Number of classifications/report generations allowed to run at once
+INFERENCE_MAX_CONCURRENCY = int(os.environ.get("INFERENCE_MAX_CONCURRENCY", "2"))
+
+_compute_slots = threading.BoundedSemaphore(INFERENCE_MAX_CONCURRENCY)
+
+
+def handle_classify(message):
+    with _compute_slots:
+        classification, confidence, seizure_intervals = pipeline.classify_file(
+            message["file_path"], message.get("waveform_key")
+        )
+    return {
+        "classification": classification,
+        "confidence": confidence,
+        "seizure_intervals": seizure_intervals,
+    }
+
+
+def handle_report(message):
+    with _compute_slots:
+        report_text = pipeline.generate_report(message["eeg_case"])
+    return {"report_text": report_text}
+
+
+def handle_pdf(message):
+    generated_at = message.get("generated_at")
+    if generated_at:
+        generated_at = datetime.datetime.fromisoformat(generated_at)
+    pdf_bytes = pipeline.render_pdf(message["report_text"], message.get("eeg_case"), generated_at)
+    return {"pdf_base64": encode_pdf(pdf_bytes)}
+
+
+HANDLERS = {
+    OP_CLASSIFY: handle_classify,
+    OP_REPORT: handle_report,
+    OP_PDF: handle_pdf,
+}
+
+
+class InferenceRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            # Same answer as the in-process backend, so /ready fails on a degraded model either way
+            self._send_json(200, make_message(**pipeline.model_health()))
+        elif self.path == "/metrics":
+            body = registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, make_message(error="Not found"))
+
+    def do_POST(self):
+        prefix = f"/v{SCHEMA_VERSION}/"
+        op = self.path[len(prefix):] if self.path.startswith(prefix) else None
+        handler = HANDLERS.get(op)
+        if handler is None:
+            self._send_json(404, make_message(error=f"Unknown endpoint {self.path}"))
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            message = json.loads(self.rfile.read(length) or b"{}")
+            validate_request(op, message)
+        except (ValueError, SchemaError) as e:
+            self._send_json(400, make_message(error=str(e)))
+            return
+
+        try:
+            # Stage timings go back to the caller, which merges them into its own trace
+            with start_trace(f"inference_{op}") as trace:
+                result = handler(message)
+            self._send_json(200, make_message(stages=trace.stages(), **result))
+        except Exception as e:
+            logger.error(f"Error handling inference {op} request: {str(e)}", exc_info=True)
+            self._send_json(500, make_message(error=str(e)))
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def serve(host=INFERENCE_HOST, port=INFERENCE_PORT, preload=True):
+    """Run the inference service until interrupted"""
+    if preload:
+        warm_up()
+    server = ThreadingHTTPServer((host, port), InferenceRequestHandler)
+    server.daemon_threads = True
+    logger.info(f"Inference service listening on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EpilepTech inference service")
+    parser.add_argument("--host", default=INFERENCE_HOST)
+    parser.add_argument("--port", type=int, default=INFERENCE_PORT)
+    parser.add_argument("--no-preload", action="store_true", help="Skip model warm-up at startup")
+    args = parser.parse_args()
+    # Before warm-up imports torch and NumPy
+    apply_process_budget(concurrent_jobs=INFERENCE_MAX_CONCURRENCY)
+    serve(args.host, args.port, preload=not args.no_preload)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,15 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 from .routers import eeg, auth, reports, chatbot
-from .database.database import init_db
+from .database.database import connection_manager
+from .inference.client import inference
+from .utils.lazy_loader import PRELOAD_INFERENCE, warm_up
+from .utils.metrics import init_app as init_metrics, register_cache
+from .utils.chat_cache import chat_cache
+from .utils.pdf_renderer import pdf_cache
+from .utils.profiling import start_continuous_profiler
+from .utils.cpu_budget import ensure_process_budget
+from .utils.executors import CPU_WORKERS
 
 # Load environment variables
 load_dotenv()
@@ -18,14 +26,50 @@ app.register_blueprint(eeg.router)
 app.register_blueprint(reports.router)
 app.register_blueprint(chatbot.router)
 
+# Request latency, in-flight requests and the Prometheus scrape endpoint at /metrics
+init_metrics(app)
+register_cache("chat", chat_cache.stats)
+register_cache("pdf", pdf_cache.stats)
+
 @app.route('/')
 def root():
     return jsonify({"message": "Welcome to EpilepTech API"})
 
-# Initialize database on startup
-# Replace deprecated before_first_request with with_appcontext
-with app.app_context():
-    init_db()
+@app.route('/ready')
+def readiness():
+    """
+    Readiness probe for the load balancer
+    
+    Reports MongoDB reachability and model availability. Returns 503 while the
+    database or the inference service cannot be reached, or while the model
+    backend reports itself degraded (e.g. no weights file). Index creation is not
+    done here or at import; run `python -m app.database.migrate` once per deploy.
+    """
+    db_ok, db_error = connection_manager.ping(timeout_ms=1000)
+    
+    try:
+        model = inference.health()
+        model_ok = model.get("status") == "ok"
+    except Exception as e:
+        model = {"status": "unavailable", "error": str(e)}
+        model_ok = False
+    
+    ready = db_ok and model_ok
+    return jsonify({
+        "ready": ready,
+        "database": {"status": "ok" if db_ok else "unavailable", "error": db_error},
+        "model": model
+    }), 200 if ready else 503
+
+# Always-on low-frequency sampling when PROFILE_SAMPLE_HZ is set
+start_continuous_profiler()
+
+# Thread budget for torch/BLAS; serve.py applies it before NumPy loads, this covers other entry points
+ensure_process_budget(concurrent_jobs=CPU_WORKERS)
+
+# Inference workers can opt in to importing torch/MNE and loading the model at boot
+if PRELOAD_INFERENCE:
+    warm_up()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=9000, debug=True)
@@ -4,9 +4,15 @@ import torch.nn.functional as F
 import numpy as np
 import logging
 import os
-import matplotlib.pyplot as plt
 from torch_geometric.data import Data
 from torch_geometric.nn import GCNConv, GATConv, BatchNorm
+from app.utils.tracing import span
+from app.utils.metrics import model_load_seconds, model_loads_total, record_fallback
+from app.utils.signal_dtype import channel, channel_blocks, compute_dtype
+from app.models.gnn_export import load_backend
+from app.utils.cpu_budget import configure_torch
+from app.utils.profiling import native_lock
+from app.models.shadow import shadow_runner
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -72,16 +78,19 @@ class GNNModel(nn.Module):
         return F.log_softmax(x, dim=1)  # Log Softmax for classification
 
 # Load the trained model
-def load_model():
+def load_model(model_path=None):
     """
     Load the trained GNN model
     
+    Args:
+        model_path: Weights file, defaults to GNN_MODEL_PATH
+    
     Returns:
         model: Loaded PyTorch model
     """
     try:
         # Path to your saved model
-        model_path = os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
+        model_path = model_path or os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
         
         # Check if model file exists
         if not os.path.exists(model_path):
@@ -120,6 +129,36 @@ def load_model():
         model = GNNModel(input_dim=22, num_classes=3)
         return model
 
+_model = None
+_model_lock = native_lock()
+
+def model_version(model_path=None):
+    """Identify the loaded weights for tracing, e.g. "gnn_model_pnes.pth@1712345678" """
+    model_path = model_path or os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
+    if not os.path.exists(model_path):
+        return "untrained"
+    return f"{os.path.basename(model_path)}@{int(os.path.getmtime(model_path))}"
+
+def get_model():
+    """
+    Return the process-wide GNN model, loading it on first use
+    
+    With GNN_BACKEND set to torchscript or onnx the compiled artifact exported
+    next to the weights is served instead of the eager module.
+    
+    Returns:
+        model: Loaded model in evaluation mode, called with a graph Data object
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                configure_torch()
+                with model_load_seconds.time():
+                    _model = load_backend(load_model().eval())
+                model_loads_total.inc(model_version=model_version())
+    return _model
+
 def preprocess_eeg_to_graph(eeg_data):
     """
     Convert EEG data to a graph representation for the GNN
@@ -132,13 +171,12 @@ def preprocess_eeg_to_graph(eeg_data):
     """
     try:
         # Extract the raw data matrix
-        if isinstance(eeg_data, dict) and "data" in eeg_data:
-            raw_data = eeg_data["data"]
-        else:
+        if not (isinstance(eeg_data, dict) and "data" in eeg_data):
             # Handle case where we don't have proper data
             logger.warning("Invalid EEG data format, using dummy data")
             # Create dummy data
-            raw_data = np.random.randn(22, 1000)  # 22 channels, 1000 time points
+            eeg_data = {"data": np.random.randn(22, 1000).astype(np.float32)}  # 22 channels, 1000 time points
+        raw_data = eeg_data["data"]
         
         # Get number of channels
         n_channels = raw_data.shape[0]
@@ -147,18 +185,24 @@ def preprocess_eeg_to_graph(eeg_data):
         # Here we use mean, std, kurtosis, etc. for each channel
         node_features = []
         for i in range(n_channels):
-            channel_data = raw_data[i, :]
+            # A view of the stored row (or one float32 row for int16 storage)
+            channel_data = channel(eeg_data, i)
+            
+            # Calculate features; sums accumulate in float64 even for float32 signals
+            mean = float(np.mean(channel_data, dtype=np.float64))
+            max_val = float(np.max(channel_data))
+            min_val = float(np.min(channel_data))
             
-            # Calculate features
-            mean = np.mean(channel_data)
-            std = np.std(channel_data)
-            max_val = np.max(channel_data)
-            min_val = np.min(channel_data)
+            # One centered copy and its square are reused for all moments
+            centered = channel_data - channel_data.dtype.type(mean)
+            squared = centered * centered
+            std = float(np.sqrt(np.mean(squared, dtype=np.float64)))
             
             # Calculate kurtosis and skewness safely
             if std != 0:
-                kurtosis = np.mean((channel_data - mean)**4) / (std**4) 
-                skewness = np.mean((channel_data - mean)**3) / (std**3)
+                kurtosis = float(np.mean(squared * squared, dtype=np.float64)) / (std**4)
+                squared *= centered
+                skewness = float(np.mean(squared, dtype=np.float64)) / (std**3)
             else:
                 kurtosis = 0
                 skewness = 0
@@ -235,11 +279,17 @@ def detect_seizure_intervals(eeg_data):
         # For demonstration, we'll use a simple thresholding approach
         # In a real implementation, you would use a more sophisticated method
         
-        # Calculate signal power across all channels
-        signal_power = np.mean(raw_data**2, axis=0)
+        # Calculate signal power across all channels, a few channels at a time,
+        # instead of squaring the whole recording into a second full-size array
+        signal_power = np.zeros(raw_data.shape[1], dtype=compute_dtype(eeg_data.get("dtype")))
+        for _, block in channel_blocks(eeg_data):
+            signal_power += np.einsum("ij,ij->j", block, block)
+        signal_power /= raw_data.shape[0]
         
-        # Normalize the power
-        normalized_power = (signal_power - np.mean(signal_power)) / np.std(signal_power)
+        # Normalize the power in place
+        signal_power -= np.mean(signal_power, dtype=np.float64)
+        signal_power /= np.std(signal_power, dtype=np.float64)
+        normalized_power = signal_power
         
         # Define threshold for seizure detection
         threshold = 2.0  # Adjust based on your data
@@ -300,12 +350,16 @@ def format_time(seconds):
     remaining_seconds = int(seconds % 60)
     return f"{minutes:02d}:{remaining_seconds:02d}"
 
-def classify_eeg(eeg_data):
+def classify_eeg(eeg_data, eeg_id=None):
     """
     Classify EEG data using the GNN model
     
+    When SHADOW_MODELS is set, the graph and the primary probabilities are also
+    queued for the shadow models (app.models.shadow) without waiting for them.
+    
     Args:
         eeg_data: Dictionary containing processed EEG data
+        eeg_id: Record the recording belongs to, stored with shadow predictions
         
     Returns:
         result: Classification result ("epileptic", "non-epileptic", or "psychogenic")
@@ -313,20 +367,27 @@ def classify_eeg(eeg_data):
         seizure_intervals: List of detected seizure intervals
     """
     try:
-        # Load model
-        model = load_model()
+        # Load model (cached after the first request)
+        with span("model_load", model_version=model_version()):
+            model = get_model()
         
         # Preprocess EEG data to graph representation
-        graph_data = preprocess_eeg_to_graph(eeg_data)
+        with span("preprocess_eeg_to_graph") as stage:
+            graph_data = preprocess_eeg_to_graph(eeg_data)
+            stage.set(n_nodes=int(graph_data.x.shape[0]), n_edges=int(graph_data.edge_index.shape[1]))
         
         # Make prediction
-        with torch.no_grad():
+        backend = getattr(model, "backend", "eager")
+        with span("model_forward", model_version=model_version(), backend=backend), torch.no_grad():
             output = model(graph_data)
             probabilities = torch.exp(output).mean(dim=0)  # Average across nodes if needed
         
         # Convert to numpy array
         probs = probabilities.cpu().numpy()
         
+        # Shadow models run on the same graph in the background
+        shadow_runner.submit(graph_data, probs, eeg_id=eeg_id, model_version=model_version())
+        
         # Get predicted class
         pred_class = np.argmax(probs)
         
@@ -342,7 +403,11 @@ def classify_eeg(eeg_data):
         }
         
         # Detect seizure intervals (only meaningful for epileptic class)
-        seizure_intervals = detect_seizure_intervals(eeg_data) if result == "epileptic" else []
+        seizure_intervals = []
+        if result == "epileptic":
+            with span("detect_seizure_intervals") as stage:
+                seizure_intervals = detect_seizure_intervals(eeg_data)
+                stage.set(n_intervals=len(seizure_intervals))
         
         logger.info(f"EEG classified as {result} with confidence scores: {confidence}")
         return result, confidence, seizure_intervals
@@ -351,5 +416,8 @@ def classify_eeg(eeg_data):
         logger.error(f"Error classifying EEG: {str(e)}")
         
         # Return fallback results
+        with span("classify_fallback", error=str(e)):
+            pass
+        record_fallback("classify_fallback")
         fallback_confidence = {"epileptic": 10.0, "non-epileptic": 80.0, "psychogenic": 10.0}
         return "non-epileptic", fallback_confidence, []
\ No newline at end of file
@@ -0,0 +1,141 @@
+"""
+Dense-adjacency execution of GNNModel for small, fully connected EEG graphs
+
+A 22-channel recording becomes a 22-node graph with 462 edges. The sparse
+GCNConv/GATConv path gathers and scatters along that edge list in every layer,
+and for graphs this small the indexing costs more than the arithmetic.
+DenseGNN runs the same weights as batched matrix products instead:
+
+    GCN  D^-1/2 (A + I) D^-1/2 @ (X W)
+    GAT  masked softmax over an (N, N) score matrix per head, then alpha @ H
+
+Inputs are (B, N, F) node features and an (N, N) or (B, N, N) adjacency, so
+B windows or recordings with the same montage run in one pass. Outputs match
+GNNModel up to float rounding for graphs without duplicate edges.
+
+GNN_BACKEND=dense serves it through get_model().
+"""
+import logging
+
+import torch
+import torch.nn.functional as F
+
+from app.models.gnn_export import ExportableGNN
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def dense_adjacency(edge_index, num_nodes):
+    """
+    (N, N) adjacency with adj[i, j] = 1 for an edge j -> i, self-loops included
+
+    Args:
+        edge_index: (2, E) source/target indices as built by preprocess_eeg_to_graph
+        num_nodes: N
+
+    Returns:
+        adj: float32 tensor
+    """
+    adj = torch.zeros(num_nodes, num_nodes)
+    adj[edge_index[1], edge_index[0]] = 1.0
+    adj.fill_diagonal_(1.0)
+    return adj
+
+
+def normalize_adjacency(adj):
+    """Symmetric GCN normalisation D^-1/2 A D^-1/2 (adj already has self-loops)"""
+    inv_sqrt = adj.sum(dim=-1).pow(-0.5)
+    return inv_sqrt.unsqueeze(-1) * adj * inv_sqrt.unsqueeze(-2)
+
+
+def _dense_gcn(x, adj_norm, weight, bias):
+    return torch.matmul(adj_norm, torch.matmul(x, weight.t())) + bias
+
+
+def _dense_gat(x, mask, weight, att_src, att_dst, bias, heads):
+    h = torch.matmul(x, weight.t()).view(x.shape[0], x.shape[1], heads, -1)
+    return dense_attention(h, mask, att_src, att_dst, bias)
+
+
+def dense_attention(h, mask, att_src, att_dst, bias):
+    """GAT aggregation of projected features h (B, N, heads, C), averaged over heads"""
+    # (B, H, N) attention logits of every node as target and as source
+    alpha_dst = (h * att_dst).sum(-1).transpose(1, 2)
+    alpha_src = (h * att_src).sum(-1).transpose(1, 2)
+    scores = F.leaky_relu(alpha_dst.unsqueeze(-1) + alpha_src.unsqueeze(-2), 0.2)
+    scores = scores.masked_fill(~mask.unsqueeze(1), float("-inf"))
+    out = torch.matmul(scores.softmax(dim=-1), h.transpose(1, 2))
+    return out.mean(dim=1) + bias
+
+
+class DenseGNN(ExportableGNN):
+    """
+    GNNModel weights executed with dense (B, N, N) adjacency matmuls
+
+    forward(x, adj):
+        x: (B, N, F) or (N, F) node features
+        adj: (N, N) or (B, N, N) adjacency from dense_adjacency()
+
+    Returns (B, N, num_classes) log-probabilities.
+    """
+
+    def _dense_bn(self, x, index):
+        flat = x.reshape(-1, x.shape[-1])
+        flat = self._bn(
+            flat,
+            getattr(self, f"bn{index}_mean"),
+            getattr(self, f"bn{index}_var"),
+            getattr(self, f"bn{index}_weight"),
+            getattr(self, f"bn{index}_bias"),
+        )
+        return flat.view_as(x)
+
+    def forward(self, x, adj):
+        x = x.float()
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        if adj.dim() == 2:
+            adj = adj.unsqueeze(0)
+        adj_norm = normalize_adjacency(adj)
+        mask = adj > 0
+
+        x = self._dense_bn(_dense_gcn(x, adj_norm, self.conv1_weight, self.conv1_bias), 1)
+        x = _dense_gat(x, mask, self.conv2_weight, self.conv2_att_src, self.conv2_att_dst, self.conv2_bias, self.heads)
+        x = self._dense_bn(x, 2)
+        x = self._dense_bn(_dense_gcn(x, adj_norm, self.conv3_weight, self.conv3_bias), 3)
+        x = self._dense_bn(_dense_gcn(x, adj_norm, self.conv4_weight, self.conv4_bias), 4)
+        x = self._dense_bn(_dense_gcn(x, adj_norm, self.conv5_weight, self.conv5_bias), 5)
+
+        x = F.leaky_relu(self.fc1(x), 0.01)
+        x = self.fc2(x)
+        return F.log_softmax(x, dim=-1)
+
+
+class DenseGNNRunner:
+    """DenseGNN behind the eager model's call signature, plus a batched entry point"""
+    backend = "dense"
+
+    def __init__(self, model):
+        self.module = DenseGNN(model).eval()
+
+    def __call__(self, graph_data):
+        adj = dense_adjacency(graph_data.edge_index, graph_data.x.shape[0])
+        return self.module(graph_data.x, adj)[0]
+
+    def forward_batch(self, x, edge_index):
+        """
+        Run B graphs sharing one montage in a single pass
+
+        Args:
+            x: (B, N, F) node features
+            edge_index: (2, E) edges shared by all B graphs
+
+        Returns:
+            log_probs: (B, N, num_classes)
+        """
+        return self.module(x, dense_adjacency(edge_index, x.shape[1]))
+
+    def eval(self):
+        return self
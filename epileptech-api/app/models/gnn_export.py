@@ -0,0 +1,352 @@
+"""
+Ahead-of-time compiled GNN backends (TorchScript and ONNX Runtime)
+
+GNNModel runs torch_geometric message passing in eager mode. ExportableGNN
+computes the same network from the same weights with plain tensor ops
+(gather, scatter_add, matmul), which TorchScript can freeze and ONNX can
+export. The artifacts are written next to the weights file:
+
+    models/gnn_model_pnes.pth              eager weights (GNN_MODEL_PATH)
+    models/gnn_model_pnes.torchscript.pt   frozen TorchScript module
+    models/gnn_model_pnes.onnx             ONNX graph for onnxruntime
+
+GNN_BACKEND selects what get_model() serves: eager (default), torchscript,
+onnx, dense (app.models.gnn_dense) or int8 (app.models.gnn_quantized); the
+last two are built from the weights at load time. A missing or outdated
+artifact falls back to eager.
+
+Build and check the artifacts (from the epileptech-api directory):
+    python -m app.models.gnn_export --format torchscript onnx
+
+Every export is reloaded and compared with the eager model on random graphs;
+an artifact whose probabilities differ by more than --tolerance is deleted.
+"""
+import os
+import time
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.utils.metrics import record_fallback
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("eager", "torchscript", "onnx", "dense", "int8")
+GNN_BACKEND = os.environ.get("GNN_BACKEND", "eager").lower()
+ONNX_OPSET = int(os.environ.get("GNN_ONNX_OPSET", "17"))
+ARTIFACT_SUFFIXES = {"torchscript": ".torchscript.pt", "onnx": ".onnx"}
+PARITY_TOLERANCE = 1e-4
+
+
+def artifact_path(backend, model_path=None):
+    """Where the compiled artifact for `backend` lives, next to the weights file"""
+    model_path = model_path or os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
+    return os.path.splitext(model_path)[0] + ARTIFACT_SUFFIXES[backend]
+
+
+def fully_connected_edges(n_nodes):
+    """Edge index of a fully connected graph without self-loops, as built by preprocess_eeg_to_graph"""
+    nodes = torch.arange(n_nodes)
+    row = nodes.repeat_interleave(n_nodes)
+    col = nodes.repeat(n_nodes)
+    keep = row != col
+    return torch.stack([row[keep], col[keep]])
+
+
+def _with_self_loops(edge_index: torch.Tensor, num_nodes: int):
+    # Drop existing self-loops and add exactly one per node, as GCNConv and GATConv do
+    keep = edge_index[0] != edge_index[1]
+    loops = torch.arange(num_nodes, dtype=edge_index.dtype, device=edge_index.device)
+    row = torch.cat([edge_index[0][keep], loops])
+    col = torch.cat([edge_index[1][keep], loops])
+    return row, col
+
+
+def _scatter_sum(src: torch.Tensor, index: torch.Tensor, like: torch.Tensor) -> torch.Tensor:
+    """Add src[e] into row index[e] of a zero tensor shaped like `like`"""
+    flat = src.reshape(src.size(0), -1)
+    out = torch.zeros_like(like).reshape(like.size(0), -1)
+    out = out.scatter_add(0, index.unsqueeze(1).expand_as(flat), flat)
+    return out.reshape(like.shape)
+
+
+def _gcn(x: torch.Tensor, row: torch.Tensor, col: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor):
+    h = torch.matmul(x, weight.t())
+    degree = _scatter_sum(torch.ones_like(col, dtype=h.dtype), col, h[:, 0])
+    # Every node has its self-loop, so the degree is at least 1
+    inv_sqrt = degree.pow(-0.5)
+    norm = inv_sqrt[row] * inv_sqrt[col]
+    return _scatter_sum(h[row] * norm.unsqueeze(1), col, h) + bias
+
+
+def _gat(x: torch.Tensor, row: torch.Tensor, col: torch.Tensor, weight: torch.Tensor,
+         att_src: torch.Tensor, att_dst: torch.Tensor, bias: torch.Tensor, heads: int):
+    h = torch.matmul(x, weight.t()).view(x.size(0), heads, -1)
+    alpha_src = (h * att_src).sum(-1)
+    alpha_dst = (h * att_dst).sum(-1)
+    alpha = F.leaky_relu(alpha_src[row] + alpha_dst[col], 0.2)
+    # A per-head shift leaves every neighbourhood softmax unchanged and keeps exp() bounded
+    alpha = (alpha - alpha.max(dim=0, keepdim=True)[0]).exp()
+    alpha = alpha / (_scatter_sum(alpha, col, alpha_dst)[col] + 1e-16)
+    out = _scatter_sum(h[row] * alpha.unsqueeze(-1), col, h)
+    return out.mean(dim=1) + bias
+
+
+class ExportableGNN(nn.Module):
+    """
+    GNNModel in inference mode with the graph layers as plain tensor ops
+
+    Takes (x, edge_index) tensors instead of a torch_geometric Data object and
+    returns the same per-node log-probabilities. Dropout is omitted (eval only).
+    """
+    heads: int
+
+    def __init__(self, model):
+        super(ExportableGNN, self).__init__()
+        model = model.eval()
+        for name in ("conv1", "conv3", "conv4", "conv5"):
+            conv = getattr(model, name)
+            self.register_buffer(f"{name}_weight", conv.lin.weight.detach().clone())
+            self.register_buffer(f"{name}_bias", conv.bias.detach().clone())
+
+        gat = model.conv2
+        # torch_geometric < 2.5 names the shared projection lin_src, later versions lin
+        lin = gat.lin_src if getattr(gat, "lin_src", None) is not None else gat.lin
+        self.register_buffer("conv2_weight", lin.weight.detach().clone())
+        self.register_buffer("conv2_att_src", gat.att_src.detach().clone())
+        self.register_buffer("conv2_att_dst", gat.att_dst.detach().clone())
+        self.register_buffer("conv2_bias", gat.bias.detach().clone())
+        self.heads = gat.heads
+
+        for index in range(1, 6):
+            bn = getattr(model, f"bn{index}").module
+            self.register_buffer(f"bn{index}_mean", bn.running_mean.detach().clone())
+            self.register_buffer(f"bn{index}_var", bn.running_var.detach().clone())
+            self.register_buffer(f"bn{index}_weight", bn.weight.detach().clone())
+            self.register_buffer(f"bn{index}_bias", bn.bias.detach().clone())
+        self.bn_eps = float(model.bn1.module.eps)
+
+        self.fc1 = nn.Linear(model.fc1.in_features, model.fc1.out_features)
+        self.fc1.load_state_dict(model.fc1.state_dict())
+        self.fc2 = nn.Linear(model.fc2.in_features, model.fc2.out_features)
+        self.fc2.load_state_dict(model.fc2.state_dict())
+
+    def _bn(self, x: torch.Tensor, mean: torch.Tensor, var: torch.Tensor, weight: torch.Tensor, bias: torch.Tensor):
+        x = F.batch_norm(x, mean, var, weight, bias, False, 0.0, self.bn_eps)
+        return F.leaky_relu(x, 0.01)
+
+    def forward(self, x: torch.Tensor, edge_index: torch.Tensor):
+        x = x.float()
+        row, col = _with_self_loops(edge_index, x.size(0))
+
+        x = _gcn(x, row, col, self.conv1_weight, self.conv1_bias)
+        x = self._bn(x, self.bn1_mean, self.bn1_var, self.bn1_weight, self.bn1_bias)
+        x = _gat(x, row, col, self.conv2_weight, self.conv2_att_src, self.conv2_att_dst, self.conv2_bias, self.heads)
+        x = self._bn(x, self.bn2_mean, self.bn2_var, self.bn2_weight, self.bn2_bias)
+        x = _gcn(x, row, col, self.conv3_weight, self.conv3_bias)
+        x = self._bn(x, self.bn3_mean, self.bn3_var, self.bn3_weight, self.bn3_bias)
+        x = _gcn(x, row, col, self.conv4_weight, self.conv4_bias)
+        x = self._bn(x, self.bn4_mean, self.bn4_var, self.bn4_weight, self.bn4_bias)
+        x = _gcn(x, row, col, self.conv5_weight, self.conv5_bias)
+        x = self._bn(x, self.bn5_mean, self.bn5_var, self.bn5_weight, self.bn5_bias)
+
+        x = F.leaky_relu(self.fc1(x), 0.01)
+        x = self.fc2(x)
+        return F.log_softmax(x, dim=1)
+
+
+def example_inputs(model, n_nodes=22):
+    """Random (x, edge_index) shaped like a real recording for tracing and parity checks"""
+    return torch.randn(n_nodes, model.conv1.in_channels), fully_connected_edges(n_nodes)
+
+
+def export_torchscript(model, path):
+    """Script, freeze and save ExportableGNN(model); returns the path"""
+    scripted = torch.jit.script(ExportableGNN(model).eval())
+    frozen = torch.jit.freeze(scripted)
+    torch.jit.save(frozen, path)
+    return path
+
+
+def export_onnx(model, path, opset=ONNX_OPSET):
+    """Trace ExportableGNN(model) to ONNX with dynamic node and edge counts; returns the path"""
+    with torch.no_grad():
+        torch.onnx.export(
+            ExportableGNN(model).eval(),
+            example_inputs(model),
+            path,
+            input_names=["x", "edge_index"],
+            output_names=["log_probs"],
+            dynamic_axes={"x": {0: "nodes"}, "edge_index": {1: "edges"}, "log_probs": {0: "nodes"}},
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    return path
+
+
+EXPORTERS = {"torchscript": export_torchscript, "onnx": export_onnx}
+
+
+class TorchScriptGNN:
+    """Frozen TorchScript artifact behind the eager model's call signature"""
+    backend = "torchscript"
+
+    def __init__(self, path):
+        self.module = torch.jit.load(path, map_location="cpu")
+
+    def __call__(self, graph_data):
+        return self.module(graph_data.x, graph_data.edge_index)
+
+    def eval(self):
+        return self
+
+
+class OnnxGNN:
+    """ONNX Runtime session behind the eager model's call signature"""
+    backend = "onnx"
+
+    def __init__(self, path):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, graph_data):
+        (log_probs,) = self.session.run(None, {
+            "x": graph_data.x.float().numpy(),
+            "edge_index": graph_data.edge_index.long().numpy(),
+        })
+        return torch.from_numpy(log_probs)
+
+    def eval(self):
+        return self
+
+
+RUNNERS = {"torchscript": TorchScriptGNN, "onnx": OnnxGNN}
+
+
+def load_backend(model, backend=None, model_path=None):
+    """
+    Wrap the eager model in the compiled backend selected by GNN_BACKEND
+
+    Args:
+        model: Eager GNNModel, returned unchanged for the eager backend or on any failure
+        backend: One of BACKENDS; defaults to GNN_BACKEND
+        model_path: Weights file the artifact was exported from
+
+    Returns:
+        model: Callable taking a torch_geometric Data object and returning log-probabilities
+    """
+    backend = (backend or GNN_BACKEND).lower()
+    if backend == "eager":
+        return model
+    try:
+        if backend == "dense":
+            from app.models.gnn_dense import DenseGNNRunner
+            logger.info("Serving the GNN through the dense adjacency backend")
+            return DenseGNNRunner(model)
+        if backend == "int8":
+            from app.models.gnn_quantized import QuantizedGNNRunner
+            logger.info("Serving the GNN through the int8 dynamically quantized backend")
+            return QuantizedGNNRunner(model)
+        if backend not in RUNNERS:
+            raise ValueError(f"unknown backend, expected one of {BACKENDS}")
+        model_path = model_path or os.environ.get("GNN_MODEL_PATH", "models/trained_gnn_model.pth")
+        path = artifact_path(backend, model_path)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found, run python -m app.models.gnn_export --format {backend}")
+        if os.path.exists(model_path) and os.path.getmtime(path) < os.path.getmtime(model_path):
+            raise RuntimeError(f"{path} is older than {model_path}, export it again")
+        runner = RUNNERS[backend](path)
+        logger.info(f"Serving the GNN through the {backend} backend ({path})")
+        return runner
+    except Exception as e:
+        logger.warning(f"Could not load the {backend} GNN backend: {str(e)}; using eager PyTorch")
+        record_fallback("gnn_backend")
+        return model
+
+
+def probabilities(model, graph_data):
+    """Class probabilities as classify_eeg computes them (mean over nodes)"""
+    with torch.no_grad():
+        return torch.exp(model(graph_data)).mean(dim=0)
+
+
+def check_parity(reference, candidate, input_dim, node_counts=(19, 22, 32), seed=0):
+    """
+    Largest absolute difference between the class probabilities of two backends
+
+    Args:
+        reference, candidate: Callables taking a torch_geometric Data object
+        input_dim: Node feature size
+        node_counts: Graph sizes to compare on (the export must handle all of them)
+
+    Returns:
+        max_abs_diff: float
+    """
+    from torch_geometric.data import Data
+    generator = torch.Generator().manual_seed(seed)
+    worst = 0.0
+    for n_nodes in node_counts:
+        graph = Data(x=torch.randn(n_nodes, input_dim, generator=generator), edge_index=fully_connected_edges(n_nodes))
+        expected = probabilities(reference, graph)
+        actual = probabilities(candidate, graph)
+        worst = max(worst, float((expected - actual).abs().max()))
+    return worst
+
+
+def export(model, backend, model_path=None, tolerance=PARITY_TOLERANCE):
+    """
+    Export one backend next to the weights file and verify it against the eager model
+
+    Returns:
+        result: Dictionary with the artifact path, export time and parity; the artifact
+        is removed again when the parity check fails
+    """
+    path = artifact_path(backend, model_path)
+    start = time.perf_counter()
+    EXPORTERS[backend](model, path)
+    result = {"backend": backend, "path": path, "export_s": time.perf_counter() - start}
+    diff = check_parity(model, RUNNERS[backend](path), model.conv1.in_channels)
+    result.update(max_abs_diff=diff, passed=diff <= tolerance)
+    if not result["passed"]:
+        os.remove(path)
+        logger.error(f"{backend} export differs from eager by {diff:.2e} (> {tolerance:.0e}), removed {path}")
+    return result
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Export the GNN to TorchScript and/or ONNX next to its weights")
+    parser.add_argument("--format", nargs="+", default=["torchscript", "onnx"], choices=sorted(EXPORTERS))
+    parser.add_argument("--model-path", help="Weights file, defaults to GNN_MODEL_PATH")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE,
+                        help="Largest allowed probability difference from eager")
+    args = parser.parse_args()
+
+    if args.model_path:
+        os.environ["GNN_MODEL_PATH"] = args.model_path
+    from app.models.gnn_classifier import load_model
+    model = load_model().eval()
+
+    failed = False
+    for backend in args.format:
+        try:
+            result = export(model, backend, args.model_path, args.tolerance)
+        except Exception as e:
+            print(f"{backend:<12} export failed: {type(e).__name__}: {e}")
+            failed = True
+            continue
+        status = "ok" if result["passed"] else "PARITY FAILED"
+        print(f"{backend:<12} {status:<14} max |dp| {result['max_abs_diff']:.2e}  "
+              f"{result['export_s']:.1f}s  {result['path']}")
+        failed = failed or not result["passed"]
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
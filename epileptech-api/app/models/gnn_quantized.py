@@ -0,0 +1,182 @@
+"""
+Dynamic int8 quantization of the GNN classifier for CPU serving
+
+FoldedGNN is the dense-adjacency network of app.models.gnn_dense with every
+BatchNorm folded into the layer before it at load time. Each BatchNorm runs in
+eval mode, so it is a per-channel affine map y = k * x + c. That map is moved
+into the layer's projection matrix and bias:
+
+    GCN  A_norm @ (X W^T) + b  ->  A_norm @ (X (k W)^T) + (k (b - mean) + beta)
+    GAT  the projection is scaled the same way and att_src / att_dst are divided
+         by k, so the attention logits do not change
+
+Every projection (the GCN/GAT weight matrices and both fully connected layers)
+is an nn.Linear. torch.ao.quantization.quantize_dynamic then stores them as
+int8 and quantizes activations on the fly; attention and aggregation stay in
+float32.
+
+GNN_BACKEND=int8 serves it through get_model(). drift_report() compares it with
+the float model; benchmarks/gnn_quantization.py runs that report and measures
+latency and weight size.
+"""
+import io
+import logging
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from app.models.gnn_export import ExportableGNN
+from app.models.gnn_dense import DenseGNNRunner, dense_attention, normalize_adjacency
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GCN_LAYERS = (1, 3, 4, 5)
+
+
+def _bn_affine(source, index):
+    """(k, c) such that BatchNorm index in eval mode is y = k * x + c"""
+    mean = getattr(source, f"bn{index}_mean")
+    var = getattr(source, f"bn{index}_var")
+    scale = getattr(source, f"bn{index}_weight") / torch.sqrt(var + source.bn_eps)
+    return scale, getattr(source, f"bn{index}_bias") - mean * scale
+
+
+def _linear(weight):
+    layer = nn.Linear(weight.shape[1], weight.shape[0], bias=False)
+    with torch.no_grad():
+        layer.weight.copy_(weight)
+    return layer
+
+
+class FoldedGNN(nn.Module):
+    """
+    Dense GNNModel with BatchNorm folded into the projections
+
+    Same forward(x, adj) contract as DenseGNN: (B, N, F) features, (N, N) or
+    (B, N, N) adjacency, (B, N, num_classes) log-probabilities.
+    """
+
+    def __init__(self, model):
+        super(FoldedGNN, self).__init__()
+        source = ExportableGNN(model)
+
+        for index in GCN_LAYERS:
+            scale, shift = _bn_affine(source, index)
+            weight = getattr(source, f"conv{index}_weight") * scale.unsqueeze(1)
+            setattr(self, f"lin{index}", _linear(weight))
+            self.register_buffer(f"bias{index}", getattr(source, f"conv{index}_bias") * scale + shift)
+
+        scale, shift = _bn_affine(source, 2)
+        self.heads = source.heads
+        att_src, att_dst = source.conv2_att_src, source.conv2_att_dst
+        if bool((scale == 0).any()):
+            # A zero BatchNorm weight cannot be divided out of the attention vectors
+            logger.warning("GAT BatchNorm has zero weights, keeping it unfolded")
+            scale_heads = torch.ones_like(scale)
+            self.register_buffer("bn2_scale", scale)
+            self.register_buffer("bn2_shift", shift)
+        else:
+            scale_heads = scale
+            self.bn2_scale = None
+        # The projection is (heads * C, in); channel c of every head shares BatchNorm channel c
+        self.lin2 = _linear(source.conv2_weight * scale_heads.repeat(self.heads).unsqueeze(1))
+        self.register_buffer("att_src", att_src / scale_heads)
+        self.register_buffer("att_dst", att_dst / scale_heads)
+        self.register_buffer("bias2", source.conv2_bias * scale_heads + (shift if self.bn2_scale is None else 0))
+
+        self.fc1 = source.fc1
+        self.fc2 = source.fc2
+
+    def _gcn(self, x, adj_norm, index):
+        x = torch.matmul(adj_norm, getattr(self, f"lin{index}")(x)) + getattr(self, f"bias{index}")
+        return F.leaky_relu(x, 0.01)
+
+    def forward(self, x, adj):
+        x = x.float()
+        if x.dim() == 2:
+            x = x.unsqueeze(0)
+        if adj.dim() == 2:
+            adj = adj.unsqueeze(0)
+        adj_norm = normalize_adjacency(adj)
+        mask = adj > 0
+
+        x = self._gcn(x, adj_norm, 1)
+        h = self.lin2(x).view(x.shape[0], x.shape[1], self.heads, -1)
+        x = dense_attention(h, mask, self.att_src, self.att_dst, self.bias2)
+        if self.bn2_scale is not None:
+            x = x * self.bn2_scale + self.bn2_shift
+        x = F.leaky_relu(x, 0.01)
+        for index in GCN_LAYERS[1:]:
+            x = self._gcn(x, adj_norm, index)
+
+        x = F.leaky_relu(self.fc1(x), 0.01)
+        x = self.fc2(x)
+        return F.log_softmax(x, dim=-1)
+
+
+def quantize_gnn(model):
+    """
+    Fold BatchNorm and dynamically quantize the Linear projections to int8
+
+    Args:
+        model: Eager GNNModel
+
+    Returns:
+        module: Quantized FoldedGNN in eval mode
+    """
+    folded = FoldedGNN(model).eval()
+    return torch.ao.quantization.quantize_dynamic(folded, {nn.Linear}, dtype=torch.qint8)
+
+
+class QuantizedGNNRunner(DenseGNNRunner):
+    """Quantized FoldedGNN behind the eager model's call signature"""
+    backend = "int8"
+
+    def __init__(self, model):
+        self.module = quantize_gnn(model)
+
+
+def serialized_size(module):
+    """Bytes of the module's state dict as torch.save writes it"""
+    buffer = io.BytesIO()
+    torch.save(module.state_dict(), buffer)
+    return buffer.tell()
+
+
+def drift_report(reference, candidate, graphs):
+    """
+    Compare the class probabilities of two backends over a set of graphs
+
+    Args:
+        reference, candidate: Callables taking a torch_geometric Data object
+        graphs: Iterable of Data objects (the held-out set)
+
+    Returns:
+        report: Top-1 agreement, probability differences and mean KL(reference || candidate)
+    """
+    agree = 0
+    diffs = []
+    kl = []
+    n_graphs = 0
+    with torch.no_grad():
+        for graph in graphs:
+            expected = torch.exp(reference(graph)).mean(dim=0)
+            actual = torch.exp(candidate(graph)).mean(dim=0)
+            agree += int(expected.argmax() == actual.argmax())
+            diffs.append((expected - actual).abs())
+            kl.append(float((expected * (expected.clamp_min(1e-12).log() - actual.clamp_min(1e-12).log())).sum()))
+            n_graphs += 1
+    if not n_graphs:
+        return {"graphs": 0}
+    diffs = torch.stack(diffs)
+    return {
+        "graphs": n_graphs,
+        "top1_agreement": agree / n_graphs,
+        "max_abs_diff": float(diffs.max()),
+        "mean_abs_diff": float(diffs.mean()),
+        "mean_abs_diff_per_class": [float(value) for value in diffs.mean(dim=0)],
+        "mean_kl": sum(kl) / n_graphs,
+    }
@@ -4,8 +4,10 @@ import logging
 import requests
 import datetime
 from typing import Dict, Any, Optional
-import tempfile
-from fpdf import FPDF
+import uuid
+from app.utils.pdf_renderer import render_report_pdf, report_store
+from app.utils.metrics import record_fallback
+from app.utils.cpu_budget import configure_torch
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -67,8 +69,36 @@ Based on the above information, please generate a comprehensive medical report.
 Use appropriate medical terminology for a neurologist's report, but include explanations that would be understandable to patients. Be factual and evidence-based.
 """
     
+    # Add any extra instructions from the doctor regenerating the report
+    if eeg_case.get("custom_prompt"):
+        prompt += f"\nAdditional instructions from the referring doctor:\n{eeg_case['custom_prompt']}\n"
+    
     return prompt
 
+def eeg_case_from_record(eeg_record):
+    """
+    Build the eeg_case dictionary used for report generation from a stored EEG record
+    
+    Args:
+        eeg_record: Document from the eeg_reports collection
+        
+    Returns:
+        eeg_case: Dictionary containing patient and EEG analysis data
+    """
+    patient = eeg_record.get("patient", {})
+    return {
+        "eeg_id": eeg_record.get("eeg_id", ""),
+        "first_name": patient.get("firstName", ""),
+        "last_name": patient.get("lastName", ""),
+        "age": patient.get("age", ""),
+        "gender": patient.get("gender", ""),
+        "record_date": eeg_record.get("record_date", ""),
+        "clinical_notes": eeg_record.get("notes", ""),
+        "classification": eeg_record.get("result", "Unknown"),
+        "confidence": eeg_record.get("confidence", {}),
+        "seizure_intervals": eeg_record.get("seizure_intervals", [])
+    }
+
 def generate_report_local(prompt):
     """
     Generate a report using a locally loaded LLM
@@ -83,6 +113,7 @@ def generate_report_local(prompt):
         # Try to import the necessary modules
         import torch
         from transformers import AutoModelForCausalLM, AutoTokenizer
+        configure_torch()
         
         # Load the model and tokenizer (only once)
         global tokenizer, model
@@ -180,6 +211,7 @@ def generate_mock_report(prompt):
     Returns:
         report_text: Generated mock report text
     """
+    record_fallback("mock_report")
     # Extract key information from the prompt
     classification = "Unknown"
     if "Predicted Class:" in prompt:
@@ -326,112 +358,33 @@ def create_pdf_report(report_text, eeg_case=None):
         eeg_case: Optional dictionary with case information
         
     Returns:
-        pdf_path: Path to the generated PDF file
+        pdf_path: Path to the generated PDF file in the report store
     """
     try:
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp:
-            temp_path = temp.name
-        
-        # Create PDF
-        pdf = FPDF()
-        pdf.add_page()
-        
-        # Add header
-        pdf.set_font("Arial", "B", 16)
-        pdf.cell(0, 10, "EpilepTech EEG Analysis Report", 0, 1, "C")
-        pdf.line(10, pdf.get_y(), 200, pdf.get_y())
-        pdf.ln(5)
-        
-        # Add report date
-        pdf.set_font("Arial", "I", 10)
-        report_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        pdf.cell(0, 10, f"Report generated on: {report_date}", 0, 1, "R")
-        
-        # Add patient info if available
-        if eeg_case:
-            pdf.set_font("Arial", "B", 12)
-            pdf.cell(0, 10, "Patient Information:", 0, 1)
-            
-            pdf.set_font("Arial", "", 10)
-            pdf.cell(40, 7, "Name:", 0, 0)
-            pdf.cell(0, 7, f"{eeg_case.get('first_name', '')} {eeg_case.get('last_name', '')}", 0, 1)
-            
-            pdf.cell(40, 7, "Record ID:", 0, 0)
-            pdf.cell(0, 7, f"{eeg_case.get('eeg_id', '')}", 0, 1)
-            
-            pdf.cell(40, 7, "Age/Gender:", 0, 0)
-            pdf.cell(0, 7, f"{eeg_case.get('age', '')} / {eeg_case.get('gender', '')}", 0, 1)
-            
-            pdf.cell(40, 7, "Record Date:", 0, 0)
-            pdf.cell(0, 7, f"{eeg_case.get('record_date', '')}", 0, 1)
-            
-            pdf.ln(5)
-        
-        # Add main report content
-        pdf.set_font("Arial", "B", 12)
-        pdf.cell(0, 10, "Analysis Results:", 0, 1)
-        
-        pdf.set_font("Arial", "", 10)
-        
-        # Process the report text line by line
-        for line in report_text.split('\n'):
-            # Check if it's a header
-            if line.startswith('# '):
-                pdf.set_font("Arial", "B", 14)
-                pdf.cell(0, 10, line[2:], 0, 1)
-                pdf.set_font("Arial", "", 10)
-            elif line.startswith('## '):
-                pdf.set_font("Arial", "B", 12)
-                pdf.cell(0, 10, line[3:], 0, 1)
-                pdf.set_font("Arial", "", 10)
-            elif line.startswith('**') and line.endswith('**'):
-                pdf.set_font("Arial", "B", 10)
-                pdf.cell(0, 7, line.replace('**', ''), 0, 1)
-                pdf.set_font("Arial", "", 10)
-            elif line.startswith('- '):
-                # Handle bullet points
-                pdf.cell(5, 7, "", 0, 0)
-                pdf.cell(0, 7, line, 0, 1)
-            elif line.startswith('1. ') or line.startswith('2. ') or line.startswith('3. ') or line.startswith('4. ') or line.startswith('5. '):
-                # Handle numbered lists
-                pdf.cell(5, 7, "", 0, 0)
-                pdf.cell(0, 7, line, 0, 1)
-            elif line.strip() == '':
-                # Handle empty lines
-                pdf.ln(2)
-            else:
-                # Regular text
-                # Use multi_cell to handle long text with wrapping
-                pdf.multi_cell(0, 7, line)
-        
-        # Add footer
-        pdf.ln(10)
-        pdf.set_font("Arial", "I", 8)
-        pdf.cell(0, 10, "This report was generated by EpilepTech AI Analysis System", 0, 1, "C")
-        pdf.cell(0, 10, "For clinical use only. Please consult with a neurologist for interpretation.", 0, 1, "C")
-        
-        # Save PDF
-        pdf.output(temp_path)
+        pdf_bytes = render_report_pdf(report_text, eeg_case)
         
-        return temp_path
+        # Key the stored file by EEG ID so re-processing replaces the old PDF
+        key = (eeg_case or {}).get("eeg_id") or uuid.uuid4().hex
+        return report_store.save(key, pdf_bytes)
         
     except Exception as e:
         logger.error(f"Error creating PDF report: {str(e)}")
         return None
 
-def generate_pdf_report(eeg_case):
+def generate_pdf_report(eeg_case, report_text=None):
     """
     Generate a report and create a PDF
     
     Args:
         eeg_case: Dictionary containing patient and EEG analysis data
+        report_text: Already generated report text, to avoid a second LLM call
         
     Returns:
         pdf_path: Path to the generated PDF file
     """
     # Generate the report text
-    report_text = generate_report(eeg_case)
+    if report_text is None:
+        report_text = generate_report(eeg_case)
     
     # Create and return the PDF
     return create_pdf_report(report_text, eeg_case)
\ No newline at end of file
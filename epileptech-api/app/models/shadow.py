@@ -0,0 +1,298 @@
+"""
+Shadow execution of candidate GNN checkpoints on live traffic
+
+The primary model (GNN_MODEL_PATH) answers every request as before. When
+SHADOW_MODELS is set, classify_eeg also hands the graph it has already built,
+together with the primary probabilities, to a background worker and returns
+without waiting. The worker:
+
+1. drains up to SHADOW_BATCH_SIZE queued graphs and runs each shadow model over
+   all of them in one forward pass (a disjoint torch_geometric Batch, or one
+   (B, N, F) tensor for the dense/int8 backends when the montages match);
+2. compares every shadow prediction with the primary one;
+3. writes one document per request to the model_shadow_predictions collection,
+   through a MongoClient of its own created in the worker thread.
+
+Settings:
+    SHADOW_MODELS      comma-separated candidate weights, "name=path" or "path"
+    SHADOW_BACKEND     backend for the shadow models (see gnn_export.BACKENDS, default eager)
+    SHADOW_BATCH_SIZE  most requests run per forward pass (default 16)
+    SHADOW_QUEUE_SIZE  requests waiting for the worker; past it, shadow work is dropped (default 256)
+
+Shadow models load inside the worker on first use, and a full queue drops
+work instead of blocking. The primary path therefore only pays for a
+non-blocking queue put. The worker counts as one more concurrent CPU job in
+the process's thread budget (app.utils.cpu_budget), since torch's thread
+count is shared by every thread in the process.
+
+Agreement per model:
+    python -m app.models.shadow [--hours 24]
+"""
+import os
+import logging
+import datetime
+
+import torch
+
+from app.database.database import MongoConnectionManager, connection_manager, shadow_predictions_collection
+from app.models.gnn_export import load_backend
+from app.utils.metrics import counter, histogram
+from app.utils.profiling import native_module
+from app.utils.tracing import current_trace
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHADOW_MODELS = os.environ.get("SHADOW_MODELS", "")
+SHADOW_BACKEND = os.environ.get("SHADOW_BACKEND", "eager").lower()
+SHADOW_BATCH_SIZE = int(os.environ.get("SHADOW_BATCH_SIZE", "16"))
+SHADOW_QUEUE_SIZE = int(os.environ.get("SHADOW_QUEUE_SIZE", "256"))
+
+CLASS_LABELS = ("epileptic", "non-epileptic", "psychogenic")
+
+shadow_predictions_total = counter(
+    "epileptech_shadow_predictions_total", "Shadow model predictions by agreement with the primary", ("model", "outcome")
+)
+shadow_dropped_total = counter("epileptech_shadow_dropped_total", "Requests not shadowed because the queue was full")
+shadow_batch_size = histogram(
+    "epileptech_shadow_batch_size", "Requests run per shadow forward pass", buckets=(1, 2, 4, 8, 16, 32, 64)
+)
+shadow_probability_diff = histogram(
+    "epileptech_shadow_probability_diff", "Largest class probability difference from the primary", ("model",),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.2, 0.5, 1.0),
+)
+
+
+def parse_shadow_models(spec):
+    """[(name, path)] from "name=path,path2"; unnamed entries are named after the file"""
+    models = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        name, _, path = entry.rpartition("=")
+        models.append((name or os.path.splitext(os.path.basename(path))[0], path))
+    return models
+
+
+def _graph_probabilities(model, graphs):
+    """(B, num_classes) probabilities for B graphs, averaged over each graph's nodes as classify_eeg does"""
+    from torch_geometric.data import Batch
+    sizes = {graph.x.shape[0] for graph in graphs}
+    with torch.no_grad():
+        if hasattr(model, "forward_batch") and len(sizes) == 1 and all(
+                torch.equal(graph.edge_index, graphs[0].edge_index) for graph in graphs):
+            x = torch.stack([graph.x.float() for graph in graphs])
+            return torch.exp(model.forward_batch(x, graphs[0].edge_index)).mean(dim=1)
+        batch = Batch.from_data_list(graphs)
+        probs = torch.exp(model(batch))
+        sums = torch.zeros(len(graphs), probs.shape[1]).index_add_(0, batch.batch, probs)
+        counts = torch.bincount(batch.batch, minlength=len(graphs)).unsqueeze(1)
+        return sums / counts
+
+
+class ShadowRunner:
+    """Bounded queue of classified graphs and the native thread that shadows them"""
+
+    def __init__(self, models=None, backend=SHADOW_BACKEND, batch_size=SHADOW_BATCH_SIZE,
+                 queue_size=SHADOW_QUEUE_SIZE):
+        self.models = parse_shadow_models(SHADOW_MODELS) if models is None else models
+        self.backend = backend
+        self.batch_size = max(1, batch_size)
+        self.queue_size = queue_size
+        self._loaded = None
+        self._queue = None
+        self._thread = None
+        # Under eventlet the worker must be a real OS thread so torch does not block the hub
+        self._threading = native_module("threading")
+        self._queue_module = native_module("queue")
+        self._lock = self._threading.Lock()
+        os.register_at_fork(after_in_child=self._reset)
+
+    @property
+    def enabled(self):
+        return bool(self.models)
+
+    def _reset(self):
+        self._queue = None
+        self._thread = None
+        self._lock = self._threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._queue = self._queue_module.Queue(maxsize=self.queue_size)
+                self._thread = self._threading.Thread(target=self._work, name="shadow-models", daemon=True)
+                self._thread.start()
+
+    def submit(self, graph_data, probabilities, eeg_id=None, model_version=None):
+        """
+        Queue a classified graph for the shadow models without waiting
+
+        Args:
+            graph_data: Graph the primary model classified (not modified)
+            probabilities: Primary class probabilities (tensor or sequence)
+            eeg_id: Record the request belongs to, when known
+            model_version: Primary model version
+
+        Returns:
+            queued: False when shadowing is disabled or the queue is full
+        """
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self._start()
+        trace = current_trace()
+        item = {
+            "graph": graph_data,
+            "primary": [float(p) for p in probabilities],
+            "eeg_id": eeg_id,
+            "trace_id": trace.trace_id if trace is not None else None,
+            "model_version": model_version,
+            "submitted_at": datetime.datetime.utcnow(),
+        }
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except self._queue_module.Full:
+            shadow_dropped_total.inc()
+            return False
+
+    def _load(self):
+        from app.models.gnn_classifier import load_model, model_version
+        loaded = []
+        for name, path in self.models:
+            if not os.path.exists(path):
+                logger.warning(f"Shadow model {name}: {path} not found, skipping it")
+                continue
+            model = load_backend(load_model(path).eval(), self.backend, path)
+            loaded.append({
+                "name": name,
+                "model": model,
+                "model_version": model_version(path),
+                "backend": getattr(model, "backend", "eager"),
+            })
+            logger.info(f"Shadow model {name} loaded from {path}")
+        return loaded
+
+    def _work(self):
+        if connection_manager.url.startswith("mongomock://"):
+            # A second mongomock client would be a separate, empty database; it does no socket I/O
+            collection = shadow_predictions_collection
+        else:
+            # The shared client is green under eventlet; this OS thread must not use it
+            collection = MongoConnectionManager().db[shadow_predictions_collection.name]
+        while True:
+            items = [self._queue.get()]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except self._queue_module.Empty:
+                    break
+            try:
+                if self._loaded is None:
+                    self._loaded = self._load()
+                self.run_batch(items, collection)
+            except Exception as e:
+                logger.error(f"Shadow batch of {len(items)} failed: {str(e)}", exc_info=True)
+
+    def run_batch(self, items, collection=shadow_predictions_collection):
+        """Run every shadow model over the queued items and store one document per item"""
+        if not self._loaded:
+            return []
+        shadow_batch_size.observe(len(items))
+        graphs = [item["graph"] for item in items]
+        documents = [{
+            "eeg_id": item["eeg_id"],
+            "trace_id": item["trace_id"],
+            "created_at": item["submitted_at"],
+            "batch_size": len(items),
+            "primary": {
+                "model_version": item["model_version"],
+                "classification": CLASS_LABELS[max(range(len(item["primary"])), key=item["primary"].__getitem__)],
+                "probabilities": item["primary"],
+            },
+            "shadows": [],
+        } for item in items]
+
+        for shadow in self._loaded:
+            try:
+                probabilities = _graph_probabilities(shadow["model"], graphs)
+            except Exception as e:
+                logger.warning(f"Shadow model {shadow['name']} failed on a batch of {len(items)}: {str(e)}")
+                continue
+            for document, item, probs in zip(documents, items, probabilities.tolist()):
+                classification = CLASS_LABELS[max(range(len(probs)), key=probs.__getitem__)]
+                agrees = classification == document["primary"]["classification"]
+                max_abs_diff = max(abs(a - b) for a, b in zip(probs, item["primary"]))
+                shadow_predictions_total.inc(model=shadow["name"], outcome="agree" if agrees else "disagree")
+                shadow_probability_diff.observe(max_abs_diff, model=shadow["name"])
+                document["shadows"].append({
+                    "name": shadow["name"],
+                    "model_version": shadow["model_version"],
+                    "backend": shadow["backend"],
+                    "classification": classification,
+                    "probabilities": probs,
+                    "agrees": agrees,
+                    "max_abs_diff": max_abs_diff,
+                })
+
+        try:
+            collection.insert_many(documents, ordered=False)
+        except Exception as e:
+            logger.warning(f"Could not store {len(documents)} shadow predictions: {str(e)}")
+        return documents
+
+
+shadow_runner = ShadowRunner()
+
+
+def agreement_summary(since=None):
+    """
+    Agreement of each shadow model with the primary
+
+    Args:
+        since: Only count predictions created after this datetime
+
+    Returns:
+        summary: List of {"model", "predictions", "agreement", "mean_max_abs_diff", "disagreements"}
+    """
+    match = {"created_at": {"$gte": since}} if since else {}
+    pipeline = [
+        {"$match": match},
+        {"$unwind": "$shadows"},
+        {"$group": {
+            "_id": "$shadows.name",
+            "predictions": {"$sum": 1},
+            "agreed": {"$sum": {"$cond": ["$shadows.agrees", 1, 0]}},
+            "mean_max_abs_diff": {"$avg": "$shadows.max_abs_diff"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    return [{
+        "model": row["_id"],
+        "predictions": row["predictions"],
+        "agreement": row["agreed"] / row["predictions"] if row["predictions"] else 0.0,
+        "mean_max_abs_diff": row["mean_max_abs_diff"],
+        "disagreements": row["predictions"] - row["agreed"],
+    } for row in shadow_predictions_collection.aggregate(pipeline)]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Agreement of the shadow models with the primary model")
+    parser.add_argument("--hours", type=float, help="Only count the last N hours")
+    args = parser.parse_args()
+    since = datetime.datetime.utcnow() - datetime.timedelta(hours=args.hours) if args.hours else None
+    rows = agreement_summary(since)
+    if not rows:
+        print("No shadow predictions recorded")
+        return
+    print(f"{'model':<24} {'predictions':>11} {'agreement':>10} {'mean max |dp|':>14}")
+    for row in rows:
+        print(f"{row['model']:<24} {row['predictions']:>11} {row['agreement']:>10.1%} {row['mean_max_abs_diff']:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,14 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 import os
+import json
+import time
+import uuid
 import logging
-import openai
+import threading
 from flask_cors import CORS
+from app.utils.chat_cache import chat_cache
+from app.utils.chat_sessions import conversation_store, upstream_limiter
+from app.utils.metrics import record_llm_throughput
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,69 +19,218 @@ OPENAI_API_KEY = os.environ.get("OPENAI_API_KEY", "")
 if not OPENAI_API_KEY:
     logger.warning("OpenAI API key not set! Chatbot functionality will be limited.")
 
-# Set the OpenAI API key
-openai.api_key = OPENAI_API_KEY
+CHAT_MODEL = os.environ.get("CHAT_MODEL", "gpt-3.5-turbo")
+CHAT_TIMEOUT_SECONDS = float(os.environ.get("CHAT_TIMEOUT_SECONDS", "60"))
+
+DOCTOR_SYSTEM_MESSAGE = (
+    "You are a medical assistant specialized in epilepsy and seizure disorders. "
+    "Provide professional, evidence-based information suitable for medical professionals."
+)
+PATIENT_SYSTEM_MESSAGE = (
+    "You are a friendly medical assistant who helps patients understand epilepsy, PNES, and seizures. "
+    "Explain medical concepts in simple terms. Remember, you are not a doctor, and all advice should encourage consulting with healthcare providers."
+)
+FALLBACK_REPLY = "I'm sorry, I couldn't generate a response."
 
 # Create blueprint
 router = Blueprint('chatbot', __name__, url_prefix='/api/chatbot')
 CORS(router, supports_credentials=True)
 
+class ChatBusyError(Exception):
+    """Raised when a user already has the maximum number of upstream calls running"""
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client():
+    """Create the OpenAI client on first use instead of at import time"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import OpenAI
+                _client = OpenAI(api_key=OPENAI_API_KEY, timeout=CHAT_TIMEOUT_SECONDS)
+    return _client
+
+def _prepare_chat(data):
+    """
+    Validate a chat request and build the upstream conversation
+
+    Returns:
+        (context, error): context dict for the request, or a (response, status) error
+    """
+    message = (data or {}).get("message")
+    if not message:
+        logger.warning("No message provided in request")
+        return None, (jsonify({"error": "Message is required"}), 400)
+
+    # For now, use a mock user (replace with real auth as needed)
+    current_user = {"username": "test_user", "is_doctor": False}
+
+    session_id = data.get("session_id") or str(uuid.uuid4())
+    is_doctor = current_user.get("is_doctor", False)
+    persona = "doctor" if is_doctor else "patient"
+    system_message = DOCTOR_SYSTEM_MESSAGE if is_doctor else PATIENT_SYSTEM_MESSAGE
+
+    history = conversation_store.history(session_id)
+    messages = [{"role": "system", "content": system_message}] + history + [
+        {"role": "user", "content": message}
+    ]
+
+    # Until the mock user is replaced by real auth, limit per client address;
+    # session_id comes from the client, which could pick a new one per request
+    user_key = str(current_user.get("_id") or request.remote_addr)
+
+    return {
+        "message": message,
+        "session_id": session_id,
+        "persona": persona,
+        "messages": messages,
+        "has_history": bool(history),
+        "user_key": user_key,
+    }, None
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
 @router.route('/chat', methods=['POST'])
 def chat_with_bot():
     """
     Chat with the medical assistant bot about epilepsy and seizures
     """
     try:
-        logger.info(f"Received chat request: {request.get_json()}")
-
         if not OPENAI_API_KEY:
             logger.error("OpenAI API key not configured")
             return jsonify({"error": "OpenAI API key not configured"}), 500
 
-        # For now, use a mock user (replace with real auth as needed)
-        current_user = {"username": "test_user", "is_doctor": False}
-        logger.info(f"Current user: {current_user}")
-
-        data = request.get_json()
-        message = data.get("message")
-        if not message:
-            logger.warning("No message provided in request")
-            return jsonify({"error": "Message is required"}), 400
-
-        logger.info(f"Processing message: {message}")
-
-        # Personalize system message
-        is_doctor = current_user.get("is_doctor", False)
-        if is_doctor:
-            system_message = (
-                "You are a medical assistant specialized in epilepsy and seizure disorders. "
-                "Provide professional, evidence-based information suitable for medical professionals."
-            )
+        data = request.get_json(silent=True)
+        chat, error = _prepare_chat(data)
+        if error:
+            return error
+
+        logger.info(f"Processing chat message for session {chat['session_id']}")
+
+        def ask_openai():
+            if not upstream_limiter.acquire(chat["user_key"]):
+                raise ChatBusyError()
+            try:
+                logger.info("Calling OpenAI API...")
+                response = get_openai_client().chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=chat["messages"],
+                    max_tokens=500,
+                    temperature=0.7,
+                )
+            finally:
+                upstream_limiter.release(chat["user_key"])
+            content = response.choices[0].message.content
+            # Only real answers are returned truthy, so fallbacks are never cached
+            return content.strip() if content else None
+
+        # Follow-up questions depend on the conversation, so only cache first turns
+        if chat["has_history"]:
+            reply = ask_openai()
         else:
-            system_message = (
-                "You are a friendly medical assistant who helps patients understand epilepsy, PNES, and seizures. "
-                "Explain medical concepts in simple terms. Remember, you are not a doctor, and all advice should encourage consulting with healthcare providers."
-            )
-
-        logger.info(f"Using system message: {system_message}")
-
-        # Call OpenAI API
-        logger.info("Calling OpenAI API...")
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": message}
-            ],
-            max_tokens=500,
-            temperature=0.7,
-        )
+            # Another client's busy rejection must not become this client's 429
+            reply = chat_cache.get_or_compute(chat["message"], chat["persona"], ask_openai,
+                                              unshared_errors=(ChatBusyError,))
 
-        reply = response.choices[0].message.content.strip() if response.choices[0].message.content else "I'm sorry, I couldn't generate a response."
+        if reply:
+            conversation_store.append(chat["session_id"], chat["message"], reply)
+        else:
+            reply = FALLBACK_REPLY
         logger.info(f"OpenAI response: {reply[:100]}...")
 
-        return jsonify({"reply": reply})
+        return jsonify({"reply": reply, "session_id": chat["session_id"]})
 
+    except ChatBusyError:
+        return jsonify({"error": "Too many concurrent chat requests, please wait"}), 429
     except Exception as e:
         logger.error(f"Error in chatbot: {str(e)}", exc_info=True)
-        return jsonify({"error": f"Chatbot error: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"Chatbot error: {str(e)}"}), 500
+
+@router.route('/chat/stream', methods=['POST'])
+def stream_chat_with_bot():
+    """
+    Chat with the medical assistant bot, streaming the reply as server-sent events
+
+    Each event carries a JSON payload: {"token": ...} for reply fragments,
+    then {"done": true, "session_id": ...} or {"error": ...}. The upstream call
+    is made with stream=True so tokens are forwarded as they arrive; under the
+    eventlet worker the socket reads yield instead of pinning a thread.
+    """
+    try:
+        if not OPENAI_API_KEY:
+            logger.error("OpenAI API key not configured")
+            return jsonify({"error": "OpenAI API key not configured"}), 500
+
+        data = request.get_json(silent=True)
+        chat, error = _prepare_chat(data)
+        if error:
+            return error
+
+        if not chat["has_history"]:
+            cached = chat_cache.get(chat["message"], chat["persona"])
+            if cached:
+                conversation_store.append(chat["session_id"], chat["message"], cached)
+
+                def replay():
+                    yield _sse({"token": cached})
+                    yield _sse({"done": True, "session_id": chat["session_id"], "cached": True})
+
+                return Response(replay(), mimetype="text/event-stream")
+
+        if not upstream_limiter.acquire(chat["user_key"]):
+            return jsonify({"error": "Too many concurrent chat requests, please wait"}), 429
+
+        def generate():
+            parts = []
+            start = time.perf_counter()
+            try:
+                stream = get_openai_client().chat.completions.create(
+                    model=CHAT_MODEL,
+                    messages=chat["messages"],
+                    max_tokens=500,
+                    temperature=0.7,
+                    stream=True,
+                )
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        parts.append(token)
+                        yield _sse({"token": token})
+
+                reply = "".join(parts).strip()
+                record_llm_throughput("chat", reply, time.perf_counter() - start)
+                if reply:
+                    conversation_store.append(chat["session_id"], chat["message"], reply)
+                    if not chat["has_history"]:
+                        chat_cache.set(chat["message"], chat["persona"], reply)
+                else:
+                    yield _sse({"token": FALLBACK_REPLY})
+                yield _sse({"done": True, "session_id": chat["session_id"]})
+            except Exception as e:
+                logger.error(f"Error streaming chat reply: {str(e)}", exc_info=True)
+                yield _sse({"error": f"Chatbot error: {str(e)}"})
+
+        response = Response(
+            stream_with_context(generate()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+        # The server closes the response even when the client disconnects
+        # before the generator starts, so the slot is always released
+        response.call_on_close(lambda: upstream_limiter.release(chat["user_key"]))
+        return response
+
+    except Exception as e:
+        logger.error(f"Error in chatbot stream: {str(e)}", exc_info=True)
+        return jsonify({"error": f"Chatbot error: {str(e)}"}), 500
+
+@router.route('/chat/<session_id>', methods=['DELETE'])
+def reset_chat_session(session_id):
+    """Forget the server-side history of a chat session"""
+    conversation_store.reset(session_id)
+    return jsonify({"message": "Chat session cleared"})
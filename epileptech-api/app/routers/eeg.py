@@ -1,5 +1,6 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, request, jsonify, g
 from werkzeug.utils import secure_filename
+from werkzeug.wsgi import wrap_file
 from datetime import datetime
 import os
 import uuid
@@ -7,10 +8,18 @@ import shutil
 import logging
 from bson import ObjectId
 from app.database.database import eeg_reports_collection, patients_collection
-from app.models.gnn_classifier import classify_eeg, preprocess_eeg_to_graph
-from app.models.llm_report_generator import generate_report, generate_pdf_report
+from app.inference.client import inference
+from app.models.llm_report_generator import eeg_case_from_record
+from app.utils.pdf_renderer import get_report_pdf, pdf_cache
+from app.utils.tracing import current_trace, span, traced
+from app.utils.metrics import eeg_processing_in_progress, in_progress
+from app.utils.profiling import latest_profile, profiled
+from app.utils.waveform import (
+    CONTENT_TYPE as WAVEFORM_CONTENT_TYPE, WaveformNotFound, delete_pyramid, pyramid_meta, query_tiles
+)
 from app.utils.auth import login_required, doctor_required
-from app.utils.file_handlers import process_eeg_file, validate_eeg_file
+from app.utils.file_handlers import validate_eeg_file
+from app.utils.blob_storage import BLOB_CHUNK_BYTES, blob_store, blob_uri, delete_file
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -26,7 +35,7 @@ def upload_eeg():
     Upload and process an EEG file
     
     - Validates the file format
-    - Saves the file to a temporary location
+    - Streams the file into the blob store (identical uploads are stored once)
     - Creates a patient record if not exists
     - Creates an EEG report record with pending status
     - Returns the EEG ID for tracking
@@ -45,17 +54,6 @@ def upload_eeg():
         if not validate_eeg_file(file):
             return jsonify({"error": "Invalid file format. Supported formats: .edf, .bdf, .zip, .gz"}), 400
             
-        # Create unique file path
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"{eeg_id}_{timestamp}_{secure_filename(file.filename)}"
-        file_path = f"temp_uploads/{filename}"
-        
-        # Create directory if it doesn't exist
-        os.makedirs("temp_uploads", exist_ok=True)
-        
-        # Save file temporarily
-        file.save(file_path)
-        
         # Parse patient info from form
         import json
         patient_data = json.loads(patient_info)
@@ -83,12 +81,17 @@ def upload_eeg():
         else:
             patient_id = existing_patient["patient_id"]
         
+        # Store the file under its content hash; the record holds one reference to it
+        file_key = blob_store.put(file.stream, filename=file.filename, content_type=file.mimetype)
+        file_path = blob_uri(file_key)
+        
         # Create EEG report record
         eeg_record = {
             "eeg_id": eeg_id,
             "patient_id": patient_id,
             "doctor_id": current_user["_id"],
             "file_path": file_path,
+            "file_name": secure_filename(file.filename),
             "record_date": record_date,
             "upload_date": datetime.now(),
             "status": "pending",
@@ -102,7 +105,12 @@ def upload_eeg():
         }
         
         # Insert into database
-        eeg_reports_collection.insert_one(eeg_record)
+        try:
+            eeg_reports_collection.insert_one(eeg_record)
+        except Exception:
+            # No record took ownership of the reference
+            blob_store.release(file_key)
+            raise
         
         logger.info(f"File {file_path} uploaded and ready for processing")
         
@@ -163,16 +171,26 @@ def get_eeg_report(eeg_id):
 
 @router.route('/process/<eeg_id>', methods=['POST'])
 @login_required
+@profiled("eeg_id")
+@in_progress(eeg_processing_in_progress)
+@traced("process_eeg")
 def process_eeg(eeg_id):
     """
     Process an EEG file to classify and generate a report
+    
+    Each stage (decode, graph preprocessing, model forward pass, interval
+    detection, LLM generation, Mongo reads/writes) is timed and the breakdown
+    is stored on the report as processing_stages. Send `X-Profile: cpu` (or
+    `cpu,alloc`) to also capture a sampling profile, fetched afterwards from
+    /reports/<eeg_id>/profile.
     """
     try:
         # Get current user from Flask g object
         current_user = g.current_user
         
         # Find the EEG record
-        eeg_record = eeg_reports_collection.find_one({"eeg_id": eeg_id})
+        with span("mongo_read", collection="eeg_reports"):
+            eeg_record = eeg_reports_collection.find_one({"eeg_id": eeg_id})
         
         if not eeg_record:
             return jsonify({"error": "EEG record not found"}), 404
@@ -188,11 +206,10 @@ def process_eeg(eeg_id):
         # Process the EEG file
         file_path = eeg_record["file_path"]
         
-        # Extract the raw EEG data
-        eeg_data = process_eeg_file(file_path)
-        
-        # Run the GNN classification model
-        classification, confidence_scores, seizure_intervals = classify_eeg(eeg_data)
+        # Decode the file and run the GNN classification model, either in the
+        # inference service (INFERENCE_URL) or lazily in this process; the
+        # viewer's waveform pyramid is built from the same decoded signal
+        classification, confidence_scores, seizure_intervals = inference.classify_file(file_path, waveform_key=eeg_id)
         
         # Prepare case info for report generation
         eeg_case = {
@@ -208,27 +225,28 @@ def process_eeg(eeg_id):
             "seizure_intervals": seizure_intervals
         }
         
-        # Generate LLM report
-        report_text = generate_report(eeg_case)
-        
-        # Generate PDF report and get the file path
-        pdf_path = generate_pdf_report(eeg_case)
+        # Generate LLM report; the PDF is rendered on first download
+        report_text = inference.generate_report(eeg_case)
         
         # Update the record with the results
+        trace = current_trace()
         update_data = {
             "status": "completed",
             "result": classification,
             "confidence": confidence_scores,
             "seizure_intervals": seizure_intervals,
             "report": report_text,
-            "report_file": pdf_path,
-            "processed_at": datetime.now()
+            "report_revision": eeg_record.get("report_revision", 0) + 1,
+            "processed_at": datetime.now(),
+            "trace_id": trace.trace_id,
+            "processing_stages": trace.stages()
         }
         
-        eeg_reports_collection.update_one(
-            {"eeg_id": eeg_id},
-            {"$set": update_data}
-        )
+        with span("mongo_write", collection="eeg_reports"):
+            eeg_reports_collection.update_one(
+                {"eeg_id": eeg_id},
+                {"$set": update_data}
+            )
         
         return jsonify({
             "message": "EEG processed successfully",
@@ -241,10 +259,55 @@ def process_eeg(eeg_id):
         logger.error(f"Error processing EEG {eeg_id}: {str(e)}")
         return jsonify({"error": f"Error processing EEG: {str(e)}"}), 500
 
+def _report_version(report):
+    """
+    Identify a record's current report text
+    
+    The record's _id is part of it because an EEG deleted and uploaded again
+    reuses its eeg_id and starts over at the same report revisions.
+    """
+    return f"{report['_id']}-r{report.get('report_revision', 0)}"
+
+def _report_pdf_key(eeg_id, revision, report):
+    """Blob key of a report revision's PDF, rendering and storing it on first download"""
+    if report.get("report_pdf_revision") == revision and report.get("report_pdf_key"):
+        return report["report_pdf_key"]
+    
+    pdf_bytes = get_report_pdf(
+        eeg_id,
+        _report_version(report),
+        report["report"],
+        eeg_case_from_record(report),
+        report.get("last_updated") or report.get("processed_at"),
+        render=inference.render_pdf
+    )
+    pdf_key = blob_store.put_bytes(pdf_bytes, filename=f"{eeg_id}.pdf", content_type="application/pdf")
+    
+    # Record the key only if the report is unchanged since it was read; a
+    # concurrent download or regeneration that got there first keeps its own
+    previous_key = report.get("report_pdf_key")
+    result = eeg_reports_collection.update_one(
+        {"_id": report["_id"], "report_revision": report.get("report_revision"), "report_pdf_key": previous_key},
+        {"$set": {"report_pdf_key": pdf_key, "report_pdf_revision": revision}}
+    )
+    if result.modified_count:
+        if previous_key:
+            blob_store.release(previous_key)
+    else:
+        blob_store.release(pdf_key)
+    return pdf_key
+
 @router.route('/reports/<eeg_id>/download', methods=['GET'])
 @login_required
+@traced("download_report")
 def download_report(eeg_id):
-    """Download the PDF report for a specific EEG"""
+    """
+    Download the PDF report for a specific EEG
+    
+    The PDF is rendered from the stored report text on first request and kept
+    in the blob store per report revision, then streamed from there. Responses
+    carry an ETag and honour If-None-Match and Range headers.
+    """
     try:
         # Get current user from Flask g object
         current_user = g.current_user
@@ -259,25 +322,136 @@ def download_report(eeg_id):
             return jsonify({"error": "You don't have access to this report"}), 403
             
         # Check if report exists
-        if "report_file" not in report:
+        if not report.get("report"):
             return jsonify({"error": "Report file not found"}), 404
             
-        pdf_path = report["report_file"]
+        revision = report.get("report_revision", 0)
+        etag = _report_version(report)
         
-        if not os.path.exists(pdf_path):
-            return jsonify({"error": "Report file not found on server"}), 404
-            
-        return send_file(
-            pdf_path,
+        # Answer revalidation without rendering anything
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+            response.set_etag(etag)
+            return response
+        
+        pdf_key = _report_pdf_key(eeg_id, revision, report)
+        size = blob_store.size(pdf_key)
+        
+        response = Response(
+            wrap_file(request.environ, blob_store.open(pdf_key), BLOB_CHUNK_BYTES),
             mimetype='application/pdf',
-            as_attachment=True,
-            download_name=f"EEG_Report_{eeg_id}.pdf"
+            direct_passthrough=True
         )
+        response.content_length = size
+        response.headers["Content-Disposition"] = f'attachment; filename="EEG_Report_{eeg_id}.pdf"'
+        response.headers["Cache-Control"] = "private, no-cache"
+        response.set_etag(etag)
+        return response.make_conditional(request, accept_ranges=True, complete_length=size)
         
     except Exception as e:
         logger.error(f"Error downloading report {eeg_id}: {str(e)}")
         return jsonify({"error": f"Error downloading report: {str(e)}"}), 500
 
+@router.route('/reports/<eeg_id>/profile', methods=['GET'])
+@login_required
+def download_profile(eeg_id):
+    """
+    Download the latest profile captured while processing an EEG
+    
+    Query parameters:
+    - kind: "cpu" (collapsed stacks for flamegraph tools, default) or "alloc"
+    """
+    try:
+        current_user = g.current_user
+        
+        report = eeg_reports_collection.find_one({"eeg_id": eeg_id}, {"doctor_id": 1})
+        
+        if not report:
+            return jsonify({"error": "Report not found"}), 404
+            
+        # Check if user has access
+        if str(report["doctor_id"]) != str(current_user["_id"]):
+            return jsonify({"error": "You don't have access to this report"}), 403
+        
+        kind = request.args.get("kind", "cpu")
+        path = latest_profile(eeg_id, kind)
+        if not path:
+            return jsonify({"error": "No profile recorded for this EEG"}), 404
+        
+        with open(path, "rb") as f:
+            data = f.read()
+        response = Response(data, mimetype="text/plain")
+        response.headers["Content-Disposition"] = f'attachment; filename="{os.path.basename(path)}"'
+        return response
+        
+    except Exception as e:
+        logger.error(f"Error downloading profile {eeg_id}: {str(e)}")
+        return jsonify({"error": f"Error downloading profile: {str(e)}"}), 500
+
+def _check_waveform_access(eeg_id):
+    report = eeg_reports_collection.find_one({"eeg_id": eeg_id}, {"doctor_id": 1})
+    if not report:
+        return jsonify({"error": "Report not found"}), 404
+    if str(report["doctor_id"]) != str(g.current_user["_id"]):
+        return jsonify({"error": "You don't have access to this report"}), 403
+    return None
+
+@router.route('/reports/<eeg_id>/waveform/meta', methods=['GET'])
+@login_required
+def get_waveform_meta(eeg_id):
+    """Channels, duration and pyramid levels the viewer needs to plan tile requests"""
+    try:
+        error = _check_waveform_access(eeg_id)
+        if error:
+            return error
+        return jsonify(pyramid_meta(eeg_id))
+    except WaveformNotFound:
+        return jsonify({"error": "Waveform not available; process the EEG first"}), 404
+    except Exception as e:
+        logger.error(f"Error fetching waveform metadata {eeg_id}: {str(e)}")
+        return jsonify({"error": f"Error fetching waveform: {str(e)}"}), 500
+
+@router.route('/reports/<eeg_id>/waveform', methods=['GET'])
+@login_required
+def get_waveform(eeg_id):
+    """
+    Min/max waveform tiles in the binary format described in app.utils.waveform
+    
+    Query parameters:
+    - channels: Comma-separated channel indices (default all)
+    - start, end, width: Time range in seconds and plot width in pixels, or
+    - level, tile: An explicit tile address, cacheable by the browser
+    """
+    try:
+        error = _check_waveform_access(eeg_id)
+        if error:
+            return error
+        
+        args = request.args
+        payload, info = query_tiles(
+            eeg_id,
+            channels=args.get("channels", ""),
+            start=args.get("start", type=float),
+            end=args.get("end", type=float),
+            width=args.get("width", type=int),
+            level=args.get("level", type=int),
+            tile=args.get("tile", type=int),
+        )
+        
+        response = Response(payload, mimetype=WAVEFORM_CONTENT_TYPE)
+        response.headers["X-Waveform-Level"] = str(info["level"])
+        response.headers["X-Waveform-Tiles"] = f"{info['first_tile']}-{info['last_tile']}"
+        response.headers["Cache-Control"] = "private, max-age=3600"
+        response.set_etag(f"{eeg_id}-{info['built_at']}-{request.query_string.decode('ascii', 'ignore')}")
+        return response.make_conditional(request)
+    except WaveformNotFound:
+        return jsonify({"error": "Waveform not available; process the EEG first"}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error fetching waveform {eeg_id}: {str(e)}")
+        return jsonify({"error": f"Error fetching waveform: {str(e)}"}), 500
+
 @router.route('/reports/<eeg_id>', methods=['DELETE'])
 @login_required
 def delete_eeg_report(eeg_id):
@@ -295,16 +469,23 @@ def delete_eeg_report(eeg_id):
         if str(report["doctor_id"]) != str(current_user["_id"]):
             return jsonify({"error": "You don't have access to this report"}), 403
             
-        # Delete associated files
-        if "file_path" in report and os.path.exists(report["file_path"]):
-            os.remove(report["file_path"])
-            
-        if "report_file" in report and os.path.exists(report["report_file"]):
+        # Reports processed before on-demand rendering may still have a PDF on disk
+        if report.get("report_file") and os.path.exists(report["report_file"]):
             os.remove(report["report_file"])
+        
+        pdf_cache.invalidate(eeg_id)
+        delete_pyramid(eeg_id)
             
         # Delete from database
         eeg_reports_collection.delete_one({"eeg_id": eeg_id})
         
+        # Then drop the record's references to its upload and rendered PDF; blobs
+        # shared with other records stay until their last reference goes
+        if report.get("file_path"):
+            delete_file(report["file_path"])
+        if report.get("report_pdf_key"):
+            blob_store.release(report["report_pdf_key"])
+        
         return jsonify({"message": "Report deleted successfully"})
         
     except Exception as e:
@@ -1,11 +1,13 @@
-from flask import Blueprint, request, jsonify, send_file, g
+from flask import Blueprint, Response, request, jsonify, g, stream_with_context
 import logging
+import zipfile
 from datetime import datetime
 from app.database.database import eeg_reports_collection
 from app.utils.auth import login_required, doctor_required
-from app.models.llm_report_generator import generate_pdf_report as regenerate_report
+from app.inference.client import inference
+from app.models.llm_report_generator import eeg_case_from_record
+from app.utils.pdf_renderer import pdf_cache
 import json
-import os
 from bson import ObjectId
 
 # Set up logging
@@ -15,6 +17,50 @@ logger = logging.getLogger(__name__)
 # Create blueprint
 router = Blueprint('reports', __name__, url_prefix='/api/reports')
 
+# Fields needed to build an export, so bulk exports never load whole documents
+EXPORT_PROJECTION = {
+    "_id": 0,
+    "eeg_id": 1,
+    "patient": 1,
+    "result": 1,
+    "confidence": 1,
+    "report": 1,
+    "record_date": 1,
+    "processed_at": 1
+}
+EXPORT_BATCH_SIZE = 100
+
+def report_export_data(report):
+    """Build the JSON export of a completed report"""
+    processed_at = report.get("processed_at") or datetime.now()
+    return {
+        "eeg_id": report["eeg_id"],
+        "patient": report["patient"],
+        "result": report["result"],
+        "confidence": report["confidence"],
+        "report_text": report.get("report", "No report available"),
+        "record_date": report["record_date"],
+        "processed_at": processed_at.isoformat(),
+    }
+
+class _ChunkBuffer:
+    """Write-only sink that lets a streaming zip hand back finished bytes"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
 @router.route('/', methods=['GET'])
 @login_required
 def get_all_reports():
@@ -99,22 +145,24 @@ def regenerate_eeg_report():
         if str(eeg_record["doctor_id"]) != str(current_user["_id"]):
             return jsonify({"error": "Access denied"}), 403
             
-        # Regenerate the report
-        new_report = regenerate_report(
-            eeg_data=None,  # We'll pull this from the file
-            result=eeg_record["result"],
-            confidence=eeg_record["confidence"],
-            custom_prompt=data.get("customPrompt")
-        )
+        # Regenerate the report from the stored classification results
+        eeg_case = eeg_case_from_record(eeg_record)
+        eeg_case["custom_prompt"] = data.get("customPrompt")
+        new_report = inference.generate_report(eeg_case)
         
-        # Update the record with the new report
+        # Update the record with the new report; bumping the revision makes
+        # the next PDF download render the new text
         eeg_reports_collection.update_one(
             {"eeg_id": data["eeg_id"]},
-            {"$set": {
-                "report": new_report,
-                "last_updated": datetime.now()
-            }}
+            {
+                "$set": {
+                    "report": new_report,
+                    "last_updated": datetime.now()
+                },
+                "$inc": {"report_revision": 1}
+            }
         )
+        pdf_cache.invalidate(data["eeg_id"])
         
         return jsonify({
             "eeg_id": data["eeg_id"],
@@ -149,35 +197,80 @@ def download_report(eeg_id):
         if report.get("status") != "completed":
             return jsonify({"error": "Cannot download report for unprocessed EEG"}), 400
             
-        # Create a temporary JSON file
-        temp_dir = "temp_reports"
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        file_path = f"{temp_dir}/{eeg_id}_report.json"
-        
-        # Prepare report data
-        report_data = {
-            "eeg_id": report["eeg_id"],
-            "patient": report["patient"],
-            "result": report["result"],
-            "confidence": report["confidence"],
-            "report_text": report.get("report", "No report available"),
-            "record_date": report["record_date"],
-            "processed_at": report.get("processed_at", datetime.now()).isoformat(),
-        }
-        
-        # Write to file
-        with open(file_path, "w") as f:
-            json.dump(report_data, f, indent=2)
-            
-        # Return the file
-        return send_file(
-            file_path,
+        # Serialize straight into the response body
+        body = json.dumps(report_export_data(report), indent=2)
+        
+        return Response(
+            body,
             mimetype='application/json',
-            as_attachment=True,
-            download_name=f"EEG_Report_{eeg_id}.json"
+            headers={"Content-Disposition": f'attachment; filename="EEG_Report_{eeg_id}.json"'}
         )
         
     except Exception as e:
         logger.error(f"Error downloading report {eeg_id}: {str(e)}")
-        return jsonify({"error": f"Error downloading report: {str(e)}"}), 500
\ No newline at end of file
+        return jsonify({"error": f"Error downloading report: {str(e)}"}), 500
+
+@router.route('/export', methods=['GET'])
+@login_required
+def export_reports():
+    """
+    Export every completed report of the current user as NDJSON or a zip archive
+    
+    Query parameters:
+    - format: "ndjson" (default) or "zip"
+    
+    Reports are read from a batched cursor and written to the response one at a
+    time, so memory use does not grow with the size of the caseload.
+    """
+    try:
+        current_user = g.current_user
+        export_format = request.args.get("format", "ndjson").lower()
+        
+        if export_format not in ("ndjson", "zip"):
+            return jsonify({"error": "Unsupported export format. Use 'ndjson' or 'zip'"}), 400
+        
+        # Doctors export their caseload, patients their own reports
+        if current_user.get("is_doctor", False):
+            query = {"doctor_id": current_user["_id"], "status": "completed"}
+        else:
+            query = {"patient_id": str(current_user["_id"]), "status": "completed"}
+        
+        cursor = eeg_reports_collection.find(query, EXPORT_PROJECTION).batch_size(EXPORT_BATCH_SIZE)
+        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+        
+        if export_format == "ndjson":
+            def generate():
+                try:
+                    for report in cursor:
+                        yield json.dumps(report_export_data(report)) + "\n"
+                finally:
+                    cursor.close()
+            
+            return Response(
+                stream_with_context(generate()),
+                mimetype="application/x-ndjson",
+                headers={"Content-Disposition": f'attachment; filename="EEG_Reports_{timestamp}.ndjson"'}
+            )
+        
+        def generate_zip():
+            buffer = _ChunkBuffer()
+            try:
+                with zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_DEFLATED) as archive:
+                    for report in cursor:
+                        data = json.dumps(report_export_data(report), indent=2)
+                        archive.writestr(f"EEG_Report_{report['eeg_id']}.json", data)
+                        yield buffer.drain()
+                # Central directory is written when the archive closes
+                yield buffer.drain()
+            finally:
+                cursor.close()
+        
+        return Response(
+            stream_with_context(generate_zip()),
+            mimetype="application/zip",
+            headers={"Content-Disposition": f'attachment; filename="EEG_Reports_{timestamp}.zip"'}
+        )
+        
+    except Exception as e:
+        logger.error(f"Error exporting reports: {str(e)}")
+        return jsonify({"error": f"Error exporting reports: {str(e)}"}), 500
\ No newline at end of file
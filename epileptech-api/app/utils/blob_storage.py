@@ -0,0 +1,495 @@
+"""
+Content-addressed blob storage for uploaded recordings and rendered reports
+
+Uploads used to go to relative temp_uploads/ paths on the API host that
+received them. Any other instance, or the same one after a restart in a fresh
+container, could not read them, and every duplicate upload was stored again.
+Blobs are now stored under their SHA-256:
+
+    sha256/<first two hex digits>/<hex digest><suffix>
+
+Writing the same bytes twice therefore stores them once. The blobs collection
+counts the references to each key (one per EEG record or report revision that
+points at it). release() drops a reference; a key with no references left is
+deleted once it has been unreferenced for BLOB_GC_GRACE_SECONDS; putting the
+same bytes again before then revives it. Garbage collection claims a key
+before deleting its object; a put() that revives a claimed key waits for the
+claim to end (at most BLOB_GC_LEASE_SECONDS) and then writes the object again
+if it is gone.
+
+Records refer to blobs with "blob://<key>" URIs in their file_path field, so
+the inference service and the reprocessing job resolve them with local_file()
+wherever they run. Plain paths from before the store keep working.
+
+Backends (BLOB_STORE_BACKEND):
+    local  files under BLOB_STORE_DIR (default "blob_store"); use a shared volume for several hosts
+    s3     objects in BLOB_S3_BUCKET under BLOB_S3_PREFIX. BLOB_S3_ENDPOINT_URL points at any
+           S3-compatible server (MinIO, `moto_server`), and "moto://" runs an in-process stand-in
+           (pip install moto) for local runs without a server
+
+Reads and writes stream in BLOB_CHUNK_BYTES chunks, so a recording is never
+held in memory whole.
+"""
+import os
+import re
+import time
+import uuid
+import hashlib
+import logging
+import datetime
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from pymongo import ReturnDocument
+
+from app.database.database import blobs_collection
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BLOB_STORE_BACKEND = os.environ.get("BLOB_STORE_BACKEND", "local").lower()
+BLOB_STORE_DIR = os.environ.get("BLOB_STORE_DIR", "blob_store")
+BLOB_S3_BUCKET = os.environ.get("BLOB_S3_BUCKET", "epileptech")
+BLOB_S3_PREFIX = os.environ.get("BLOB_S3_PREFIX", "")
+BLOB_S3_ENDPOINT_URL = os.environ.get("BLOB_S3_ENDPOINT_URL", "")
+BLOB_CHUNK_BYTES = int(os.environ.get("BLOB_CHUNK_BYTES", str(1024 * 1024)))
+BLOB_GC_GRACE_SECONDS = float(os.environ.get("BLOB_GC_GRACE_SECONDS", str(60 * 60)))
+BLOB_GC_INTERVAL_SECONDS = 60 * 60
+# Longest a garbage collection may hold a key while deleting its object
+BLOB_GC_LEASE_SECONDS = float(os.environ.get("BLOB_GC_LEASE_SECONDS", "60"))
+
+BLOB_URI_PREFIX = "blob://"
+
+_KEY_RE = re.compile(r"^sha256/[0-9a-f]{2}/[0-9a-f]{64}(\.[A-Za-z0-9]{1,8})?$")
+
+
+class BlobNotFound(LookupError):
+    """Raised when a key has no stored object"""
+
+
+def blob_key(digest, suffix=""):
+    """Storage key of content with this SHA-256 hex digest"""
+    return f"sha256/{digest[:2]}/{digest}{suffix}"
+
+
+def _check_key(key):
+    if not _KEY_RE.match(key):
+        raise ValueError(f"Invalid blob key: {key}")
+    return key
+
+
+def blob_uri(key):
+    return f"{BLOB_URI_PREFIX}{key}"
+
+
+def is_blob_uri(value):
+    return isinstance(value, str) and value.startswith(BLOB_URI_PREFIX)
+
+
+def parse_blob_uri(value):
+    """Key of a blob:// URI"""
+    return _check_key(value[len(BLOB_URI_PREFIX):])
+
+
+def _suffix(filename):
+    _, ext = os.path.splitext(filename or "")
+    ext = ext.lower()
+    return ext if re.match(r"^\.[a-z0-9]{1,8}$", ext) else ""
+
+
+def _copy_hashing(stream, target, chunk_bytes=BLOB_CHUNK_BYTES):
+    """Copy a readable stream into an open file, returning (sha256 hex digest, bytes copied)"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_bytes)
+        if not chunk:
+            break
+        digest.update(chunk)
+        target.write(chunk)
+        size += len(chunk)
+    return digest.hexdigest(), size
+
+
+class LocalBlobBackend:
+    """Blobs as files in a directory; temporary files live inside it so publishing is an atomic rename"""
+
+    name = "local"
+
+    def __init__(self, root=BLOB_STORE_DIR):
+        self.root = root
+
+    def path(self, key):
+        return os.path.join(self.root, *_check_key(key).split("/"))
+
+    def staging_dir(self):
+        path = os.path.join(self.root, "tmp")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def exists(self, key):
+        return os.path.exists(self.path(key))
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def write(self, key, source_path):
+        """Publish a finished temporary file under `key` (consumes the file)"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def open(self, key):
+        try:
+            return open(self.path(key), "rb")
+        except FileNotFoundError:
+            raise BlobNotFound(key)
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    @contextmanager
+    def local_path(self, key):
+        if not self.exists(key):
+            raise BlobNotFound(key)
+        yield self.path(key)
+
+
+class S3BlobBackend:
+    """
+    Blobs as objects in an S3-compatible bucket
+
+    Uploads use boto3's managed transfer (multipart for large files), and reads
+    stream the response body. local_path() downloads into a temporary file for
+    readers that need a real path, such as MNE.
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket=BLOB_S3_BUCKET, prefix=BLOB_S3_PREFIX, endpoint_url=BLOB_S3_ENDPOINT_URL, client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.endpoint_url = endpoint_url
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _create_client(self):
+        import boto3
+        if self.endpoint_url.startswith("moto://"):
+            # In-process stand-in for local runs and load tests without an S3 server;
+            # objects live only as long as this process
+            from moto import mock_aws
+            logger.warning("Using an in-memory moto S3 stand-in")
+            mock_aws().start()
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket=self.bucket)
+            return client
+        return boto3.client("s3", endpoint_url=self.endpoint_url or None)
+
+    def object_name(self, key):
+        key = _check_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def staging_dir(self):
+        return tempfile.gettempdir()
+
+    def _head(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_name(key))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        if head is None:
+            raise BlobNotFound(key)
+        return head["ContentLength"]
+
+    def write(self, key, source_path):
+        try:
+            self.client.upload_file(source_path, self.bucket, self.object_name(key))
+        finally:
+            os.remove(source_path)
+
+    def open(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self.object_name(key))["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                raise BlobNotFound(key)
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_name(key))
+        return True
+
+    @contextmanager
+    def local_path(self, key):
+        if not self.exists(key):
+            raise BlobNotFound(key)
+        _, name = key.rsplit("/", 1)
+        path = os.path.join(tempfile.gettempdir(), f"{uuid.uuid4().hex}-{name}")
+        try:
+            self.client.download_file(self.bucket, self.object_name(key), path)
+            yield path
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+BACKENDS = {
+    LocalBlobBackend.name: LocalBlobBackend,
+    S3BlobBackend.name: S3BlobBackend,
+}
+
+
+class BlobStore:
+    """
+    Reference-counted, content-addressed store on top of a backend
+
+    Every put() or acquire() adds one reference that the caller must give back
+    with release() when the record pointing at the key goes away.
+    """
+
+    def __init__(self, backend=None, collection=blobs_collection, grace_seconds=BLOB_GC_GRACE_SECONDS):
+        self.backend = backend or self._default_backend()
+        self.collection = collection
+        self.grace_seconds = grace_seconds
+        self._last_gc = time.time()
+
+    @staticmethod
+    def _default_backend():
+        if BLOB_STORE_BACKEND not in BACKENDS:
+            raise ValueError(f"Unknown BLOB_STORE_BACKEND {BLOB_STORE_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+        return BACKENDS[BLOB_STORE_BACKEND]()
+
+    def put(self, stream, filename=None, content_type=None):
+        """
+        Store a stream and take a reference to it
+
+        Args:
+            stream: Readable binary file object, consumed in chunks
+            filename: Original file name; its extension is kept on the key
+            content_type: MIME type recorded with the blob
+
+        Returns:
+            key: Content-addressed storage key
+        """
+        fd, tmp_path = tempfile.mkstemp(suffix=".part", dir=self.backend.staging_dir())
+        try:
+            with os.fdopen(fd, "wb") as f:
+                digest, size = _copy_hashing(stream, f)
+            key = blob_key(digest, _suffix(filename))
+            document = self.collection.find_one_and_update(
+                {"_id": key},
+                {
+                    "$inc": {"refs": 1},
+                    "$unset": {"released_at": ""},
+                    "$setOnInsert": {"size": size, "content_type": content_type, "created_at": datetime.datetime.utcnow()},
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            # A collection that claimed the key before this reference may still
+            # delete the object; let it finish, then check for the object
+            if document.get("gc_started_at"):
+                self._wait_for_collection(key)
+            # Publish after the reference is counted, so a later cleanup cannot delete it
+            if self.backend.exists(key):
+                logger.info(f"Blob {key} already stored; deduplicated {size} bytes")
+            else:
+                self.backend.write(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if time.time() - self._last_gc > BLOB_GC_INTERVAL_SECONDS:
+            try:
+                self.collect_garbage()
+            except Exception as e:
+                logger.warning(f"Blob cleanup failed: {str(e)}")
+        return key
+
+    def put_bytes(self, data, filename=None, content_type=None):
+        import io
+        return self.put(io.BytesIO(data), filename, content_type)
+
+    def _wait_for_collection(self, key):
+        """Wait until no garbage collection holds an unexpired claim on key"""
+        deadline = time.time() + BLOB_GC_LEASE_SECONDS
+        while time.time() < deadline:
+            lease_cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=BLOB_GC_LEASE_SECONDS)
+            if not self.collection.count_documents({"_id": key, "gc_started_at": {"$gte": lease_cutoff}}, limit=1):
+                return
+            time.sleep(0.1)
+
+    def acquire(self, key):
+        """Take another reference to a stored key"""
+        # A key being collected counts as gone: its object may already be deleted
+        result = self.collection.update_one(
+            {"_id": _check_key(key), "gc_started_at": {"$exists": False}},
+            {"$inc": {"refs": 1}, "$unset": {"released_at": ""}}
+        )
+        if not result.matched_count:
+            raise BlobNotFound(key)
+
+    def release(self, key):
+        """
+        Drop one reference; a key left without references is deleted after the grace period
+
+        Returns:
+            refs: References left
+        """
+        document = self.collection.find_one_and_update(
+            {"_id": _check_key(key), "refs": {"$gt": 0}},
+            {"$inc": {"refs": -1}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            logger.warning(f"Released blob {key} that had no references")
+            return 0
+        if document["refs"] == 0:
+            self.collection.update_one({"_id": key, "refs": 0}, {"$set": {"released_at": datetime.datetime.utcnow()}})
+        return document["refs"]
+
+    def collect_garbage(self, grace_seconds=None):
+        """
+        Delete the objects of keys that have had no references for grace_seconds
+
+        Each key is claimed before its object is deleted, and its document is
+        only removed afterwards if it is still unreferenced. A put() that
+        revived the key in between waits for the claim to end and writes the
+        object again.
+
+        Returns:
+            removed: Number of blobs deleted
+        """
+        grace_seconds = self.grace_seconds if grace_seconds is None else grace_seconds
+        self._last_gc = time.time()
+        now = datetime.datetime.utcnow()
+        cutoff = now - datetime.timedelta(seconds=grace_seconds)
+        lease_cutoff = now - datetime.timedelta(seconds=BLOB_GC_LEASE_SECONDS)
+        removed = 0
+        for document in self.collection.find({"refs": {"$lte": 0}, "released_at": {"$lte": cutoff}}, {"_id": 1}):
+            key = document["_id"]
+            # BSON dates keep milliseconds; the claim is matched by exact value later
+            started = datetime.datetime.utcnow()
+            started = started.replace(microsecond=started.microsecond // 1000 * 1000)
+            # Only claim if nothing took a reference in the meantime and no other collection holds it
+            claimed = self.collection.update_one(
+                {"_id": key, "refs": {"$lte": 0},
+                 "$or": [{"gc_started_at": {"$exists": False}}, {"gc_started_at": {"$lt": lease_cutoff}}]},
+                {"$set": {"gc_started_at": started}},
+            )
+            if not claimed.modified_count:
+                continue
+            try:
+                self.backend.delete(key)
+            except Exception:
+                self._release_claim(key, started)
+                raise
+            if not self.collection.delete_one({"_id": key, "refs": {"$lte": 0}, "gc_started_at": started}).deleted_count:
+                # Revived while the object was deleted; let the waiting put() write it again
+                self._release_claim(key, started)
+            removed += 1
+        if removed:
+            logger.info(f"Removed {removed} unreferenced blobs")
+        return removed
+
+    def _release_claim(self, key, started):
+        self.collection.update_one({"_id": key, "gc_started_at": started}, {"$unset": {"gc_started_at": ""}})
+
+    def size(self, key):
+        return self.backend.size(key)
+
+    def open(self, key):
+        """Readable binary stream of a blob"""
+        return self.backend.open(key)
+
+    def iter_chunks(self, key, chunk_bytes=BLOB_CHUNK_BYTES):
+        stream = self.open(key)
+        try:
+            while True:
+                chunk = stream.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            stream.close()
+
+    def read(self, key):
+        stream = self.open(key)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
+    def local_path(self, key):
+        """Context manager yielding a filesystem path holding the blob"""
+        return self.backend.local_path(key)
+
+
+blob_store = BlobStore()
+
+
+@contextmanager
+def local_file(file_ref):
+    """
+    Yield a filesystem path for a record's file_path, which may be a blob:// URI
+
+    Args:
+        file_ref: blob:// URI or a plain path from before the blob store
+
+    Returns:
+        Context manager yielding the path
+    """
+    if is_blob_uri(file_ref):
+        with blob_store.local_path(parse_blob_uri(file_ref)) as path:
+            yield path
+    else:
+        yield file_ref
+
+
+def delete_file(file_ref):
+    """Drop a record's reference to its file, or remove a plain path from before the blob store"""
+    if is_blob_uri(file_ref):
+        blob_store.release(parse_blob_uri(file_ref))
+    elif file_ref and os.path.exists(file_ref):
+        os.remove(file_ref)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Delete unreferenced blobs")
+    parser.add_argument("--grace-seconds", type=float, default=BLOB_GC_GRACE_SECONDS,
+                        help="Only delete blobs unreferenced for at least this long")
+    args = parser.parse_args()
+    print(f"Removed {blob_store.collect_garbage(args.grace_seconds)} unreferenced blobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache configuration
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", "512"))
+CHAT_CACHE_TTL_SECONDS = float(os.environ.get("CHAT_CACHE_TTL_SECONDS", str(60 * 60 * 24)))
+# Jaccard similarity over character trigrams above which two questions with
+# the same content words are treated as the same question. 0 (the default)
+# only reuses replies for exactly the same normalized message: a one-word
+# difference ("can" / "can't", "child" / "adult") can change the right answer.
+CHAT_CACHE_SIMILARITY = float(os.environ.get("CHAT_CACHE_SIMILARITY", "0"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+
+# Words that never change what is being asked; negations, modals and question
+# words are deliberately not in the list
+_FILLER_WORDS = frozenset(("a", "an", "the", "please", "i", "me", "my", "it", "its", "is", "are", "do", "does"))
+
+
+def normalize_message(message):
+    """
+    Normalize a chat message so trivially different phrasings share a cache key
+
+    Args:
+        message: Raw user message
+
+    Returns:
+        normalized: Lower-cased message with punctuation and repeated whitespace removed
+    """
+    normalized = _PUNCTUATION_RE.sub(" ", message.lower())
+    return _WHITESPACE_RE.sub(" ", normalized).strip()
+
+
+def content_words(normalized):
+    """Words of a normalized message that near-duplicate matches must share exactly"""
+    return frozenset(word for word in normalized.split() if word not in _FILLER_WORDS)
+
+
+def _trigrams(text):
+    padded = f"  {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def _jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class _InFlight:
+    """Result slot shared by all callers waiting on the same upstream request"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        # Set when the leader failed for its own reasons; waiters then try themselves
+        self.retry = False
+
+
+class ChatResponseCache:
+    """
+    Thread-safe LRU cache of chatbot replies with TTL expiry
+
+    Entries are keyed by (persona, normalized message). With similarity > 0,
+    lookups fall back to a trigram similarity scan over entries of the same
+    persona with the same content words when no exact key exists. Concurrent
+    misses on the same key are coalesced into a single upstream call.
+    """
+
+    def __init__(self, max_entries=CHAT_CACHE_MAX_ENTRIES, ttl=CHAT_CACHE_TTL_SECONDS,
+                 similarity=CHAT_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries = OrderedDict()  # key -> (expires_at, reply, trigrams, content words)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _evict_expired(self, now):
+        expired = [key for key, (expires_at, _, _, _) in self._entries.items() if expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def _lookup(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._entries.move_to_end(key)
+                return entry[1]
+            del self._entries[key]
+
+        if self.similarity <= 0:
+            return None
+
+        persona, normalized = key
+        grams = _trigrams(normalized)
+        words = content_words(normalized)
+        best_key, best_score = None, self.similarity
+        for other_key, (expires_at, _, other_grams, other_words) in self._entries.items():
+            if other_key[0] != persona or expires_at <= now or other_words != words:
+                continue
+            score = _jaccard(grams, other_grams)
+            if score >= best_score:
+                best_key, best_score = other_key, score
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key][1]
+
+    def get(self, message, persona):
+        """Return a cached reply for the message, or None"""
+        key = (persona, normalize_message(message))
+        with self._lock:
+            return self._lookup(key, time.monotonic())
+
+    def set(self, message, persona, reply):
+        """Store a reply, evicting the least recently used entry when full"""
+        normalized = normalize_message(message)
+        key = (persona, normalized)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + self.ttl, reply, _trigrams(normalized), content_words(normalized))
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._evict_expired(now)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, message, persona, compute, unshared_errors=()):
+        """
+        Return a cached reply or compute it, coalescing concurrent identical requests
+
+        Args:
+            message: Raw user message
+            persona: Persona identifier (e.g. "doctor" or "patient")
+            compute: Zero-argument callable producing the reply on a miss
+            unshared_errors: Exception types that concern only the caller that
+                raised them, such as a per-client rate limit rejection. They
+                are not passed on to waiting callers; one of those becomes
+                the new leader and calls its own compute instead.
+
+        Returns:
+            reply: Cached or freshly computed reply text
+        """
+        key = (persona, normalize_message(message))
+        counted = False
+
+        while True:
+            with self._lock:
+                reply = self._lookup(key, time.monotonic())
+                if reply is not None:
+                    self.hits += 1
+                    return reply
+                if not counted:
+                    self.misses += 1
+                    counted = True
+                slot = self._in_flight.get(key)
+                leader = slot is None
+                if leader:
+                    slot = _InFlight()
+                    self._in_flight[key] = slot
+
+            if leader:
+                break
+            slot.event.wait()
+            if slot.retry:
+                continue
+            if slot.error is not None:
+                raise slot.error
+            return slot.value
+
+        try:
+            slot.value = compute()
+            if slot.value:
+                self.set(message, persona, slot.value)
+            return slot.value
+        except unshared_errors:
+            slot.retry = True
+            raise
+        except Exception as e:
+            slot.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            slot.event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+            }
+
+
+# Shared cache used by the chatbot router
+chat_cache = ChatResponseCache()
@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Conversation history configuration
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", "2000"))
+CHAT_SESSION_TTL_SECONDS = float(os.environ.get("CHAT_SESSION_TTL_SECONDS", str(60 * 60)))
+CHAT_MAX_SESSIONS = int(os.environ.get("CHAT_MAX_SESSIONS", "5000"))
+
+# Upstream concurrency limits
+CHAT_MAX_CONCURRENT_PER_USER = int(os.environ.get("CHAT_MAX_CONCURRENT_PER_USER", "2"))
+CHAT_MAX_CONCURRENT_TOTAL = int(os.environ.get("CHAT_MAX_CONCURRENT_TOTAL", "16"))
+
+
+def estimate_tokens(text):
+    """
+    Cheaply estimate the number of tokens in a piece of text
+
+    Uses the usual ~4 characters per token heuristic for English text, which is
+    accurate enough for budgeting without loading a tokenizer.
+    """
+    return max(1, len(text) // 4) + 4  # +4 for per-message role overhead
+
+
+def trim_to_budget(messages, budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """
+    Drop the oldest turns until the conversation fits the token budget
+
+    Args:
+        messages: List of {"role", "content"} dicts, oldest first
+        budget: Maximum estimated tokens to keep
+
+    Returns:
+        trimmed: The most recent messages that fit, always keeping the last one
+    """
+    trimmed = []
+    used = 0
+    for message in reversed(messages):
+        cost = estimate_tokens(message["content"])
+        if trimmed and used + cost > budget:
+            break
+        trimmed.append(message)
+        used += cost
+    trimmed.reverse()
+
+    # Never start the history with a dangling assistant reply
+    while len(trimmed) > 1 and trimmed[0]["role"] == "assistant":
+        trimmed.pop(0)
+    return trimmed
+
+
+class ConversationStore:
+    """
+    In-process store of per-session chat history
+
+    Sessions expire after a period of inactivity and the least recently used
+    sessions are dropped once the store is full.
+    """
+
+    def __init__(self, budget=CHAT_HISTORY_TOKEN_BUDGET, ttl=CHAT_SESSION_TTL_SECONDS,
+                 max_sessions=CHAT_MAX_SESSIONS):
+        self.budget = budget
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session_id -> (last_seen, messages)
+        self._lock = threading.Lock()
+
+    def history(self, session_id):
+        """Return a copy of the session's history, trimmed to the token budget"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None or now - entry[0] > self.ttl:
+                self._sessions.pop(session_id, None)
+                return []
+            return list(entry[1])
+
+    def append(self, session_id, user_message, reply):
+        """Record a completed exchange and re-trim the session"""
+        now = time.monotonic()
+        with self._lock:
+            _, messages = self._sessions.pop(session_id, (now, []))
+            messages = messages + [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": reply},
+            ]
+            self._sessions[session_id] = (now, trim_to_budget(messages, self.budget))
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def reset(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+
+class UpstreamLimiter:
+    """
+    Caps concurrent upstream LLM calls, per user and across the process
+
+    Acquisition never blocks: callers that would exceed a limit are rejected so
+    that chat traffic cannot tie up worker threads needed by other routes.
+    """
+
+    def __init__(self, per_user=CHAT_MAX_CONCURRENT_PER_USER, total=CHAT_MAX_CONCURRENT_TOTAL):
+        self.per_user = per_user
+        self.total = total
+        self._active = {}
+        self._active_total = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, user_key):
+        """Reserve an upstream slot for the user, returning False if none is free"""
+        with self._lock:
+            if self._active_total >= self.total:
+                return False
+            if self._active.get(user_key, 0) >= self.per_user:
+                return False
+            self._active[user_key] = self._active.get(user_key, 0) + 1
+            self._active_total += 1
+            return True
+
+    def release(self, user_key):
+        with self._lock:
+            count = self._active.get(user_key, 0) - 1
+            if count > 0:
+                self._active[user_key] = count
+            else:
+                self._active.pop(user_key, None)
+            self._active_total = max(0, self._active_total - 1)
+
+
+# Shared instances used by the chatbot router
+conversation_store = ConversationStore()
+upstream_limiter = UpstreamLimiter()
@@ -0,0 +1,263 @@
+"""
+CPU thread budget for worker processes
+
+torch, the BLAS library behind NumPy/SciPy/MNE (MKL or OpenBLAS) and numexpr
+each start one thread per core by default. With several worker processes on
+one host, that means workers x cores runnable threads preempting each other,
+and throughput collapses under load. The governor gives each worker process a
+fixed share of the host instead:
+
+    CPU_BUDGET_ENABLED    "true" (default) or "false"
+    CPU_WORKER_PROCESSES  worker processes sharing the host (default WEB_CONCURRENCY or 1)
+    CPU_THREAD_BUDGET     threads per worker process (default usable cores / workers)
+    CPU_INTEROP_THREADS   torch inter-op threads (default 1)
+    CPU_AFFINITY          "none" (default); "auto", which pins worker CPU_WORKER_INDEX
+                          to its own slice of cores; or a list such as "0-3,8-11"
+    CPU_WORKER_INDEX      index of this worker for CPU_AFFINITY=auto
+
+Every concurrent CPU job in a worker (CPU_WORKERS in the API,
+INFERENCE_MAX_CONCURRENCY in the inference service) runs its own torch and
+OpenMP thread team. Each pool therefore gets budget // concurrent jobs threads.
+When SHADOW_MODELS is set, the shadow model worker (app.models.shadow) is
+counted as one more job.
+
+Most libraries read their thread count from the environment when they load, so
+apply_process_budget() must run before NumPy or torch is imported. serve.py
+and the inference service call it first thing, and a gunicorn post_fork hook
+can call it with the worker's index. Pools that were already loaded are
+limited through threadpoolctl, and configure_torch() applies the torch
+settings when the model loads.
+
+The budget and the measured contention (live threads, time spent running vs.
+waiting for a core, involuntary context switches) are exported as metrics.
+"""
+import os
+import sys
+import glob
+import logging
+
+from app.utils.metrics import gauge
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CPU_BUDGET_ENABLED = os.environ.get("CPU_BUDGET_ENABLED", "True").lower() == "true"
+CPU_WORKER_PROCESSES = int(os.environ.get("CPU_WORKER_PROCESSES", os.environ.get("WEB_CONCURRENCY", "1")))
+CPU_THREAD_BUDGET = int(os.environ.get("CPU_THREAD_BUDGET", "0"))
+CPU_INTEROP_THREADS = int(os.environ.get("CPU_INTEROP_THREADS", "1"))
+CPU_AFFINITY = os.environ.get("CPU_AFFINITY", "none").lower()
+# The shadow model worker runs torch next to the request jobs
+SHADOW_JOBS = 1 if os.environ.get("SHADOW_MODELS", "").strip() else 0
+
+# Read by OpenMP (torch, MKL), OpenBLAS, BLIS, Accelerate and numexpr when they load
+THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "BLIS_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS", "NUMEXPR_MAX_THREADS",
+)
+
+_budget = None
+_torch_configured = False
+
+
+def usable_cpus():
+    """Cores this process may run on"""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def parse_cpu_list(spec):
+    """Parse a cpuset list such as "0-3,8,10-11" into sorted core ids"""
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.update(range(int(first), int(last) + 1))
+        else:
+            cpus.add(int(part))
+    return sorted(cpus)
+
+
+def compute_budget(workers=None, worker_index=None, concurrent_jobs=1, cpus=None):
+    """
+    Work out the thread budget of one worker process
+
+    Args:
+        workers: Worker processes sharing the host, defaults to CPU_WORKER_PROCESSES
+        worker_index: This worker's index, used by CPU_AFFINITY=auto
+        concurrent_jobs: CPU-bound jobs this worker runs at once, not counting
+            the shadow model worker, which is added when enabled
+        cpus: Usable core ids, defaults to the current affinity mask
+
+    Returns:
+        budget: Dictionary with the per-pool thread counts and the affinity (or None)
+    """
+    cpus = cpus or usable_cpus()
+    workers = max(1, workers or CPU_WORKER_PROCESSES)
+    threads = CPU_THREAD_BUDGET or max(1, len(cpus) // workers)
+
+    affinity = None
+    if CPU_AFFINITY == "auto":
+        if worker_index is not None:
+            # Consecutive slices; more workers than cores wrap around and share
+            start = (worker_index % workers) * threads
+            affinity = sorted({cpus[(start + offset) % len(cpus)] for offset in range(threads)})
+    elif CPU_AFFINITY not in ("", "none"):
+        affinity = parse_cpu_list(CPU_AFFINITY)
+        if not CPU_THREAD_BUDGET:
+            threads = len(affinity)
+
+    concurrent_jobs = max(1, concurrent_jobs) + SHADOW_JOBS
+    return {
+        "workers": workers,
+        "worker_index": worker_index,
+        "usable_cpus": len(cpus),
+        "threads": threads,
+        "concurrent_jobs": concurrent_jobs,
+        "threads_per_job": max(1, threads // concurrent_jobs),
+        "torch_inter_op": CPU_INTEROP_THREADS,
+        "affinity": affinity,
+    }
+
+
+def _limit_loaded_pools(threads):
+    # Libraries loaded before the budget was applied ignore the environment
+    if not any(name in sys.modules for name in ("numpy", "scipy", "torch", "numexpr")):
+        return
+    try:
+        from threadpoolctl import threadpool_limits
+    except ImportError:
+        logger.warning("NumPy was imported before the CPU budget and threadpoolctl is not installed; "
+                       "BLAS keeps its default thread count")
+        return
+    threadpool_limits(limits=threads)
+
+
+def apply_process_budget(worker_index=None, concurrent_jobs=1, workers=None):
+    """
+    Apply the thread budget to this process
+
+    Sets the thread environment variables, pins the affinity if configured and
+    limits any pools that are already loaded. Call it before importing NumPy or torch.
+
+    Args:
+        worker_index: Defaults to CPU_WORKER_INDEX
+        concurrent_jobs: CPU-bound jobs that run at once in this process
+        workers: Defaults to CPU_WORKER_PROCESSES
+
+    Returns:
+        budget: As compute_budget(), or None when CPU_BUDGET_ENABLED is false
+    """
+    global _budget
+    if not CPU_BUDGET_ENABLED:
+        return None
+    if worker_index is None and os.environ.get("CPU_WORKER_INDEX"):
+        worker_index = int(os.environ["CPU_WORKER_INDEX"])
+
+    budget = compute_budget(workers, worker_index, concurrent_jobs)
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(budget["threads_per_job"])
+
+    if budget["affinity"]:
+        try:
+            os.sched_setaffinity(0, budget["affinity"])
+        except (AttributeError, OSError) as e:
+            logger.warning(f"Could not pin CPU affinity to {budget['affinity']}: {str(e)}")
+            budget["affinity"] = None
+
+    _limit_loaded_pools(budget["threads_per_job"])
+    _budget = budget
+    if "torch" in sys.modules:
+        configure_torch()
+    logger.info(
+        f"CPU budget: {budget['threads']} threads for worker {budget['worker_index']} of {budget['workers']} "
+        f"on {budget['usable_cpus']} cores, {budget['threads_per_job']} per job x {budget['concurrent_jobs']} jobs"
+        + (f", pinned to {budget['affinity']}" if budget["affinity"] else "")
+    )
+    return budget
+
+
+def ensure_process_budget(concurrent_jobs=1):
+    """Apply the budget unless an entry point already did"""
+    return _budget if _budget is not None else apply_process_budget(concurrent_jobs=concurrent_jobs)
+
+
+def current_budget():
+    return _budget
+
+
+def configure_torch():
+    """Set torch's intra-op and inter-op thread counts from the budget, once per process"""
+    global _torch_configured
+    if _budget is None or _torch_configured:
+        return
+    import torch
+    torch.set_num_threads(_budget["threads_per_job"])
+    try:
+        torch.set_num_interop_threads(_budget["torch_inter_op"])
+    except RuntimeError as e:
+        # Only possible before torch has started any parallel work
+        logger.warning(f"Could not set torch inter-op threads: {str(e)}")
+    _torch_configured = True
+
+
+def task_stats():
+    """(live threads, seconds on CPU, seconds runnable but waiting, involuntary switches) over all threads"""
+    threads = 0
+    running_ns = waiting_ns = 0
+    involuntary = 0
+    for task in glob.glob("/proc/self/task/*"):
+        try:
+            with open(os.path.join(task, "schedstat")) as f:
+                fields = f.read().split()
+            running_ns += int(fields[0])
+            waiting_ns += int(fields[1])
+            with open(os.path.join(task, "status")) as f:
+                for line in f:
+                    if line.startswith("nonvoluntary_ctxt_switches:"):
+                        involuntary += int(line.split()[1])
+        except (OSError, IndexError, ValueError):
+            # The thread exited while being read
+            continue
+        threads += 1
+    return threads, running_ns / 1e9, waiting_ns / 1e9, involuntary
+
+
+def _budget_values():
+    values = {}
+    if _budget is not None:
+        values[("process",)] = _budget["threads"]
+        values[("per_job",)] = _budget["threads_per_job"]
+        values[("torch_inter_op",)] = _budget["torch_inter_op"]
+        values[("affinity_cores",)] = len(_budget["affinity"] or usable_cpus())
+    if "torch" in sys.modules:
+        torch = sys.modules["torch"]
+        values[("torch_intra_op",)] = torch.get_num_threads()
+    return values
+
+
+def _cpu_seconds():
+    _, running, waiting, _ = task_stats()
+    return {("running",): running, ("waiting",): waiting}
+
+
+cpu_thread_budget = gauge(
+    "epileptech_cpu_thread_budget", "Threads assigned by the CPU budget governor", ("pool",), callback=_budget_values
+)
+process_threads = gauge(
+    "epileptech_process_threads", "Live OS threads in this process", callback=lambda: task_stats()[0]
+)
+cpu_task_seconds = gauge(
+    "epileptech_cpu_task_seconds",
+    "Cumulative seconds live threads spent on a core (running) or runnable without one (waiting)",
+    ("state",), callback=_cpu_seconds,
+)
+involuntary_context_switches = gauge(
+    "epileptech_cpu_involuntary_context_switches",
+    "Cumulative involuntary context switches of live threads", callback=lambda: task_stats()[3],
+)
@@ -0,0 +1,567 @@
+"""
+Lossless compressed archive format for processed EDF recordings (.eegz)
+
+EDF stores every signal as little-endian int16 samples in fixed-length data
+records. Neighbouring EEG samples are strongly correlated, so the archive
+keeps those digital samples and codes them the way FLAC does:
+
+1. Prediction. Each block (one signal over one chunk) takes the fixed
+   polynomial predictor of order 0, 1 or 2 with the smallest residuals,
+   i.e. the samples themselves, their first or their second difference.
+2. Entropy coding. Residuals are zigzag-mapped to unsigned values and Rice
+   coded with the block's best parameter k. Unary quotients and k-bit
+   remainders go into two separate bitstreams so both directions are plain
+   NumPy array operations. Annotation signals (EDF+ text) are zlib-compressed,
+   and a block that would grow is stored raw.
+
+Chunks cover ARCHIVE_CHUNK_SECONDS of whole data records and are indexed, so
+reading a time range decodes only the chunks it overlaps. The original EDF
+header is kept verbatim, and the original file can be restored byte for byte
+(restore() checks its SHA-256).
+
+Layout (little-endian):
+
+    "EEGZ" | u16 version | u32 n | n bytes of JSON metadata (EDF header, chunk size)
+    chunk payloads, each a sequence of (u32 length, block) per signal
+    index: per chunk u64 offset, u32 length, u32 first record, u32 records, u32 crc32
+    trailer JSON (source size and SHA-256, bytes after the last full record)
+    footer: u64 index offset, u32 chunks, u32 trailer length, "EEGZ"
+
+open_raw() is what process_eeg_file uses. It returns an ArchiveRaw with the
+part of mne.io.Raw that read_raw_signal needs for archives, and falls back
+to MNE for plain EDF files.
+
+Usage (from the epileptech-api directory):
+    python -m app.utils.eeg_archive pack recording.edf recording.eegz
+    python -m app.utils.eeg_archive unpack recording.eegz restored.edf
+    python -m app.utils.eeg_archive info recording.eegz
+"""
+import io
+import os
+import json
+import zlib
+import base64
+import struct
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ARCHIVE_CHUNK_SECONDS = float(os.environ.get("ARCHIVE_CHUNK_SECONDS", "10"))
+
+MAGIC = b"EEGZ"
+FORMAT_VERSION = 1
+ARCHIVE_SUFFIX = ".eegz"
+
+_PREFIX = struct.Struct("<4sHI")
+_FOOTER = struct.Struct("<QII4s")
+_INDEX_DTYPE = np.dtype([
+    ("offset", "<u8"), ("length", "<u4"), ("first_record", "<u4"), ("n_records", "<u4"), ("crc32", "<u4"),
+])
+_BLOCK_HEADER = struct.Struct("<BBBI")
+_LENGTH = struct.Struct("<I")
+
+CODEC_RAW = 0
+CODEC_RICE = 1
+CODEC_ZLIB = 2
+
+PREDICTOR_ORDERS = (0, 1, 2)
+ANNOTATION_LABEL = "EDF Annotations"
+# MNE scales physical values to volts by the EDF physical dimension
+_UNIT_SCALES = {"uV": 1e-6, "\xb5V": 1e-6, "mV": 1e-3, "nV": 1e-9}
+
+
+# ---------------------------------------------------------------- EDF header
+
+def read_edf_header(f):
+    """
+    Read and parse the header of an EDF file
+
+    Args:
+        f: Binary file positioned at the start of the file
+
+    Returns:
+        header: {"raw", "record_duration", "signals"}; each signal has label, unit,
+            physical/digital min/max, samples per record and an annotation flag
+    """
+    fixed = f.read(256)
+    if len(fixed) < 256 or fixed[:1] == b"\xff":
+        raise ValueError("Not an EDF file (BDF and other formats are not archived)")
+    try:
+        n_signals = int(fixed[252:256].decode("ascii").strip())
+        record_duration = float(fixed[244:252].decode("ascii").strip() or 0)
+    except ValueError:
+        raise ValueError("Not an EDF file: unreadable header")
+    rest = f.read(256 * n_signals)
+    if n_signals <= 0 or len(rest) < 256 * n_signals:
+        raise ValueError("Not an EDF file: truncated header")
+    return {"raw": fixed + rest, **parse_signal_headers(rest, n_signals), "record_duration": record_duration}
+
+
+def parse_signal_headers(rest, n_signals):
+    """Split the per-signal header fields (each stored for all signals in turn)"""
+    widths = (("label", 16), ("transducer", 80), ("unit", 8), ("physical_min", 8), ("physical_max", 8),
+              ("digital_min", 8), ("digital_max", 8), ("prefilter", 80), ("samples", 8), ("reserved", 32))
+    fields = {}
+    position = 0
+    for name, width in widths:
+        fields[name] = [rest[position + i * width:position + (i + 1) * width].decode("latin-1").strip()
+                        for i in range(n_signals)]
+        position += n_signals * width
+
+    signals = []
+    for i in range(n_signals):
+        signals.append({
+            "label": fields["label"][i],
+            "unit": fields["unit"][i],
+            "physical_min": float(fields["physical_min"][i]),
+            "physical_max": float(fields["physical_max"][i]),
+            "digital_min": float(fields["digital_min"][i]),
+            "digital_max": float(fields["digital_max"][i]),
+            "samples": int(fields["samples"][i]),
+            "annotation": fields["label"][i] == ANNOTATION_LABEL,
+        })
+    return {"signals": signals}
+
+
+def is_archive(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+# ---------------------------------------------------------------- block codec
+
+def _zigzag(values):
+    return (values << 1) ^ (values >> 63)
+
+
+def _unzigzag(values):
+    return (values >> 1) ^ -(values & 1)
+
+
+def _rice_parameter(unsigned):
+    """Rice parameter k with the fewest total bits, searched around log2 of the mean"""
+    if not len(unsigned):
+        return 0
+    guess = int(np.log2(unsigned.mean() + 1))
+    candidates = range(max(0, guess - 2), min(guess + 3, 31))
+    return min(candidates, key=lambda k: int((unsigned >> k).sum()) + len(unsigned) * (k + 1))
+
+
+def _integrate(residual, warmup, order):
+    """Invert np.diff(x, order) given the first `order` samples"""
+    values = residual
+    for k in reversed(range(order)):
+        head = np.diff(warmup, k)[0]
+        values = np.concatenate(([head], head + np.cumsum(values)))
+    return values
+
+
+def encode_block(samples, codec=CODEC_RICE):
+    """
+    Encode one signal's int16 samples
+
+    Args:
+        samples: 1-D int16 array
+        codec: CODEC_RICE for signal data, CODEC_ZLIB for annotation text
+
+    Returns:
+        block: Encoded bytes, self-describing
+    """
+    samples = np.ascontiguousarray(samples, dtype="<i2")
+    n = len(samples)
+    raw = _BLOCK_HEADER.pack(CODEC_RAW, 0, 0, n) + samples.tobytes()
+    if codec == CODEC_ZLIB:
+        packed = _BLOCK_HEADER.pack(CODEC_ZLIB, 0, 0, n) + zlib.compress(samples.tobytes(), 9)
+        return packed if len(packed) < len(raw) else raw
+
+    x = samples.astype(np.int64)
+    residuals = {order: np.diff(x, order) for order in PREDICTOR_ORDERS if order <= n}
+    order = min(residuals, key=lambda p: int(np.abs(residuals[p]).sum()))
+    unsigned = _zigzag(residuals[order])
+    k = _rice_parameter(unsigned)
+
+    # Unary quotients: q one-bits and a terminating zero per residual
+    quotients = unsigned >> k
+    bits = np.ones(int(quotients.sum()) + len(quotients), dtype=np.uint8)
+    bits[np.cumsum(quotients + 1) - 1] = 0
+    unary = np.packbits(bits).tobytes()
+    # Remainders: k bits per residual, most significant first
+    if k:
+        shifts = np.arange(k - 1, -1, -1)
+        remainder_bits = ((unsigned & ((1 << k) - 1))[:, None] >> shifts) & 1
+        remainders = np.packbits(remainder_bits.astype(np.uint8)).tobytes()
+    else:
+        remainders = b""
+
+    packed = b"".join((
+        _BLOCK_HEADER.pack(CODEC_RICE, order, k, n),
+        struct.pack(f"<{order}i", *x[:order].tolist()),
+        _LENGTH.pack(len(unary)),
+        unary,
+        remainders,
+    ))
+    return packed if len(packed) < len(raw) else raw
+
+
+def decode_block(block):
+    """Decode encode_block() output back to the int16 samples"""
+    codec, order, k, n = _BLOCK_HEADER.unpack_from(block, 0)
+    position = _BLOCK_HEADER.size
+    if codec == CODEC_RAW:
+        return np.frombuffer(block, dtype="<i2", count=n, offset=position)
+    if codec == CODEC_ZLIB:
+        return np.frombuffer(zlib.decompress(block[position:]), dtype="<i2", count=n)
+    if codec != CODEC_RICE:
+        raise ValueError(f"Unknown block codec {codec}")
+
+    warmup = np.array(struct.unpack_from(f"<{order}i", block, position), dtype=np.int64)
+    position += 4 * order
+    (unary_length,) = _LENGTH.unpack_from(block, position)
+    position += _LENGTH.size
+    count = n - order
+
+    bits = np.unpackbits(np.frombuffer(block, dtype=np.uint8, count=unary_length, offset=position))
+    position += unary_length
+    # Padding after the last code is zeros too, so only the first `count` terminators count
+    terminators = np.flatnonzero(bits == 0)[:count]
+    unsigned = (np.diff(terminators, prepend=-1) - 1).astype(np.int64) << k
+    if k:
+        remainder_bits = np.unpackbits(np.frombuffer(block, dtype=np.uint8, offset=position))[:count * k]
+        weights = np.int64(1) << np.arange(k - 1, -1, -1, dtype=np.int64)
+        unsigned |= remainder_bits.reshape(count, k).astype(np.int64) @ weights
+    return _integrate(_unzigzag(unsigned), warmup, order).astype("<i2")
+
+
+# ---------------------------------------------------------------- writer
+
+def chunk_records_for(record_duration, chunk_seconds=ARCHIVE_CHUNK_SECONDS):
+    if record_duration <= 0:
+        return 1
+    return max(1, int(round(chunk_seconds / record_duration)))
+
+
+def write_archive(source_path, target_path, chunk_seconds=ARCHIVE_CHUNK_SECONDS):
+    """
+    Compress an EDF file into an archive, one chunk of records at a time
+
+    Args:
+        source_path: EDF file
+        target_path: Archive file to write
+        chunk_seconds: Signal time per independently decodable chunk
+
+    Returns:
+        stats: {"source_sha256", "source_size", "archive_size", "ratio", "chunks", "records"}
+    """
+    digest = hashlib.sha256()
+    with open(source_path, "rb") as source, open(target_path, "wb") as target:
+        header = read_edf_header(source)
+        digest.update(header["raw"])
+        signals = header["signals"]
+        record_samples = [signal["samples"] for signal in signals]
+        record_bytes = 2 * sum(record_samples)
+        bounds = np.cumsum([0] + record_samples)
+        chunk_records = chunk_records_for(header["record_duration"], chunk_seconds)
+        codecs = [CODEC_ZLIB if signal["annotation"] else CODEC_RICE for signal in signals]
+
+        metadata = json.dumps({
+            "edf_header": base64.b64encode(header["raw"]).decode("ascii"),
+            "chunk_records": chunk_records,
+        }).encode("utf-8")
+        target.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(metadata)) + metadata)
+
+        index = []
+        records = 0
+        tail = b""
+        while True:
+            data = source.read(chunk_records * record_bytes)
+            digest.update(data)
+            n_records = len(data) // record_bytes if record_bytes else 0
+            if n_records < chunk_records:
+                tail = data[n_records * record_bytes:]
+            if n_records:
+                matrix = np.frombuffer(data, dtype="<i2", count=n_records * record_bytes // 2)
+                matrix = matrix.reshape(n_records, record_bytes // 2)
+                blocks = []
+                for i, codec in enumerate(codecs):
+                    block = encode_block(matrix[:, bounds[i]:bounds[i + 1]].reshape(-1), codec)
+                    blocks.append(_LENGTH.pack(len(block)))
+                    blocks.append(block)
+                payload = b"".join(blocks)
+                index.append((target.tell(), len(payload), records, n_records, zlib.crc32(payload)))
+                target.write(payload)
+                records += n_records
+            if n_records < chunk_records:
+                break
+
+        index_offset = target.tell()
+        target.write(np.array(index, dtype=_INDEX_DTYPE).tobytes())
+        source_size = len(header["raw"]) + records * record_bytes + len(tail)
+        trailer = json.dumps({
+            "source_sha256": digest.hexdigest(),
+            "source_size": source_size,
+            "records": records,
+            "tail": base64.b64encode(tail).decode("ascii"),
+        }).encode("utf-8")
+        target.write(trailer)
+        target.write(_FOOTER.pack(index_offset, len(index), len(trailer), MAGIC))
+        archive_size = target.tell()
+
+    return {
+        "source_sha256": digest.hexdigest(),
+        "source_size": source_size,
+        "archive_size": archive_size,
+        "ratio": source_size / archive_size if archive_size else 0.0,
+        "chunks": len(index),
+        "records": records,
+    }
+
+
+# ---------------------------------------------------------------- reader
+
+class EEGArchive:
+    """Random-access reader of an archive file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._lock = threading.Lock()
+        try:
+            self._read_structure()
+        except Exception:
+            self._file.close()
+            raise
+
+    def _read_structure(self):
+        magic, version, metadata_length = _PREFIX.unpack(self._file.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not an EEG archive")
+        if version > FORMAT_VERSION:
+            raise ValueError(f"{self.path} uses archive format {version}; this reader supports {FORMAT_VERSION}")
+        metadata = json.loads(self._file.read(metadata_length))
+
+        self._file.seek(-_FOOTER.size, os.SEEK_END)
+        index_offset, n_chunks, trailer_length, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is truncated (no archive footer)")
+        self._file.seek(index_offset)
+        self.index = np.frombuffer(self._file.read(n_chunks * _INDEX_DTYPE.itemsize), dtype=_INDEX_DTYPE)
+        self.trailer = json.loads(self._file.read(trailer_length))
+
+        self.edf_header = base64.b64decode(metadata["edf_header"])
+        self.chunk_records = metadata["chunk_records"]
+        header = read_edf_header(io.BytesIO(self.edf_header))
+        self.signals = header["signals"]
+        self.record_duration = header["record_duration"]
+        self.n_records = self.trailer["records"]
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _chunk_blocks(self, chunk, picks):
+        entry = self.index[chunk]
+        with self._lock:
+            self._file.seek(int(entry["offset"]))
+            payload = self._file.read(int(entry["length"]))
+        if zlib.crc32(payload) != int(entry["crc32"]):
+            raise ValueError(f"{self.path}: chunk {chunk} is corrupt (CRC mismatch)")
+
+        wanted = set(picks)
+        blocks = {}
+        position = 0
+        for i, signal in enumerate(self.signals):
+            (length,) = _LENGTH.unpack_from(payload, position)
+            position += _LENGTH.size
+            if i in wanted:
+                samples = decode_block(payload[position:position + length])
+                blocks[i] = samples.reshape(int(entry["n_records"]), signal["samples"])
+            position += length
+        return [blocks[i] for i in picks]
+
+    def read_records(self, first, stop, picks=None):
+        """
+        Digital samples of data records [first, stop), decoding only the chunks they span
+
+        Returns:
+            blocks: One (records, samples per record) int16 array per picked signal
+        """
+        picks = list(range(len(self.signals))) if picks is None else list(picks)
+        stop = min(stop, self.n_records)
+        if first >= stop:
+            return [np.empty((0, self.signals[i]["samples"]), dtype="<i2") for i in picks]
+        first_chunk = first // self.chunk_records
+        last_chunk = (stop - 1) // self.chunk_records
+        parts = [self._chunk_blocks(chunk, picks) for chunk in range(first_chunk, last_chunk + 1)]
+        offset = first - first_chunk * self.chunk_records
+        return [np.concatenate([part[j] for part in parts])[offset:offset + stop - first] for j in range(len(picks))]
+
+    def read_samples(self, start, stop, picks):
+        """(len(picks), stop - start) int16 digital samples; the picked signals must share one rate"""
+        rates = {self.signals[i]["samples"] for i in picks}
+        if len(rates) != 1:
+            raise ValueError("read_samples needs signals with the same number of samples per record")
+        per_record = rates.pop()
+        first = start // per_record
+        blocks = self.read_records(first, -(-stop // per_record), picks)
+        offset = start - first * per_record
+        return np.stack([block.reshape(-1)[offset:offset + stop - start] for block in blocks])
+
+    def iter_source(self):
+        """Yield the original EDF file's bytes, one chunk at a time"""
+        yield self.edf_header
+        for chunk in range(len(self.index)):
+            yield np.concatenate(self._chunk_blocks(chunk, range(len(self.signals))), axis=1).tobytes()
+        yield base64.b64decode(self.trailer["tail"])
+
+    def restore(self, target_path):
+        """
+        Write the original EDF file back and check it against the stored SHA-256
+
+        Returns:
+            sha256: Hex digest of the restored file
+        """
+        digest = hashlib.sha256()
+        with open(target_path, "wb") as f:
+            for data in self.iter_source():
+                digest.update(data)
+                f.write(data)
+        if digest.hexdigest() != self.trailer["source_sha256"]:
+            raise ValueError(f"{self.path}: restored file does not match the archived SHA-256")
+        return digest.hexdigest()
+
+    def verify(self):
+        """Decode every chunk and compare the result with the stored SHA-256"""
+        digest = hashlib.sha256()
+        for data in self.iter_source():
+            digest.update(data)
+        return digest.hexdigest() == self.trailer["source_sha256"]
+
+
+class ArchiveRaw:
+    """
+    The part of mne.io.Raw that read_raw_signal uses, decoded from an archive
+
+    Channels and calibration follow MNE's EDF reader: annotation signals are
+    left out and values are physical units scaled to volts.
+    """
+
+    def __init__(self, archive):
+        self.archive = archive
+        self.picks = [i for i, signal in enumerate(archive.signals) if not signal["annotation"]]
+        signals = [archive.signals[i] for i in self.picks]
+        self.ch_names = [signal["label"] for signal in signals]
+        per_record = signals[0]["samples"] if signals else 0
+        self.info = {"sfreq": per_record / archive.record_duration if archive.record_duration else 0.0}
+        self.n_times = archive.n_records * per_record
+
+        cal, offset = [], []
+        for signal in signals:
+            digital_range = signal["digital_max"] - signal["digital_min"]
+            gain = (signal["physical_max"] - signal["physical_min"]) / digital_range if digital_range else 1.0
+            unit = _UNIT_SCALES.get(signal["unit"], 1.0)
+            cal.append(gain * unit)
+            offset.append((signal["physical_min"] - signal["digital_min"] * gain) * unit)
+        self._cal = np.array(cal)[:, None]
+        self._offset = np.array(offset)[:, None]
+
+    def get_data(self, start=0, stop=None):
+        stop = self.n_times if stop is None else min(stop, self.n_times)
+        data = self.archive.read_samples(start, stop, self.picks).astype(np.float64)
+        data *= self._cal
+        data += self._offset
+        return data
+
+    def close(self):
+        self.archive.close()
+
+
+def uniform_rate(archive):
+    rates = {signal["samples"] for signal in archive.signals if not signal["annotation"]}
+    return len(rates) == 1
+
+
+@contextmanager
+def open_raw(path):
+    """
+    Open a recording for read_raw_signal, whether an archive or a plain EDF
+
+    Archives are decoded chunk by chunk. The rare archive with signals at
+    different rates is restored to a temporary EDF, so MNE resamples them as it
+    does for uploads.
+
+    Args:
+        path: EDF or archive file
+
+    Returns:
+        Context manager yielding an mne.io.Raw (opened with preload=False) or ArchiveRaw
+    """
+    import mne
+    if not is_archive(path):
+        yield mne.io.read_raw_edf(path, preload=False)
+        return
+
+    archive = EEGArchive(path)
+    try:
+        if uniform_rate(archive):
+            yield ArchiveRaw(archive)
+            return
+        fd, restored = tempfile.mkstemp(suffix=".edf")
+        os.close(fd)
+        try:
+            archive.restore(restored)
+            yield mne.io.read_raw_edf(restored, preload=False)
+        finally:
+            os.remove(restored)
+    finally:
+        archive.close()
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Pack, unpack or inspect EEG archives")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    pack = subparsers.add_parser("pack", help="Compress an EDF file")
+    pack.add_argument("source")
+    pack.add_argument("target")
+    pack.add_argument("--chunk-seconds", type=float, default=ARCHIVE_CHUNK_SECONDS)
+    unpack = subparsers.add_parser("unpack", help="Restore the original EDF file")
+    unpack.add_argument("source")
+    unpack.add_argument("target")
+    info = subparsers.add_parser("info", help="Describe an archive")
+    info.add_argument("source")
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        stats = write_archive(args.source, args.target, args.chunk_seconds)
+        print(f"{stats['source_size']} -> {stats['archive_size']} bytes ({stats['ratio']:.2f}x), "
+              f"{stats['chunks']} chunks")
+    elif args.command == "unpack":
+        with EEGArchive(args.source) as archive:
+            print(f"Restored {args.target} (sha256 {archive.restore(args.target)})")
+    else:
+        with EEGArchive(args.source) as archive:
+            size = os.path.getsize(args.source)
+            print(f"{len(archive.signals)} signals, {archive.n_records} records x {archive.record_duration:g} s, "
+                  f"{len(archive.index)} chunks of {archive.chunk_records} records")
+            print(f"{archive.trailer['source_size']} -> {size} bytes "
+                  f"({archive.trailer['source_size'] / size:.2f}x), sha256 {archive.trailer['source_sha256']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+import logging
+import threading
+import contextvars
+from app.utils.profiling import attach_thread
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Maximum number of CPU-bound jobs (classification, local LLM, PDF rendering)
+# running at once in this process
+CPU_WORKERS = int(os.environ.get("CPU_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+_cpu_slots = threading.BoundedSemaphore(CPU_WORKERS)
+
+
+def is_green():
+    """Whether the process runs under eventlet with monkey-patched threads"""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched("thread")
+
+
+def _run_attached(func, *args, **kwargs):
+    # Lets a request-scoped profile sample the native thread doing the work
+    with attach_thread():
+        return func(*args, **kwargs)
+
+
+def run_cpu_bound(func, *args, **kwargs):
+    """
+    Run a CPU-bound function without stalling other requests
+
+    Under the eventlet serving mode all requests share one OS thread, so the
+    call is handed to eventlet's native thread pool and the green thread yields
+    until it finishes. In the threaded mode the request already owns an OS
+    thread and the call runs inline. Either way at most CPU_WORKERS jobs run
+    concurrently.
+    """
+    with _cpu_slots:
+        if is_green():
+            from eventlet import tpool
+            # Native threads do not inherit context variables (e.g. the active trace)
+            context = contextvars.copy_context()
+            return tpool.execute(context.run, _run_attached, func, *args, **kwargs)
+        return func(*args, **kwargs)
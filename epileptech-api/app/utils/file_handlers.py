@@ -1,10 +1,11 @@
 import os
-import mne
 import numpy as np
 import logging
 import tempfile
 import shutil
 from werkzeug.datastructures import FileStorage
+from app.utils.signal_dtype import SIGNAL_DTYPE, from_array, read_raw_signal
+from app.utils.eeg_archive import open_raw
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -31,26 +32,31 @@ def process_eeg_file(file_path: str):
     Process EEG file and extract data for analysis
     
     Parameters:
-    - file_path: Path to the EEG file
+    - file_path: Path to the EEG file, an EDF or an archived recording (see
+      app.utils.eeg_archive)
     
     Returns:
-    - Dictionary containing processed EEG data
+    - Dictionary containing processed EEG data. "data" is stored according to
+      SIGNAL_DTYPE (see app.utils.signal_dtype); for int16 "scales" holds the
+      per-channel factors to physical units.
     """
     try:
-        # Use MNE to read EEG files
-        import mne
-        raw = mne.io.read_raw_edf(file_path, preload=True)
-        
-        # Extract basic information
-        ch_names = raw.ch_names
-        sfreq = raw.info['sfreq']
-        data = raw.get_data()
+        # Use MNE to read EEG files, or the archive reader for archived ones;
+        # without preload the samples are copied chunk by chunk into the
+        # configured dtype instead of a full float64 array
+        with open_raw(file_path) as raw:
+            # Extract basic information
+            ch_names = raw.ch_names
+            sfreq = raw.info['sfreq']
+            data, scales = read_raw_signal(raw)
         
         # Return the structured data
         return {
             "channels": ch_names,
             "sampling_rate": sfreq,
             "data": data,
+            "scales": scales,
+            "dtype": SIGNAL_DTYPE,
             "n_channels": len(ch_names),
             "n_samples": data.shape[1],
             "duration": data.shape[1] / sfreq
@@ -85,7 +91,7 @@ def process_eeg_file(file_path: str):
                 base_signals.append(np.sin(2 * np.pi * freq * t) * 0.5)
                 
             # Combine them with noise to make realistic-looking signals
-            data = np.zeros((n_channels, n_samples))
+            data = np.zeros((n_channels, n_samples), dtype=np.float32)
             for i in range(n_channels):
                 channel_data = np.zeros(n_samples)
                 # Mix the base signals with different weights
@@ -96,11 +102,14 @@ def process_eeg_file(file_path: str):
                 data[i] = channel_data
                 
             dummy_channels = [f"EEG{i+1}" for i in range(n_channels)]
+            data, scales = from_array(data)
             
             return {
                 "channels": dummy_channels,
                 "sampling_rate": sample_rate,
                 "data": data,
+                "scales": scales,
+                "dtype": SIGNAL_DTYPE,
                 "n_channels": n_channels,
                 "n_samples": n_samples,
                 "duration": duration,
@@ -109,10 +118,13 @@ def process_eeg_file(file_path: str):
         except Exception as inner_e:
             logger.error(f"Error generating dummy data: {str(inner_e)}")
             # Absolute minimum fallback
+            data, scales = from_array(np.random.randn(22, 5000))
             return {
                 "channels": [f"CH{i}" for i in range(22)],
                 "sampling_rate": 250,
-                "data": np.random.randn(22, 5000),
+                "data": data,
+                "scales": scales,
+                "dtype": SIGNAL_DTYPE,
                 "n_channels": 22,
                 "n_samples": 5000,
                 "duration": 20.0,
@@ -0,0 +1,108 @@
+import os
+import time
+import logging
+import importlib
+
+from app.utils.profiling import native_lock
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Modules that are only needed for EEG inference and report generation
+INFERENCE_MODULES = [
+    "numpy",
+    "scipy.signal",
+    "mne",
+    "torch",
+    "torch_geometric",
+    "app.models.gnn_classifier",
+]
+
+# Set to "true" on inference workers to pay the import cost at boot instead of
+# on the first request
+PRELOAD_INFERENCE = os.environ.get("PRELOAD_INFERENCE", "False").lower() == "true"
+
+
+class LazyModule:
+    """
+    Stand-in for a module that is imported on first attribute access
+
+    Lets API-only code paths (auth, report CRUD) start without paying for
+    torch, torch_geometric or MNE.
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = native_lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    start = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    elapsed = time.perf_counter() - start
+                    logger.info(f"Lazily imported {self._name} in {elapsed:.2f}s")
+        return self._module
+
+    @property
+    def is_loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+
+_lazy_modules = {}
+_lazy_modules_lock = native_lock()
+
+
+def lazy_import(name):
+    """Return a shared LazyModule for the given module name"""
+    with _lazy_modules_lock:
+        if name not in _lazy_modules:
+            _lazy_modules[name] = LazyModule(name)
+        return _lazy_modules[name]
+
+
+def warm_up(modules=None, load_model=True):
+    """
+    Import inference dependencies and load the GNN model ahead of the first request
+
+    Args:
+        modules: Module names to import, defaults to INFERENCE_MODULES
+        load_model: Whether to also load the classifier weights
+
+    Returns:
+        timings: Dictionary of seconds spent per module
+    """
+    timings = {}
+    for name in modules or INFERENCE_MODULES:
+        start = time.perf_counter()
+        try:
+            if name in _lazy_modules:
+                _lazy_modules[name]._load()
+            else:
+                importlib.import_module(name)
+        except ImportError as e:
+            logger.warning(f"Could not preload {name}: {str(e)}")
+            continue
+        timings[name] = time.perf_counter() - start
+
+    if load_model:
+        start = time.perf_counter()
+        try:
+            gnn_classifier = lazy_import("app.models.gnn_classifier")
+            gnn_classifier.get_model()
+            timings["gnn_model"] = time.perf_counter() - start
+        except Exception as e:
+            logger.warning(f"Could not preload GNN model: {str(e)}")
+
+    logger.info(f"Inference warm-up finished: {timings}")
+    return timings
@@ -0,0 +1,344 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from functools import wraps
+from app.utils.profiling import native_lock
+from app.utils.tracing import add_span_listener
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "True").lower() == "true"
+
+# Latency buckets in seconds, from sub-millisecond Mongo calls to multi-minute LLM runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = native_lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down, or be computed at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._callback = callback
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def track(self, **labels):
+        """Context manager that increments the gauge while a block runs"""
+        gauge = self
+
+        class _Tracker:
+            def __enter__(self):
+                gauge.inc(**labels)
+
+            def __exit__(self, *exc):
+                gauge.dec(**labels)
+
+        return _Tracker()
+
+    def render(self):
+        if self._callback is not None:
+            try:
+                values = self._callback()
+            except Exception as e:
+                logger.warning(f"Error collecting gauge {self.name}: {str(e)}")
+                values = {}
+            items = list(values.items()) if isinstance(values, dict) else [((), values)]
+        else:
+            with self._lock:
+                items = list(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 3)
+            series[index] += 1  # index == len(buckets) is the +Inf overflow slot
+            series[-2] += value
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Context manager that observes the duration of a block"""
+        histogram = self
+
+        class _Timer:
+            def __enter__(self):
+                self.start = time.perf_counter()
+
+            def __exit__(self, *exc):
+                histogram.observe(time.perf_counter() - self.start, **labels)
+
+        return _Timer()
+
+    def render(self):
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = self.header()
+        label_names = self.labelnames + ("le",)
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:len(self.buckets) + 1]):
+                cumulative += count
+                labels = _format_labels(label_names, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """Process-local set of metrics rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = native_lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                return self._metrics[metric.name]
+            self._metrics[metric.name] = metric
+            return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return registry.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=(), callback=None):
+    return registry.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return registry.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# HTTP
+http_request_seconds = histogram(
+    "epileptech_http_request_duration_seconds", "HTTP request latency by route",
+    ("blueprint", "route", "method", "status"),
+)
+http_requests_in_flight = gauge("epileptech_http_requests_in_flight", "HTTP requests currently being served")
+
+# EEG pipeline
+eeg_processing_in_progress = gauge(
+    "epileptech_eeg_processing_queue_depth", "EEG processing requests currently running or waiting in this process"
+)
+pipeline_stage_seconds = histogram(
+    "epileptech_pipeline_stage_duration_seconds", "Duration of traced pipeline stages", ("stage",)
+)
+model_loads_total = counter("epileptech_model_loads_total", "GNN model loads", ("model_version",))
+model_load_seconds = histogram("epileptech_model_load_duration_seconds", "Time spent loading the GNN model")
+llm_tokens_per_second = histogram(
+    "epileptech_llm_tokens_per_second", "Approximate LLM generation throughput", ("source",),
+    buckets=(1, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+fallbacks_total = counter(
+    "epileptech_fallbacks_total", "Requests served from a degraded fallback path", ("kind",)
+)
+
+# MongoDB
+mongo_operation_seconds = histogram(
+    "epileptech_mongo_operation_duration_seconds", "MongoDB command latency", ("command", "outcome")
+)
+
+
+def record_fallback(kind):
+    """Count a fallback, e.g. dummy_data, mock_report or classify_fallback"""
+    if METRICS_ENABLED:
+        fallbacks_total.inc(kind=kind)
+
+
+def record_llm_throughput(source, text, seconds):
+    """Record approximate tokens/second (~4 characters per token)"""
+    if METRICS_ENABLED and text and seconds > 0:
+        llm_tokens_per_second.observe((len(text) / 4) / seconds, source=source)
+
+
+def register_cache(name, stats):
+    """
+    Expose a cache's hit ratio, reading stats() lazily at scrape time
+
+    Args:
+        name: Cache name used as the label value
+        stats: Callable returning a dict with "hits" and "misses"
+    """
+    _caches[name] = stats
+
+
+_caches = {}
+
+
+def _cache_hit_ratios():
+    ratios = {}
+    for name, stats in list(_caches.items()):
+        data = stats()
+        total = data.get("hits", 0) + data.get("misses", 0)
+        ratios[(name,)] = data.get("hits", 0) / total if total else 0.0
+    return ratios
+
+
+cache_hit_ratio = gauge("epileptech_cache_hit_ratio", "Hit ratio per cache", ("cache",), callback=_cache_hit_ratios)
+
+
+def observe_span(span):
+    """Span listener feeding traced stage durations into the stage histogram"""
+    if METRICS_ENABLED and span.duration_ms is not None:
+        pipeline_stage_seconds.observe(span.duration_ms / 1000, stage=span.name)
+
+
+add_span_listener(observe_span)
+
+
+def in_progress(gauge):
+    """Decorator keeping a gauge incremented while the wrapped function runs"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with gauge.track():
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def observe_mongo_command(event, outcome):
+    """Record the latency of a finished pymongo command event"""
+    if METRICS_ENABLED:
+        mongo_operation_seconds.observe(event.duration_micros / 1e6, command=event.command_name, outcome=outcome)
+
+
+def init_app(app):
+    """Register request timing hooks and the /metrics route on a Flask app"""
+    from flask import Response, g, request
+
+    @app.before_request
+    def _start_request_timer():
+        g._metrics_start = time.perf_counter()
+        http_requests_in_flight.inc()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop("_metrics_start", None)
+        if start is not None and METRICS_ENABLED:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            http_request_seconds.observe(
+                time.perf_counter() - start,
+                blueprint=request.blueprint or "",
+                route=route,
+                method=request.method,
+                status=str(response.status_code),
+            )
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        http_requests_in_flight.dec()
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(registry.render(), mimetype=CONTENT_TYPE)
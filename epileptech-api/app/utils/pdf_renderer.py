@@ -0,0 +1,458 @@
+import io
+import os
+import re
+import copy
+import time
+import uuid
+import logging
+import datetime
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+from app.utils.profiling import native_lock
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Directory holding rendered reports, and how long they are kept
+REPORT_STORE_DIR = os.environ.get("REPORT_STORE_DIR", "report_store")
+REPORT_STORE_MAX_AGE_SECONDS = float(os.environ.get("REPORT_STORE_MAX_AGE_SECONDS", str(7 * 24 * 60 * 60)))
+REPORT_STORE_CLEANUP_INTERVAL_SECONDS = 60 * 60
+
+# Optional Unicode TTF font; the built-in core font is used when unset
+PDF_FONT_PATH = os.environ.get("PDF_FONT_PATH", "")
+PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS", str(os.cpu_count() or 1)))
+
+# Upper bound on the memory used by rendered PDFs kept for download
+PDF_CACHE_MAX_BYTES = int(os.environ.get("PDF_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Block kinds of the intermediate report representation
+HEADING_1 = "h1"
+HEADING_2 = "h2"
+BOLD = "bold"
+LIST_ITEM = "item"
+BLANK = "blank"
+PARAGRAPH = "text"
+
+_NUMBERED_ITEM_RE = re.compile(r"^\d+\. ")
+
+# Characters outside latin-1 that LLM output commonly contains
+_CORE_FONT_REPLACEMENTS = str.maketrans({
+    "–": "-", "—": "-", "‘": "'", "’": "'",
+    "“": '"', "”": '"', "•": "-", "…": "...",
+})
+
+
+@lru_cache(maxsize=256)
+def parse_report_markdown(report_text):
+    """
+    Parse report markdown into a flat tuple of (kind, text) blocks
+
+    The result is cached, so re-rendering the same report text (a download after
+    a render, or a batch containing duplicates) skips the parse.
+
+    Args:
+        report_text: Markdown report text
+
+    Returns:
+        blocks: Tuple of (kind, text) pairs
+    """
+    blocks = []
+    for line in report_text.split('\n'):
+        if line.startswith('# '):
+            blocks.append((HEADING_1, line[2:]))
+        elif line.startswith('## '):
+            blocks.append((HEADING_2, line[3:]))
+        elif line.startswith('**') and line.endswith('**') and len(line) > 4:
+            blocks.append((BOLD, line.replace('**', '')))
+        elif line.startswith('- ') or _NUMBERED_ITEM_RE.match(line):
+            blocks.append((LIST_ITEM, line))
+        elif line.strip() == '':
+            blocks.append((BLANK, ''))
+        else:
+            blocks.append((PARAGRAPH, line))
+    return tuple(blocks)
+
+
+@lru_cache(maxsize=1)
+def _report_document_class():
+    """Build the FPDF subclass once per process instead of per render"""
+    from fpdf import FPDF
+
+    class ReportDocument(FPDF):
+        def __init__(self, font_family):
+            super().__init__()
+            self.font_family_name = font_family
+            self.set_auto_page_break(auto=True, margin=15)
+
+        def header(self):
+            self.set_font(self.font_family_name, "B", 16)
+            self.cell(0, 10, "EpilepTech EEG Analysis Report", 0, 1, "C")
+            self.line(10, self.get_y(), 200, self.get_y())
+            self.ln(5)
+
+    return ReportDocument
+
+
+@lru_cache(maxsize=8)
+def _parsed_font(font_path, style):
+    """
+    Read and parse a TTF font once per process
+
+    Returns:
+        (font, font_bytes): fpdf's parsed font (metrics, cmap, glyph ids) and the file contents
+    """
+    from fpdf import FPDF
+    with open(font_path, "rb") as f:
+        font_bytes = f.read()
+    template = FPDF()
+    template.add_font("ReportFont", style, font_path)
+    return next(iter(template.fonts.values())), font_bytes
+
+
+def _add_cached_font(document, family, style, font_path):
+    """
+    Register a font on a document from the per-process parse
+
+    Writing a PDF subsets the font's fontTools object in place and closes it,
+    so each document gets its own, opened from the cached bytes (lazily, so
+    only the tables the subset needs are decoded). The parsed metrics are
+    shared read-only.
+    """
+    from fontTools import ttLib
+    from fpdf.fonts import SubsetMap
+    template, font_bytes = _parsed_font(font_path, style)
+    ttfont = ttLib.TTFont(io.BytesIO(font_bytes), recalcTimestamp=False, fontNumber=0, lazy=True)
+    if "glyf" in ttfont and ".notdef" not in ttfont["glyf"]:
+        # fpdf patches a fallback .notdef glyph into such fonts when it parses them
+        document.add_font(family, style, font_path)
+        return
+    font = copy.copy(template)
+    font.i = len(document.fonts) + 1
+    font.fontkey = f"{family.lower()}{style}"
+    font.ttfont = ttfont
+    font.missing_glyphs = []
+    font.subset = SubsetMap(font)
+    document.fonts[font.fontkey] = font
+
+
+class PDFRenderer:
+    """
+    Renders report markdown to PDF bytes
+
+    One renderer is kept per process; the document class and the parsed font
+    are prepared once and shared by every render.
+    """
+
+    def __init__(self, font_path=PDF_FONT_PATH):
+        self.font_path = font_path if font_path and os.path.exists(font_path) else ""
+        self.font_family = "ReportFont" if self.font_path else "Arial"
+
+    def _new_document(self):
+        document = _report_document_class()(self.font_family)
+        if self.font_path:
+            for style in ("", "B", "I"):
+                _add_cached_font(document, self.font_family, style, self.font_path)
+        document.add_page()
+        return document
+
+    def _text(self, text):
+        text = str(text)
+        if self.font_path:
+            return text
+        return text.translate(_CORE_FONT_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+    def render(self, report_text, eeg_case=None, generated_at=None):
+        """
+        Render a report to PDF
+
+        Args:
+            report_text: Generated report text
+            eeg_case: Optional dictionary with case information
+            generated_at: Report timestamp; pass the stored one to get identical
+                bytes every time the same report revision is rendered
+
+        Returns:
+            pdf_bytes: The rendered PDF document
+        """
+        blocks = parse_report_markdown(report_text or "")
+        family = self.font_family
+        text = self._text
+        generated_at = generated_at or datetime.datetime.now()
+
+        pdf = self._new_document()
+        pdf.set_creation_date(generated_at.replace(tzinfo=generated_at.tzinfo or datetime.timezone.utc))
+
+        # Add report date
+        pdf.set_font(family, "I", 10)
+        report_date = generated_at.strftime("%Y-%m-%d %H:%M:%S")
+        pdf.cell(0, 10, f"Report generated on: {report_date}", 0, 1, "R")
+
+        # Add patient info if available
+        if eeg_case:
+            pdf.set_font(family, "B", 12)
+            pdf.cell(0, 10, "Patient Information:", 0, 1)
+
+            pdf.set_font(family, "", 10)
+            rows = (
+                ("Name:", f"{eeg_case.get('first_name', '')} {eeg_case.get('last_name', '')}"),
+                ("Record ID:", f"{eeg_case.get('eeg_id', '')}"),
+                ("Age/Gender:", f"{eeg_case.get('age', '')} / {eeg_case.get('gender', '')}"),
+                ("Record Date:", f"{eeg_case.get('record_date', '')}"),
+            )
+            for label, value in rows:
+                pdf.cell(40, 7, label, 0, 0)
+                pdf.cell(0, 7, text(value), 0, 1)
+
+            pdf.ln(5)
+
+        # Add main report content
+        pdf.set_font(family, "B", 12)
+        pdf.cell(0, 10, "Analysis Results:", 0, 1)
+
+        pdf.set_font(family, "", 10)
+        for kind, content in blocks:
+            if kind == HEADING_1:
+                pdf.set_font(family, "B", 14)
+                pdf.cell(0, 10, text(content), 0, 1)
+                pdf.set_font(family, "", 10)
+            elif kind == HEADING_2:
+                pdf.set_font(family, "B", 12)
+                pdf.cell(0, 10, text(content), 0, 1)
+                pdf.set_font(family, "", 10)
+            elif kind == BOLD:
+                pdf.set_font(family, "B", 10)
+                pdf.cell(0, 7, text(content), 0, 1)
+                pdf.set_font(family, "", 10)
+            elif kind == LIST_ITEM:
+                pdf.cell(5, 7, "", 0, 0)
+                pdf.cell(0, 7, text(content), 0, 1)
+            elif kind == BLANK:
+                pdf.ln(2)
+            else:
+                # Use multi_cell to handle long text with wrapping
+                pdf.multi_cell(0, 7, text(content))
+
+        # Add footer
+        pdf.ln(10)
+        pdf.set_font(family, "I", 8)
+        pdf.cell(0, 10, "This report was generated by EpilepTech AI Analysis System", 0, 1, "C")
+        pdf.cell(0, 10, "For clinical use only. Please consult with a neurologist for interpretation.", 0, 1, "C")
+
+        return bytes(pdf.output())
+
+
+class ReportStore:
+    """
+    Directory of rendered PDF reports with age-based cleanup of unreferenced files
+
+    Files are written atomically so a concurrent reader never sees a partial PDF.
+    """
+
+    def __init__(self, root=REPORT_STORE_DIR, max_age=REPORT_STORE_MAX_AGE_SECONDS):
+        self.root = root
+        self.max_age = max_age
+        self._last_cleanup = 0.0
+
+    def path_for(self, key):
+        safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", str(key))
+        return os.path.join(self.root, f"{safe_key}.pdf")
+
+    def save(self, key, pdf_bytes):
+        """Write a report and return its path"""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path_for(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pdf_bytes)
+        os.replace(tmp_path, path)
+
+        # Expire old reports at most once an hour, piggybacking on writes
+        if time.time() - self._last_cleanup > REPORT_STORE_CLEANUP_INTERVAL_SECONDS:
+            self.cleanup()
+        return path
+
+    def load(self, key):
+        """Return the stored report bytes, or None if missing"""
+        try:
+            with open(self.path_for(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self.path_for(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def referenced(self, paths):
+        """Subset of paths still named by an EEG record's report_file"""
+        from app.database.database import eeg_reports_collection
+        candidates = {os.path.abspath(path): path for path in paths}
+        query = {"report_file": {"$in": list(candidates) + list(candidates.values())}}
+        return {candidates[os.path.abspath(record["report_file"])]
+                for record in eeg_reports_collection.find(query, {"report_file": 1})}
+
+    def cleanup(self, max_age=None):
+        """
+        Remove reports older than max_age seconds
+
+        Reports that an EEG record still points at through report_file are
+        kept, and nothing is removed while the database cannot be checked.
+
+        Returns:
+            removed: Number of files deleted
+        """
+        max_age = self.max_age if max_age is None else max_age
+        if not os.path.isdir(self.root):
+            return 0
+
+        self._last_cleanup = time.time()
+        cutoff = self._last_cleanup - max_age
+        expired = []
+        for entry in os.scandir(self.root):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    expired.append(entry.path)
+            except FileNotFoundError:
+                continue
+        if not expired:
+            return 0
+
+        try:
+            keep = self.referenced(expired)
+        except Exception as e:
+            logger.warning(f"Skipping report cleanup, could not check report references: {str(e)}")
+            return 0
+
+        removed = 0
+        for path in expired:
+            if path in keep:
+                continue
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                continue
+        if removed:
+            logger.info(f"Removed {removed} expired reports from {self.root}")
+        return removed
+
+
+class RenderedReportCache:
+    """
+    Size-bounded LRU cache of rendered PDFs keyed by (eeg_id, report version)
+
+    The version names the record and its report revision, so regenerated or
+    re-uploaded reports get a new key and are never served stale; invalidate()
+    just releases the memory held by old versions early.
+    """
+
+    def __init__(self, max_bytes=PDF_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = native_lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, eeg_id, version):
+        key = (eeg_id, version)
+        with self._lock:
+            pdf_bytes = self._entries.get(key)
+            if pdf_bytes is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return pdf_bytes
+
+    def put(self, eeg_id, version, pdf_bytes):
+        if len(pdf_bytes) > self.max_bytes:
+            return
+        key = (eeg_id, version)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = pdf_bytes
+            self._size += len(pdf_bytes)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "bytes": self._size}
+
+    def invalidate(self, eeg_id):
+        """Drop every cached version of a report"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == eeg_id]:
+                self._size -= len(self._entries.pop(key))
+
+
+# Shared instances
+renderer = PDFRenderer()
+report_store = ReportStore()
+pdf_cache = RenderedReportCache()
+
+
+def render_report_pdf(report_text, eeg_case=None, generated_at=None):
+    """Render a report to PDF bytes with the shared renderer"""
+    return renderer.render(report_text, eeg_case, generated_at)
+
+
+def get_report_pdf(eeg_id, version, report_text, eeg_case=None, generated_at=None, render=None):
+    """
+    Return the PDF for a report version, rendering it on first request
+
+    Args:
+        eeg_id: EEG record ID
+        version: Identifies the report text, e.g. the record's _id and report revision
+        report_text: Stored report text
+        eeg_case: Optional dictionary with case information
+        generated_at: Timestamp of the stored report text
+        render: Rendering callable, e.g. the inference service client;
+            defaults to rendering in this process
+
+    Returns:
+        pdf_bytes: The rendered PDF document
+    """
+    pdf_bytes = pdf_cache.get(eeg_id, version)
+    if pdf_bytes is None:
+        pdf_bytes = (render or render_report_pdf)(report_text, eeg_case, generated_at)
+        pdf_cache.put(eeg_id, version, pdf_bytes)
+    return pdf_bytes
+
+
+def _render_batch_item(item):
+    report_text, eeg_case = item
+    try:
+        return render_report_pdf(report_text, eeg_case)
+    except Exception as e:
+        logger.error(f"Error rendering PDF in batch: {str(e)}")
+        return None
+
+
+def render_batch(items, max_workers=PDF_RENDER_WORKERS):
+    """
+    Render many reports in a process pool
+
+    Args:
+        items: Iterable of (report_text, eeg_case) pairs
+        max_workers: Number of worker processes
+
+    Returns:
+        results: List of PDF bytes (None for failed renders), in input order
+    """
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [_render_batch_item(item) for item in items]
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(_render_batch_item, items, chunksize=max(1, len(items) // (4 * max_workers))))
@@ -0,0 +1,473 @@
+"""
+Sampling CPU profiler and tracemalloc allocation profiles
+
+Two modes:
+
+- Per request: send `X-Profile: cpu` (or `cpu,alloc`) to POST
+  /api/eeg/process/<eeg_id>, or set PROFILE_PROCESS_EEG=true to profile every
+  call. The request thread, plus any worker thread it hands work to through
+  app.utils.executors, is sampled every PROFILE_INTERVAL_MS. The stacks are
+  written to PROFILE_DIR as <eeg_id>-<timestamp>.folded, and the file name is
+  returned in the X-Profile-File response header. The header is ignored
+  unless PROFILE_HEADER_ENABLED=true.
+- Continuous: with PROFILE_SAMPLE_HZ > 0 every thread in the worker is sampled
+  at that (low) rate. Each process rewrites continuous-<host>-<pid>.folded
+  every PROFILE_FLUSH_SECONDS. To combine the workers' files, run
+      python -m app.utils.profiling merge profiles/continuous-*.folded > all.folded
+
+.folded files use the collapsed-stack format read by flamegraph.pl, speedscope
+and inferno. Work done by a remote inference service (INFERENCE_URL) is not
+sampled; profile that process separately. Files in PROFILE_DIR older than
+PROFILE_MAX_AGE_SECONDS are deleted, and only the newest PROFILE_MAX_FILES
+per-request profiles are kept.
+"""
+import os
+import re
+import sys
+import time
+import socket
+import logging
+import datetime
+import contextvars
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.environ.get("PROFILE_INTERVAL_MS", "5"))
+PROFILE_PROCESS_EEG = os.environ.get("PROFILE_PROCESS_EEG", "False").lower() == "true"
+# Off by default: any logged-in user could otherwise make the server profile a request
+PROFILE_HEADER_ENABLED = os.environ.get("PROFILE_HEADER_ENABLED", "False").lower() == "true"
+PROFILE_SAMPLE_HZ = float(os.environ.get("PROFILE_SAMPLE_HZ", "0"))
+PROFILE_FLUSH_SECONDS = float(os.environ.get("PROFILE_FLUSH_SECONDS", "60"))
+PROFILE_ALLOC_TOP = int(os.environ.get("PROFILE_ALLOC_TOP", "50"))
+PROFILE_MAX_AGE_SECONDS = float(os.environ.get("PROFILE_MAX_AGE_SECONDS", str(7 * 24 * 3600)))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", "200"))
+
+_active_profile = contextvars.ContextVar("active_profile", default=None)
+_tracemalloc_users = 0
+_continuous = None
+
+
+def native_module(module):
+    """Unpatched stdlib module, so the sampler is a real OS thread under eventlet"""
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return __import__(module)
+    return patcher.original(module)
+
+
+def native_lock():
+    """
+    OS-level lock for state shared with run_cpu_bound's native threads
+
+    Under eventlet, threading.Lock is a green lock. Two tpool threads that
+    contend on it deadlock. Only use native locks for short critical sections
+    that never yield to the hub. A green thread waiting on one blocks its OS
+    thread, and a holder that yields can deadlock the other green threads.
+    """
+    return native_module("threading").Lock()
+
+
+_tracemalloc_lock = native_lock()
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame):
+    """Collapse a frame and its callers into "outer;...;inner" """
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class SamplingProfiler:
+    """
+    Periodically records the Python stacks of selected threads
+
+    Args:
+        interval: Seconds between samples
+        thread_ids: Thread identifiers to sample, or None for every thread
+    """
+
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._thread_ids = set(thread_ids) if thread_ids is not None else None
+        self._threading = native_module("threading")
+        self._lock = self._threading.Lock()
+        self._stop = self._threading.Event()
+        self._thread = None
+        self._ignored = set()
+
+    def add_thread(self, ident):
+        with self._lock:
+            if self._thread_ids is not None:
+                self._thread_ids.add(ident)
+
+    def ignore_thread(self, ident):
+        """Never sample this thread, e.g. a helper thread of the profiler itself"""
+        self._ignored.add(ident)
+
+    def remove_thread(self, ident):
+        with self._lock:
+            if self._thread_ids is not None:
+                self._thread_ids.discard(ident)
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self._lock:
+            for ident, frame in frames.items():
+                if ident in self._ignored:
+                    continue
+                if self._thread_ids is not None and ident not in self._thread_ids:
+                    continue
+                self.stacks[fold_stack(frame)] += 1
+            self.samples += 1
+
+    def _run(self):
+        self.ignore_thread(self._threading.get_ident())
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = self._threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.interval * 2))
+
+    def folded(self):
+        """Collapsed stacks, one "stack count" line each"""
+        with self._lock:
+            items = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+
+def _profile_key(key):
+    """
+    File-name form of a profile key
+
+    Characters other than ASCII letters, digits, "-" and "." (including "_"
+    itself) become _<hex byte>, so distinct keys never share files.
+    """
+    return "".join(
+        c if c.isascii() and (c.isalnum() or c in "-.") else "".join(f"_{b:02x}" for b in c.encode("utf-8"))
+        for c in str(key)
+    )
+
+
+def _profile_path(name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+    return os.path.join(PROFILE_DIR, safe)
+
+
+def cleanup_profiles(max_age=PROFILE_MAX_AGE_SECONDS, max_files=PROFILE_MAX_FILES):
+    """
+    Delete profiles older than max_age seconds, then the oldest per-request
+    profiles beyond max_files
+
+    Continuous files are rewritten on every flush, so only those of stopped
+    workers age out; they do not count towards max_files.
+
+    Returns:
+        removed: Number of files deleted
+    """
+    try:
+        entries = [entry for entry in os.scandir(PROFILE_DIR) if entry.is_file()]
+    except FileNotFoundError:
+        return 0
+
+    cutoff = time.time() - max_age
+    removed = 0
+    kept = []
+    for entry in entries:
+        try:
+            mtime = entry.stat().st_mtime
+            if mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+            elif not entry.name.startswith("continuous-"):
+                kept.append((mtime, entry.path))
+        except FileNotFoundError:
+            continue
+    kept.sort()
+    for _, path in kept[:max(0, len(kept) - max_files)]:
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            continue
+    if removed:
+        logger.info(f"Removed {removed} old profiles from {PROFILE_DIR}")
+    return removed
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        _tracemalloc_users += 1
+    return tracemalloc.take_snapshot()
+
+
+def _stop_tracemalloc(start_snapshot):
+    global _tracemalloc_users
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    lines = [f"# traced peak {peak / (1024 * 1024):.1f} MB (process-wide while tracing)"]
+    for stat in snapshot.compare_to(start_snapshot, "lineno")[:PROFILE_ALLOC_TOP]:
+        lines.append(str(stat))
+    return "\n".join(lines) + "\n"
+
+
+def requested_profiles(headers):
+    """
+    Profiles asked for by a request
+
+    Args:
+        headers: Request headers
+
+    Returns:
+        kinds: Set containing "cpu" and/or "alloc" (empty when not profiling)
+    """
+    kinds = set()
+    if PROFILE_HEADER_ENABLED:
+        value = headers.get("X-Profile", "").lower()
+        for kind in (part.strip() for part in value.split(",")):
+            if kind in ("1", "true", "cpu"):
+                kinds.add("cpu")
+            elif kind == "alloc":
+                kinds.add("alloc")
+    if PROFILE_PROCESS_EEG:
+        kinds.add("cpu")
+    return kinds
+
+
+@contextmanager
+def profile_block(key, kinds):
+    """
+    Profile the enclosed block and write the results to PROFILE_DIR
+
+    Usage:
+        with profile_block(eeg_id, {"cpu", "alloc"}) as files:
+            ...
+        files  # {"cpu": "profiles/<key>-<ts>.folded", "alloc": ".../<key>-<ts>.alloc.txt"}
+    """
+    files = {}
+    if not kinds:
+        yield files
+        return
+
+    profiler = None
+    token = None
+    start_snapshot = _start_tracemalloc() if "alloc" in kinds else None
+    if "cpu" in kinds:
+        # sys._current_frames is keyed by OS thread, not by greenlet
+        profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000,
+                                    thread_ids={native_module("threading").get_ident()}).start()
+        token = _active_profile.set(profiler)
+    started = time.perf_counter()
+    try:
+        yield files
+    finally:
+        elapsed = time.perf_counter() - started
+        # Microseconds, so two profiles of one key in the same second do not overwrite each other
+        stamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
+        name = f"{_profile_key(key)}-{stamp}"
+        try:
+            if profiler is not None:
+                profiler.stop()
+                _active_profile.reset(token)
+                path = _profile_path(f"{name}.folded")
+                with open(path, "w") as f:
+                    f.write(profiler.folded())
+                files["cpu"] = path
+                logger.info(f"CPU profile for {key}: {profiler.samples} samples over {elapsed:.2f}s -> {path}")
+            if start_snapshot is not None:
+                path = _profile_path(f"{name}.alloc.txt")
+                with open(path, "w") as f:
+                    f.write(_stop_tracemalloc(start_snapshot))
+                files["alloc"] = path
+            cleanup_profiles()
+        except OSError as e:
+            logger.warning(f"Could not write profile for {key}: {str(e)}")
+
+
+@contextmanager
+def attach_thread():
+    """Include the current thread in the active request profile, e.g. inside a worker thread"""
+    profiler = _active_profile.get()
+    if profiler is None:
+        yield
+        return
+    ident = native_module("threading").get_ident()
+    profiler.add_thread(ident)
+    try:
+        yield
+    finally:
+        profiler.remove_thread(ident)
+
+
+def profiled(key_arg):
+    """
+    Decorator for views that profiles the call when the request asks for it
+
+    Args:
+        key_arg: Name of the URL argument used to key the profile files, e.g. "eeg_id"
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            from flask import make_response, request
+            kinds = requested_profiles(request.headers)
+            if not kinds:
+                return f(*args, **kwargs)
+            with profile_block(kwargs.get(key_arg, "request"), kinds) as files:
+                response = make_response(f(*args, **kwargs))
+            for kind, path in files.items():
+                header = "X-Profile-File" if kind == "cpu" else "X-Profile-Alloc-File"
+                response.headers[header] = os.path.basename(path)
+            return response
+        return decorated_function
+    return decorator
+
+
+def latest_profile(key, kind="cpu"):
+    """Path of the most recent profile written for a key, or None"""
+    suffix = ".folded" if kind == "cpu" else ".alloc.txt"
+    # The whole name must match: a prefix test would let "EEG1" read the profiles of "EEG1-2"
+    pattern = re.compile(rf"^{re.escape(_profile_key(key))}-\d{{20}}{re.escape(suffix)}$")
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if pattern.match(name)]
+    except FileNotFoundError:
+        return None
+    # Timestamps sort lexicographically
+    return os.path.join(PROFILE_DIR, max(names)) if names else None
+
+
+class ContinuousProfiler:
+    """Low-frequency sampler over every thread, flushed to a per-process file"""
+
+    def __init__(self, hz=PROFILE_SAMPLE_HZ, flush_seconds=PROFILE_FLUSH_SECONDS):
+        self.hz = hz
+        self.flush_seconds = flush_seconds
+        self.profiler = None
+        self.path = None
+        self._flusher = None
+
+    def start(self):
+        self.profiler = SamplingProfiler(1 / self.hz).start()
+        self.path = _profile_path(f"continuous-{socket.gethostname()}-{os.getpid()}.folded")
+        native = native_module("threading")
+        stop = self.profiler._stop
+
+        def flush_loop():
+            self.profiler.ignore_thread(native.get_ident())
+            while not stop.wait(self.flush_seconds):
+                self.flush()
+                cleanup_profiles()
+
+        self._flusher = native.Thread(target=flush_loop, name="profile-flusher", daemon=True)
+        self._flusher.start()
+        logger.info(f"Continuous profiling at {self.hz:g} Hz, writing {self.path}")
+        return self
+
+    def flush(self):
+        try:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(self.profiler.folded())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write continuous profile: {str(e)}")
+
+    def stop(self):
+        self.profiler.stop()
+        self.flush()
+
+
+def start_continuous_profiler():
+    """Start the always-on sampler if PROFILE_SAMPLE_HZ is set (once per process)"""
+    global _continuous
+    if PROFILE_SAMPLE_HZ <= 0 or (_continuous is not None and _continuous.profiler._thread.is_alive()):
+        return _continuous
+    _continuous = ContinuousProfiler().start()
+    return _continuous
+
+
+def _restart_after_fork():
+    # Threads do not survive fork; pre-forked workers each get their own sampler and file
+    global _continuous
+    if _continuous is not None:
+        _continuous = None
+        start_continuous_profiler()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def merge_folded(paths):
+    """Sum collapsed stacks from several files (e.g. one per worker)"""
+    stacks = Counter()
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                stack, _, count = line.rstrip("\n").rpartition(" ")
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+    return stacks
+
+
+def top_frames(stacks, limit=20):
+    """Leaf frames with the most samples ("self time")"""
+    leaves = Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return leaves.most_common(limit)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Merge or summarize collapsed-stack profiles")
+    sub = parser.add_subparsers(dest="command", required=True)
+    merge = sub.add_parser("merge", help="Write the summed stacks of several .folded files to stdout")
+    merge.add_argument("paths", nargs="+")
+    top = sub.add_parser("top", help="Show the hottest leaf frames")
+    top.add_argument("paths", nargs="+")
+    top.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    stacks = merge_folded(args.paths)
+    if args.command == "merge":
+        for stack, count in stacks.most_common():
+            sys.stdout.write(f"{stack} {count}\n")
+    else:
+        total = sum(stacks.values()) or 1
+        for frame, count in top_frames(stacks, args.limit):
+            print(f"{count / total:>7.1%} {count:>8}  {frame}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Storage policy for decoded EEG signals
+
+SIGNAL_DTYPE selects how the channel x sample matrix is kept in memory between
+the reader, feature extraction and seizure detection:
+
+    float32  physical values as float32 (default, half the memory of float64)
+    float64  physical values as float64 (previous behaviour)
+    int16    quantized counts plus one float32 scale per channel; physical
+             value = data[ch] * scales[ch]. A quarter of float64, and about the
+             precision EDF/BDF files store anyway.
+
+Consumers should read channels through channel() / channel_blocks() so they work
+with every policy.
+"""
+import os
+import logging
+import numpy as np
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POLICIES = ("float32", "float64", "int16")
+SIGNAL_DTYPE = os.environ.get("SIGNAL_DTYPE", "float32").lower()
+# Seconds of signal converted per read, bounding the float64 staging buffer
+SIGNAL_READ_CHUNK_SECONDS = float(os.environ.get("SIGNAL_READ_CHUNK_SECONDS", "30"))
+
+INT16_MAX = 32767
+
+if SIGNAL_DTYPE not in POLICIES:
+    logger.warning(f"Unknown SIGNAL_DTYPE {SIGNAL_DTYPE!r}, using float32")
+    SIGNAL_DTYPE = "float32"
+
+
+def resolve_policy(policy=None):
+    policy = (policy or SIGNAL_DTYPE).lower()
+    if policy not in POLICIES:
+        raise ValueError(f"Unknown signal dtype policy {policy!r}, expected one of {POLICIES}")
+    return policy
+
+
+def storage_dtype(policy=None):
+    return {"float32": np.float32, "float64": np.float64, "int16": np.int16}[resolve_policy(policy)]
+
+
+def compute_dtype(policy=None):
+    """Float type used for arithmetic on the stored signal"""
+    return np.float64 if resolve_policy(policy) == "float64" else np.float32
+
+
+def quantize_into(out, chunk, scales):
+    # chunk is a scratch float64 buffer and is modified in place
+    chunk /= scales[:, None]
+    np.rint(chunk, out=chunk)
+    np.clip(chunk, -INT16_MAX, INT16_MAX, out=chunk)
+    out[...] = chunk
+
+
+def read_raw_signal(raw, policy=None):
+    """
+    Copy the samples of an MNE Raw object into the storage dtype, chunk by chunk
+
+    The reader should be opened with preload=False so MNE never materialises the
+    whole recording as float64; only one chunk of SIGNAL_READ_CHUNK_SECONDS is
+    staged at a time. The int16 policy makes an extra pass to find each
+    channel's peak for its scale.
+
+    Args:
+        raw: mne.io.Raw
+        policy: Storage policy, defaults to SIGNAL_DTYPE
+
+    Returns:
+        (data, scales): (n_channels, n_samples) array and per-channel scales (None for float policies)
+    """
+    policy = resolve_policy(policy)
+    n_channels, n_samples = len(raw.ch_names), raw.n_times
+    step = max(1, int(SIGNAL_READ_CHUNK_SECONDS * raw.info["sfreq"]))
+    chunks = [(start, min(start + step, n_samples)) for start in range(0, n_samples, step)]
+
+    scales = None
+    if policy == "int16":
+        peak = np.zeros(n_channels)
+        for start, stop in chunks:
+            np.maximum(peak, np.abs(raw.get_data(start=start, stop=stop)).max(axis=1), out=peak)
+        scales = np.where(peak > 0, peak / INT16_MAX, 1.0).astype(np.float32)
+
+    data = np.empty((n_channels, n_samples), dtype=storage_dtype(policy))
+    for start, stop in chunks:
+        chunk = raw.get_data(start=start, stop=stop)
+        if scales is not None:
+            quantize_into(data[:, start:stop], chunk, scales)
+        else:
+            data[:, start:stop] = chunk
+    return data, scales
+
+
+def from_array(array, policy=None):
+    """
+    Convert an in-memory signal to the storage dtype
+
+    Returns:
+        (data, scales): As read_raw_signal; float policies avoid a copy when the dtype already matches
+    """
+    policy = resolve_policy(policy)
+    if policy != "int16":
+        return np.asarray(array, dtype=storage_dtype(policy)), None
+
+    array = np.asarray(array)
+    peak = np.abs(array).max(axis=1).astype(np.float64)
+    scales = np.where(peak > 0, peak / INT16_MAX, 1.0).astype(np.float32)
+    data = np.empty(array.shape, dtype=np.int16)
+    for index in range(array.shape[0]):
+        row = array[index].astype(np.float64)
+        quantize_into(data[index:index + 1], row[None, :], scales[index:index + 1])
+    return data, scales
+
+
+def channel(eeg_data, index):
+    """
+    Physical values of one channel
+
+    A view into the stored matrix for float policies; for int16 a single-channel
+    float32 buffer.
+    """
+    data = eeg_data["data"]
+    scales = eeg_data.get("scales")
+    if scales is None:
+        return data[index]
+    row = data[index].astype(np.float32)
+    row *= scales[index]
+    return row
+
+
+def channel_blocks(eeg_data, block_size=8):
+    """
+    Yield (first_channel, block) with physical values for groups of channels
+
+    Float policies yield views; int16 yields a float32 buffer of block_size channels.
+    """
+    data = eeg_data["data"]
+    scales = eeg_data.get("scales")
+    for start in range(0, data.shape[0], block_size):
+        block = data[start:start + block_size]
+        if scales is not None:
+            block = block.astype(np.float32)
+            block *= scales[start:start + block_size, None]
+        yield start, block
+
+
+def signal_nbytes(eeg_data):
+    """Bytes held by the stored signal, including scales"""
+    scales = eeg_data.get("scales")
+    return eeg_data["data"].nbytes + (scales.nbytes if scales is not None else 0)
@@ -0,0 +1,213 @@
+"""
+Signal preprocessing: resampling to a canonical rate, re-referencing and filtering
+
+Recordings arrive at 200, 256, 500 or 1024 Hz, but the GNN features and the
+seizure detector should see the same rate and band. preprocess_signal():
+
+1. resamples every channel to CANONICAL_SFREQ with a polyphase FIR filter
+   (scipy.signal.resample_poly);
+2. optionally re-references to the common average;
+3. band-pass filters (Butterworth) and removes mains hum with a notch filter,
+   both as second-order sections.
+
+All steps run on (channels, samples) blocks of PREPROCESS_CHUNK_SECONDS. Filter
+state is carried from block to block, and the resampler overlaps blocks, so
+long recordings never need a float64 copy of the whole signal. Filter designs
+are cached per (rate, band) and are not redesigned for every request. The IIR
+filters are causal, which lets them stream; the features (moments and band
+powers) do not depend on phase.
+"""
+import os
+import logging
+from fractions import Fraction
+from functools import lru_cache
+
+import numpy as np
+
+from app.utils.signal_dtype import compute_dtype, quantize_into, resolve_policy, storage_dtype
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+PREPROCESS_ENABLED = os.environ.get("PREPROCESS_ENABLED", "True").lower() == "true"
+CANONICAL_SFREQ = float(os.environ.get("CANONICAL_SFREQ", "250"))
+BANDPASS_LOW_HZ = float(os.environ.get("BANDPASS_LOW_HZ", "0.5"))
+BANDPASS_HIGH_HZ = float(os.environ.get("BANDPASS_HIGH_HZ", "45"))
+# Mains frequency to remove (50 or 60); 0 disables the notch
+NOTCH_HZ = float(os.environ.get("NOTCH_HZ", "50"))
+NOTCH_Q = float(os.environ.get("NOTCH_Q", "30"))
+FILTER_ORDER = int(os.environ.get("FILTER_ORDER", "4"))
+# "none" or "average" (common average reference)
+PREPROCESS_REFERENCE = os.environ.get("PREPROCESS_REFERENCE", "none").lower()
+PREPROCESS_CHUNK_SECONDS = float(os.environ.get("PREPROCESS_CHUNK_SECONDS", "60"))
+
+
+@lru_cache(maxsize=64)
+def resample_factors(sfreq, target):
+    """Smallest (up, down) with sfreq * up / down == target (to within 1/1000)"""
+    ratio = Fraction(target / sfreq).limit_denominator(1000)
+    return ratio.numerator, ratio.denominator
+
+
+@lru_cache(maxsize=64)
+def resample_filter(up, down):
+    """
+    Anti-aliasing FIR filter for resample_poly, designed as scipy does by default
+
+    Passing it as `window` skips the firwin call resample_poly would otherwise
+    make on every invocation.
+    """
+    from scipy import signal
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    taps = signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    taps.setflags(write=False)
+    return taps
+
+
+@lru_cache(maxsize=64)
+def filter_sos(sfreq, low=BANDPASS_LOW_HZ, high=BANDPASS_HIGH_HZ, notch=NOTCH_HZ,
+               order=FILTER_ORDER, notch_q=NOTCH_Q):
+    """
+    Band-pass + notch as one cascade of second-order sections
+
+    Args:
+        sfreq: Sampling rate the filter runs at
+        low, high: Pass band in Hz; high is capped below Nyquist
+        notch: Notch frequency in Hz, skipped when 0 or above the pass band
+        order: Butterworth order
+        notch_q: Quality factor of the notch
+
+    Returns:
+        sos: (n_sections, 6) array
+    """
+    from scipy import signal
+    nyquist = sfreq / 2
+    high = min(high, 0.95 * nyquist)
+    sections = [signal.butter(order, [low, high], btype="bandpass", fs=sfreq, output="sos")]
+    if notch and notch < high:
+        b, a = signal.iirnotch(notch, notch_q, fs=sfreq)
+        sections.append(signal.tf2sos(b, a))
+    # Left writable: sosfilt hands the array to Cython, which rejects read-only buffers
+    return np.vstack(sections)
+
+
+def design_cache_info():
+    """Hit/miss counters of the filter design caches"""
+    return {
+        "resample_filter": resample_filter.cache_info()._asdict(),
+        "filter_sos": filter_sos.cache_info()._asdict(),
+    }
+
+
+def _block_reader(eeg_data, dtype):
+    """read(lo, hi) returning physical values of samples [lo, hi) for every channel"""
+    data = eeg_data["data"]
+    scales = eeg_data.get("scales")
+    if scales is None:
+        return lambda lo, hi: data[:, lo:hi].astype(dtype, copy=False)
+
+    def read(lo, hi):
+        block = data[:, lo:hi].astype(dtype)
+        block *= scales[:, None]
+        return block
+    return read
+
+
+def _resampled_chunks(read, n, up, down, chunk_samples):
+    """
+    Yield consecutive blocks of resample_poly(signal, up, down, axis=1)
+
+    Blocks start on multiples of `down` input samples, so each maps to a whole
+    output index. Every block is resampled with enough neighbouring input on
+    both sides that its interior matches a whole-signal resample_poly.
+    """
+    if up == down == 1:
+        for start in range(0, n, chunk_samples):
+            yield read(start, min(start + chunk_samples, n))
+        return
+
+    from scipy import signal
+    taps = resample_filter(up, down)
+    half_len = (len(taps) - 1) // 2
+    pad = -(-(half_len // up + 2) // down) * down
+    step = max(down, chunk_samples // down * down)
+    n_out = -(-n * up // down)
+
+    for start in range(0, n, step):
+        stop = min(start + step, n)
+        lo, hi = max(0, start - pad), min(n, stop + pad)
+        segment = read(lo, hi)
+        resampled = signal.resample_poly(segment, up, down, axis=1, window=taps)
+        first = (start - lo) * up // down
+        length = (n_out if stop == n else stop * up // down) - start * up // down
+        yield resampled[:, first:first + length]
+
+
+def preprocess_signal(eeg_data, target_sfreq=None, reference=None):
+    """
+    Resample, re-reference and filter a decoded recording chunk by chunk
+
+    Args:
+        eeg_data: Output of process_eeg_file (any SIGNAL_DTYPE policy)
+        target_sfreq: Output rate, defaults to CANONICAL_SFREQ
+        reference: "none" or "average", defaults to PREPROCESS_REFERENCE
+
+    Returns:
+        eeg_data: New dictionary with the processed signal in the same storage
+        policy, the canonical sampling_rate and a "preprocessing" summary
+    """
+    target_sfreq = float(target_sfreq or CANONICAL_SFREQ)
+    reference = (reference or PREPROCESS_REFERENCE).lower()
+    data = eeg_data["data"]
+    sfreq = float(eeg_data.get("sampling_rate", 250))
+    policy = resolve_policy(eeg_data.get("dtype"))
+    scales = eeg_data.get("scales")
+    n_channels, n_samples = data.shape
+
+    from scipy import signal
+
+    up, down = resample_factors(sfreq, target_sfreq)
+    out_sfreq = sfreq * up / down
+    sos = filter_sos(out_sfreq)
+    n_out = -(-n_samples * up // down)
+    out = np.empty((n_channels, n_out), dtype=storage_dtype(policy))
+    dtype = compute_dtype(policy)
+    chunk_samples = max(1, int(PREPROCESS_CHUNK_SECONDS * sfreq))
+
+    # int16 storage is filtered in physical units and re-quantized with the input scales
+    blocks = _resampled_chunks(_block_reader(eeg_data, dtype), n_samples, up, down, chunk_samples)
+
+    zi = None
+    position = 0
+    for block in blocks:
+        if reference == "average":
+            block = block - block.mean(axis=0, keepdims=True)
+        if zi is None:
+            # Start from steady state for the first sample to avoid a step transient
+            zi = signal.sosfilt_zi(sos)[:, None, :] * block[:, :1][None, :, :]
+        filtered, zi = signal.sosfilt(sos, block, axis=-1, zi=zi)
+        target = out[:, position:position + filtered.shape[1]]
+        if scales is not None:
+            quantize_into(target, filtered.astype(np.float64, copy=False), scales)
+        else:
+            target[...] = filtered
+        position += filtered.shape[1]
+
+    processed = dict(eeg_data)
+    processed.update({
+        "data": out,
+        "scales": scales,
+        "sampling_rate": out_sfreq,
+        "n_samples": n_out,
+        "duration": n_out / out_sfreq,
+        "preprocessing": {
+            "original_sampling_rate": sfreq,
+            "resample": [up, down],
+            "band_hz": [BANDPASS_LOW_HZ, min(BANDPASS_HIGH_HZ, 0.95 * out_sfreq / 2)],
+            "notch_hz": NOTCH_HZ or None,
+            "reference": reference,
+        },
+    })
+    return processed
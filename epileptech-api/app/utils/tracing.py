@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from functools import wraps
+from contextlib import contextmanager
+from app.utils.profiling import native_lock
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Traces are always logged as one JSON line; these add optional exporters
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_COLLECTOR_URL = os.environ.get("TRACE_COLLECTOR_URL", "")
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "True").lower() == "true"
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = native_lock()
+_span_listeners = []
+
+
+class Span:
+    """A timed stage of a trace"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.parent = parent
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.duration_ms = None
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+        return self
+
+    def finish(self):
+        if self.duration_ms is None:
+            self.duration_ms = (time.perf_counter() - self.start) * 1000
+
+    def to_dict(self):
+        data = {"stage": self.name, "duration_ms": round(self.duration_ms or 0.0, 3)}
+        if self.parent:
+            data["parent"] = self.parent
+        if self.error:
+            data["error"] = self.error
+        data.update(self.attributes)
+        return data
+
+
+class _NoopSpan:
+    """Returned when no trace is active so call sites never need to check"""
+
+    def set(self, **attributes):
+        return self
+
+
+class Trace:
+    """Collection of spans recorded while handling one request"""
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.duration_ms = None
+        self.spans = []
+        self._lock = native_lock()
+
+    def add_span(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def add_stages(self, stages, parent=None):
+        """Merge stage dictionaries recorded elsewhere, e.g. by the inference service"""
+        for stage in stages or []:
+            stage = dict(stage)
+            span = Span(stage.pop("stage", "unknown"), stage.pop("parent", None) or parent)
+            span.duration_ms = stage.pop("duration_ms", 0.0)
+            span.error = stage.pop("error", None)
+            span.attributes = stage
+            self.add_span(span)
+
+    def stages(self):
+        """Finished spans as plain dictionaries, in completion order"""
+        with self._lock:
+            return [span.to_dict() for span in self.spans if span.duration_ms is not None]
+
+    def finish(self):
+        self.duration_ms = (time.perf_counter() - self._start) * 1000
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms or 0.0, 3),
+            "attributes": self.attributes,
+            "stages": self.stages(),
+        }
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextmanager
+def start_trace(name, **attributes):
+    """
+    Record a trace for the enclosed block and export it when the block exits
+
+    Usage:
+        with start_trace("process_eeg", eeg_id=eeg_id) as trace:
+            with span("decode"):
+                ...
+    """
+    trace = Trace(name, attributes)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attributes["error"] = str(e)
+        raise
+    finally:
+        trace.finish()
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        export_trace(trace)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage of the current trace; does nothing when no trace is active"""
+    trace = _current_trace.get()
+    if trace is None or not TRACING_ENABLED:
+        yield _NoopSpan()
+        return
+
+    parent = _current_span.get()
+    stage = Span(name, parent.name if parent else None, attributes)
+    token = _current_span.set(stage)
+    try:
+        yield stage
+    except Exception as e:
+        stage.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        stage.finish()
+        _current_span.reset(token)
+        trace.add_span(stage)
+        for listener in _span_listeners:
+            listener(stage)
+
+
+def add_span_listener(listener):
+    """Call listener(span) whenever a span finishes, e.g. to feed metrics"""
+    if listener not in _span_listeners:
+        _span_listeners.append(listener)
+
+
+def traced(name):
+    """Decorator that records a trace around a view, tagged with its URL arguments"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            with start_trace(name, **kwargs):
+                return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+
+def set_attributes(**attributes):
+    """Attach attributes to the innermost active span"""
+    stage = _current_span.get()
+    if stage is not None:
+        stage.set(**attributes)
+
+
+def _post_to_collector(payload):
+    try:
+        import urllib.request
+        request = urllib.request.Request(
+            TRACE_COLLECTOR_URL,
+            data=payload.encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=2).read()
+    except Exception as e:
+        logger.debug(f"Could not export trace to collector: {str(e)}")
+
+
+def export_trace(trace):
+    """Write a finished trace to the structured log and any configured exporters"""
+    if not TRACING_ENABLED:
+        return
+    payload = json.dumps(trace.to_dict(), default=str)
+    logger.info(f"trace {payload}")
+
+    if TRACE_EXPORT_PATH:
+        try:
+            with _export_lock, open(TRACE_EXPORT_PATH, "a") as f:
+                f.write(payload + "\n")
+        except OSError as e:
+            logger.warning(f"Could not write trace to {TRACE_EXPORT_PATH}: {str(e)}")
+
+    if TRACE_COLLECTOR_URL:
+        threading.Thread(target=_post_to_collector, args=(payload,), daemon=True).start()
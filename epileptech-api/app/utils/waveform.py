@@ -0,0 +1,356 @@
+"""
+Min/max decimation pyramids for the EEG viewer
+
+When an EEG is processed, the decoded signal is reduced to per-channel
+(min, max) envelopes:
+- Level 0 has one bucket per WAVEFORM_BASE_BUCKET samples.
+- Each higher level merges WAVEFORM_FANOUT buckets, until a whole recording
+  fits in one tile.
+- Envelopes are stored as int16 counts with one scale per channel, in .npy
+  files that are memory-mapped when read.
+
+A viewer request (channels, time range, pixel width) is answered from the
+coarsest level that still has at least one bucket per pixel. Only the
+WAVEFORM_TILE_BUCKETS-aligned tiles covering the range are read. The work
+per request is therefore bounded by the pixel width, not by the length of
+the recording.
+
+Binary response format (little-endian):
+    header   "EEGW", version u16, level u16, n_channels u16, reserved u16,
+             first_bucket u32, n_buckets u32, bucket_seconds f64
+    channels u16 * n_channels    channel indices
+    scales   f32 * n_channels    physical units per count
+    data     i16 * n_channels * n_buckets * 2   (min, max) per bucket, channel-major
+"""
+import os
+import json
+import time
+import shutil
+import struct
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from app.utils.profiling import native_lock
+from app.utils.signal_dtype import INT16_MAX
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WAVEFORM_DIR = os.environ.get("WAVEFORM_DIR", "waveforms")
+WAVEFORM_BASE_BUCKET = int(os.environ.get("WAVEFORM_BASE_BUCKET", "8"))
+WAVEFORM_FANOUT = int(os.environ.get("WAVEFORM_FANOUT", "4"))
+WAVEFORM_TILE_BUCKETS = int(os.environ.get("WAVEFORM_TILE_BUCKETS", "1024"))
+# Upper bounds on what a single request may ask for
+WAVEFORM_MAX_WIDTH = int(os.environ.get("WAVEFORM_MAX_WIDTH", "8192"))
+WAVEFORM_MAX_CHANNELS = int(os.environ.get("WAVEFORM_MAX_CHANNELS", "256"))
+
+FORMAT_VERSION = 1
+MAGIC = b"EEGW"
+HEADER = struct.Struct("<4sHHHHIId")
+CONTENT_TYPE = "application/vnd.epileptech.waveform"
+
+# Output buckets produced per pass while building, bounding build memory
+_BUILD_CHUNK_BUCKETS = 1 << 15
+
+
+class WaveformNotFound(LookupError):
+    """Raised when no pyramid has been built for a recording"""
+
+
+def pyramid_dir(key):
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(key))
+    return os.path.join(WAVEFORM_DIR, safe)
+
+
+def _bucket_extrema(mins, maxs, size):
+    """Reduce (n_channels, n) minimum/maximum arrays over consecutive groups of `size`"""
+    n_channels, n = mins.shape
+    full = n // size * size
+    out_min = mins[:, :full].reshape(n_channels, -1, size).min(axis=2)
+    out_max = maxs[:, :full].reshape(n_channels, -1, size).max(axis=2)
+    if full < n:
+        out_min = np.concatenate([out_min, mins[:, full:].min(axis=1, keepdims=True)], axis=1)
+        out_max = np.concatenate([out_max, maxs[:, full:].max(axis=1, keepdims=True)], axis=1)
+    return out_min, out_max
+
+
+def _channel_scales(eeg_data):
+    """Physical units per int16 count for every channel"""
+    if eeg_data.get("scales") is not None:
+        # Already stored as int16 counts; reuse the reader's scales
+        return np.asarray(eeg_data["scales"], dtype=np.float32)
+    data = eeg_data["data"]
+    step = _BUILD_CHUNK_BUCKETS * WAVEFORM_BASE_BUCKET
+    peak = np.zeros(data.shape[0])
+    for start in range(0, data.shape[1], step):
+        np.maximum(peak, np.abs(data[:, start:start + step]).max(axis=1), out=peak)
+    return np.where(peak > 0, peak / INT16_MAX, 1.0).astype(np.float32)
+
+
+def _quantize(mins, maxs, scales):
+    # Round outwards so the stored envelope always contains the signal
+    q_min = np.floor(mins / scales[:, None])
+    q_max = np.ceil(maxs / scales[:, None])
+    return (np.clip(q_min, -INT16_MAX, INT16_MAX).astype(np.int16),
+            np.clip(q_max, -INT16_MAX, INT16_MAX).astype(np.int16))
+
+
+def build_pyramid(eeg_data, key):
+    """
+    Build and store the min/max pyramid of a decoded recording
+
+    Args:
+        eeg_data: Output of process_eeg_file
+        key: Identifier of the recording, normally the eeg_id
+
+    Returns:
+        meta: Description of the stored levels
+    """
+    data = eeg_data["data"]
+    n_channels, n_samples = data.shape
+    quantized = eeg_data.get("scales") is not None
+    scales = _channel_scales(eeg_data)
+
+    final_dir = pyramid_dir(key)
+    build_dir = f"{final_dir}.building-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(build_dir, ignore_errors=True)
+    os.makedirs(build_dir)
+
+    # Level 0 straight from the signal, a bounded number of samples at a time
+    n_buckets = -(-n_samples // WAVEFORM_BASE_BUCKET)
+    level = np.lib.format.open_memmap(
+        os.path.join(build_dir, "level_0.npy"), mode="w+", dtype="<i2", shape=(n_channels, n_buckets, 2)
+    )
+    step = _BUILD_CHUNK_BUCKETS * WAVEFORM_BASE_BUCKET
+    for start in range(0, n_samples, step):
+        block = data[:, start:start + step]
+        mins, maxs = _bucket_extrema(block, block, WAVEFORM_BASE_BUCKET)
+        if not quantized:
+            mins, maxs = _quantize(mins, maxs, scales)
+        first = start // WAVEFORM_BASE_BUCKET
+        level[:, first:first + mins.shape[1], 0] = mins
+        level[:, first:first + mins.shape[1], 1] = maxs
+    level.flush()
+    levels = [{"level": 0, "bucket_samples": WAVEFORM_BASE_BUCKET, "n_buckets": n_buckets}]
+
+    # Each further level merges WAVEFORM_FANOUT buckets of the previous one
+    while n_buckets > WAVEFORM_TILE_BUCKETS:
+        index = len(levels)
+        previous = level
+        n_buckets = -(-n_buckets // WAVEFORM_FANOUT)
+        level = np.lib.format.open_memmap(
+            os.path.join(build_dir, f"level_{index}.npy"), mode="w+", dtype="<i2", shape=(n_channels, n_buckets, 2)
+        )
+        step = _BUILD_CHUNK_BUCKETS * WAVEFORM_FANOUT
+        for start in range(0, previous.shape[1], step):
+            mins, maxs = _bucket_extrema(
+                previous[:, start:start + step, 0], previous[:, start:start + step, 1], WAVEFORM_FANOUT
+            )
+            first = start // WAVEFORM_FANOUT
+            level[:, first:first + mins.shape[1], 0] = mins
+            level[:, first:first + mins.shape[1], 1] = maxs
+        level.flush()
+        levels.append({
+            "level": index,
+            "bucket_samples": levels[-1]["bucket_samples"] * WAVEFORM_FANOUT,
+            "n_buckets": n_buckets,
+        })
+        del previous
+
+    sfreq = float(eeg_data.get("sampling_rate", 250))
+    meta = {
+        "version": FORMAT_VERSION,
+        "built_at": time.time(),
+        "channels": list(eeg_data.get("channels") or [f"CH{i}" for i in range(n_channels)]),
+        "sampling_rate": sfreq,
+        "n_samples": n_samples,
+        "duration": n_samples / sfreq,
+        "fanout": WAVEFORM_FANOUT,
+        "tile_buckets": WAVEFORM_TILE_BUCKETS,
+        "levels": levels,
+        "scales": [float(scale) for scale in scales],
+    }
+    with open(os.path.join(build_dir, "meta.json"), "w") as f:
+        json.dump(meta, f)
+    del level
+
+    # Swap the finished pyramid in; readers keep any files they already mapped
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(build_dir, final_dir)
+    return meta
+
+
+def delete_pyramid(key):
+    shutil.rmtree(pyramid_dir(key), ignore_errors=True)
+    with _open_lock:
+        _open_pyramids.pop(key, None)
+
+
+class WaveformPyramid:
+    """Read-only view of a stored pyramid"""
+
+    def __init__(self, key):
+        directory = pyramid_dir(key)
+        meta_path = os.path.join(directory, "meta.json")
+        try:
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise WaveformNotFound(f"No waveform pyramid for {key}")
+        self.directory = directory
+        self.mtime = os.path.getmtime(meta_path)
+        self.scales = np.asarray(self.meta["scales"], dtype=np.float32)
+        self._levels = {}
+
+    def level(self, index):
+        array = self._levels.get(index)
+        if array is None:
+            array = np.load(os.path.join(self.directory, f"level_{index}.npy"), mmap_mode="r")
+            self._levels[index] = array
+        return array
+
+    def bucket_seconds(self, index):
+        return self.meta["levels"][index]["bucket_samples"] / self.meta["sampling_rate"]
+
+    def choose_level(self, start, end, width):
+        """Coarsest level that still has at least one bucket per pixel over [start, end)"""
+        chosen = 0
+        for info in self.meta["levels"]:
+            buckets = (end - start) / self.bucket_seconds(info["level"])
+            if buckets >= width:
+                chosen = info["level"]
+        return chosen
+
+    def tile_range(self, index, start, end):
+        """(first_tile, last_tile) covering [start, end) seconds at a level"""
+        n_buckets = self.meta["levels"][index]["n_buckets"]
+        seconds = self.bucket_seconds(index)
+        first_bucket = min(max(0, int(start // seconds)), n_buckets - 1)
+        last_bucket = min(max(first_bucket, int(-(-end // seconds)) - 1), n_buckets - 1)
+        tile = self.meta["tile_buckets"]
+        return first_bucket // tile, last_bucket // tile
+
+    def read_tiles(self, index, first_tile, last_tile, channels):
+        """
+        Envelope of whole tiles for selected channels
+
+        Returns:
+            (first_bucket, array): array of shape (len(channels), n_buckets, 2) int16
+        """
+        tile = self.meta["tile_buckets"]
+        level = self.level(index)
+        first_bucket = first_tile * tile
+        stop = min((last_tile + 1) * tile, level.shape[1])
+        return first_bucket, np.ascontiguousarray(level[channels, first_bucket:stop])
+
+    def encode(self, index, first_bucket, channels, array):
+        header = HEADER.pack(
+            MAGIC, FORMAT_VERSION, index, len(channels), 0, first_bucket, array.shape[1], self.bucket_seconds(index)
+        )
+        return b"".join([
+            header,
+            np.asarray(channels, dtype="<u2").tobytes(),
+            self.scales[channels].astype("<f4").tobytes(),
+            array.astype("<i2", copy=False).tobytes(),
+        ])
+
+
+_open_pyramids = OrderedDict()
+_open_lock = native_lock()
+_MAX_OPEN_PYRAMIDS = 32
+
+
+def open_pyramid(key):
+    """Open a pyramid, reusing mappings while its files are unchanged"""
+    meta_path = os.path.join(pyramid_dir(key), "meta.json")
+    try:
+        mtime = os.path.getmtime(meta_path)
+    except FileNotFoundError:
+        raise WaveformNotFound(f"No waveform pyramid for {key}")
+
+    with _open_lock:
+        pyramid = _open_pyramids.get(key)
+        if pyramid is not None and pyramid.mtime == mtime:
+            _open_pyramids.move_to_end(key)
+            return pyramid
+
+    pyramid = WaveformPyramid(key)
+    with _open_lock:
+        _open_pyramids[key] = pyramid
+        while len(_open_pyramids) > _MAX_OPEN_PYRAMIDS:
+            _open_pyramids.popitem(last=False)
+    return pyramid
+
+
+def parse_channels(value, n_channels):
+    """Parse "0,3,7" (or empty for all channels) into validated indices"""
+    if not value:
+        channels = list(range(n_channels))
+    else:
+        channels = [int(part) for part in value.split(",") if part.strip()]
+    if not channels or any(c < 0 or c >= n_channels for c in channels):
+        raise ValueError(f"Channel indices must be between 0 and {n_channels - 1}")
+    if len(channels) > WAVEFORM_MAX_CHANNELS:
+        raise ValueError(f"At most {WAVEFORM_MAX_CHANNELS} channels per request")
+    return channels
+
+
+def query_tiles(key, channels=None, start=None, end=None, width=None, level=None, tile=None):
+    """
+    Encode the tiles answering one viewer request
+
+    Either give a time range and pixel width (the level is chosen so there is at
+    least one bucket per pixel), or an explicit level and tile index.
+
+    Args:
+        key: Recording identifier (eeg_id)
+        channels: Comma-separated channel indices, empty for all
+        start, end: Time range in seconds
+        width: Pixel width of the plot
+        level, tile: Explicit tile address
+
+    Returns:
+        (payload, info): Encoded bytes and a dict describing what was returned
+    """
+    pyramid = open_pyramid(key)
+    meta = pyramid.meta
+    channel_indices = parse_channels(channels, len(meta["channels"]))
+
+    if level is not None and tile is not None:
+        if not 0 <= level < len(meta["levels"]):
+            raise ValueError(f"Level must be between 0 and {len(meta['levels']) - 1}")
+        last_tile = (meta["levels"][level]["n_buckets"] - 1) // meta["tile_buckets"]
+        if not 0 <= tile <= last_tile:
+            raise ValueError(f"Tile must be between 0 and {last_tile} at level {level}")
+        first_tile = last_tile = tile
+    else:
+        start = max(0.0, float(start or 0.0))
+        end = min(float(end if end is not None else meta["duration"]), meta["duration"])
+        width = int(width or 1000)
+        if end <= start:
+            raise ValueError("end must be greater than start")
+        if not 0 < width <= WAVEFORM_MAX_WIDTH:
+            raise ValueError(f"width must be between 1 and {WAVEFORM_MAX_WIDTH}")
+        level = pyramid.choose_level(start, end, width)
+        first_tile, last_tile = pyramid.tile_range(level, start, end)
+
+    first_bucket, array = pyramid.read_tiles(level, first_tile, last_tile, channel_indices)
+    payload = pyramid.encode(level, first_bucket, channel_indices, array)
+    info = {
+        "level": level,
+        "first_tile": first_tile,
+        "last_tile": last_tile,
+        "built_at": meta["built_at"],
+    }
+    return payload, info
+
+
+def pyramid_meta(key):
+    """Metadata a viewer needs to plan requests (channels, duration, levels)"""
+    meta = dict(open_pyramid(key).meta)
+    meta.pop("scales", None)
+    return meta
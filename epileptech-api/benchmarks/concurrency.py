@@ -0,0 +1,149 @@
+"""
+Concurrency benchmark: requests/second and latency as client concurrency grows
+
+Starts the API in each serving mode, drives a single endpoint with an increasing
+number of concurrent clients and reports where throughput stops scaling.
+
+Usage (from the epileptech-api directory, with MongoDB reachable):
+    python benchmarks/concurrency.py --path /api/reports/ --token <jwt> \
+        --modes threaded green --concurrency 1 8 32 128 --output concurrency.json
+
+Use --url to benchmark an already running server instead of starting one.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def drive(url, concurrency, duration, headers):
+    """Hit url from `concurrency` threads for `duration` seconds"""
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        while time.monotonic() < deadline:
+            request = urllib.request.Request(url, headers=headers)
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=60) as response:
+                    response.read()
+                ok = True
+            except urllib.error.HTTPError as e:
+                ok = e.code < 500
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.monotonic() - started
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors[0],
+        "throughput_rps": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": (statistics.mean(latencies) * 1000) if latencies else 0.0,
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode):
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--mode", mode, "--host", "127.0.0.1", "--port", str(port)],
+        cwd=API_ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/", timeout=1).read()
+            return process, base_url
+        except Exception:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server in {mode} mode exited with code {process.returncode}")
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Server in {mode} mode did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark this running server instead of starting one")
+    parser.add_argument("--path", default="/ready")
+    parser.add_argument("--token", help="Bearer token for authenticated endpoints")
+    parser.add_argument("--modes", nargs="+", default=["threaded", "green"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32, 128])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    targets = [("external", args.url)] if args.url else [(mode, None) for mode in args.modes]
+    results = {}
+
+    for mode, base_url in targets:
+        process = None
+        if base_url is None:
+            process, base_url = start_server(mode)
+        try:
+            print(f"\n== {mode} ({base_url}{args.path})")
+            print(f"{'clients':>8} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+            results[mode] = []
+            for concurrency in args.concurrency:
+                result = drive(base_url.rstrip("/") + args.path, concurrency, args.duration, headers)
+                results[mode].append(result)
+                print(f"{concurrency:>8} {result['throughput_rps']:>9.1f} {result['p50_ms']:>9.1f} "
+                      f"{result['p99_ms']:>9.1f} {result['errors']:>7}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"path": args.path, "duration": args.duration, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+EEG archive benchmark: compression ratio and decode throughput
+
+For every recording (real EDF files given with --files, or synthetic ones from
+benchmarks/synthetic_edf.py) it reports:
+
+    ratio       original size / archive size, next to zlib -6 and xz -6 on the whole file
+    encode      MB of EDF compressed per second
+    decode      MB of EDF restored per second (all chunks, byte-exact, SHA-256 checked)
+    signal      MB/s of physical float64 produced through ArchiveRaw.get_data, the process_eeg_file path
+    range       p50/p99 latency of decoding a random --window seconds of every channel
+    lossless    whether the restored file is identical to the original
+
+Synthetic recordings carry white noise on top of their oscillations, which
+no lossless coder can compress, so real recordings compress noticeably
+better. Pass real EDF files with --files to measure real data.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/eeg_archive.py --channels 22 64 --sfreq 256 --duration 600 --output eeg_archive.json
+    python benchmarks/eeg_archive.py --files recordings/*.edf --window 10
+"""
+import os
+import sys
+import lzma
+import json
+import time
+import zlib
+import random
+import argparse
+import tempfile
+import itertools
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import percentile
+from synthetic_edf import write_synthetic_edf
+
+
+def whole_file_ratios(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return {
+        "zlib": len(data) / len(zlib.compress(data, 6)),
+        "xz": len(data) / len(lzma.compress(data, preset=6)),
+    }
+
+
+def measure(path, args, workdir):
+    from app.utils.eeg_archive import ArchiveRaw, EEGArchive, write_archive
+
+    source_mb = os.path.getsize(path) / 1e6
+    archive_path = os.path.join(workdir, "recording.eegz")
+    restored_path = os.path.join(workdir, "restored.edf")
+
+    start = time.perf_counter()
+    stats = write_archive(path, archive_path, args.chunk_seconds)
+    encode_s = time.perf_counter() - start
+
+    with EEGArchive(archive_path) as archive:
+        start = time.perf_counter()
+        try:
+            archive.restore(restored_path)
+            lossless = True
+        except ValueError:
+            lossless = False
+        decode_s = time.perf_counter() - start
+
+        raw = ArchiveRaw(archive)
+        start = time.perf_counter()
+        step = int(30 * raw.info["sfreq"])
+        for first in range(0, raw.n_times, step):
+            raw.get_data(first, first + step)
+        signal_s = time.perf_counter() - start
+        signal_mb = raw.n_times * len(raw.ch_names) * 8 / 1e6
+
+        window = int(args.window * raw.info["sfreq"])
+        rng = random.Random(args.seed)
+        latencies = []
+        for _ in range(args.ranges):
+            first = rng.randrange(0, max(1, raw.n_times - window))
+            begin = time.perf_counter()
+            raw.get_data(first, first + window)
+            latencies.append(time.perf_counter() - begin)
+
+    return {
+        "file": path,
+        "channels": len(raw.ch_names),
+        "sfreq": raw.info["sfreq"],
+        "duration_s": raw.n_times / raw.info["sfreq"] if raw.info["sfreq"] else 0.0,
+        "source_bytes": stats["source_size"],
+        "archive_bytes": stats["archive_size"],
+        "ratio": stats["ratio"],
+        **{f"{name}_ratio": value for name, value in whole_file_ratios(path).items()},
+        "encode_mb_s": source_mb / encode_s,
+        "decode_mb_s": source_mb / decode_s,
+        "signal_mb_s": signal_mb / signal_s,
+        "range_p50_ms": percentile(latencies, 50) * 1000,
+        "range_p99_ms": percentile(latencies, 99) * 1000,
+        "full_decode_ms": decode_s * 1000,
+        "lossless": lossless,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", nargs="+", help="EDF files to measure instead of synthetic recordings")
+    parser.add_argument("--channels", type=int, nargs="+", default=[22])
+    parser.add_argument("--sfreq", type=int, nargs="+", default=[256])
+    parser.add_argument("--duration", type=float, nargs="+", default=[600])
+    parser.add_argument("--chunk-seconds", type=float, default=10.0)
+    parser.add_argument("--window", type=float, default=10.0, help="Seconds per random range decode")
+    parser.add_argument("--ranges", type=int, default=50, help="Random range decodes per recording")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.files:
+            sources = args.files
+        else:
+            sources = []
+            for channels, sfreq, duration in itertools.product(args.channels, args.sfreq, args.duration):
+                path = os.path.join(workdir, f"synthetic_{channels}ch_{sfreq}hz_{int(duration)}s.edf")
+                write_synthetic_edf(path, channels, sfreq, duration, args.seed)
+                sources.append(path)
+
+        print(f"{'recording':<34} {'MB':>7} {'ratio':>6} {'zlib':>5} {'xz':>5} {'enc MB/s':>9} "
+              f"{'dec MB/s':>9} {'sig MB/s':>9} {'range p50':>10} {'full ms':>8} lossless")
+        for path in sources:
+            result = measure(path, args, workdir)
+            results.append(result)
+            print(f"{os.path.basename(path)[:34]:<34} {result['source_bytes'] / 1e6:>7.1f} {result['ratio']:>6.2f} "
+                  f"{result['zlib_ratio']:>5.2f} {result['xz_ratio']:>5.2f} {result['encode_mb_s']:>9.1f} "
+                  f"{result['decode_mb_s']:>9.1f} {result['signal_mb_s']:>9.1f} "
+                  f"{result['range_p50_ms']:>8.2f}ms {result['full_decode_ms']:>8.1f} {result['lossless']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+    return 0 if all(result["lossless"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,129 @@
+"""
+GNN backend benchmark: CPU latency of eager PyTorch vs TorchScript vs ONNX Runtime
+vs dense adjacency
+
+Loads the model from GNN_MODEL_PATH (or an untrained one), exports the compiled
+backends into a temporary directory with app.models.gnn_export, checks their
+probabilities against eager mode and times one forward pass per graph size.
+With --batch B, B graphs run per pass: as one disjoint torch_geometric Batch for
+the edge-list backends and as a (B, N, F) tensor for the dense and int8 backends.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/gnn_backends.py --nodes 19 22 32 --iterations 500 --threads 1 --output gnn_backends.json
+    python benchmarks/gnn_backends.py --backends eager dense --batch 64
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import percentile
+
+BACKENDS = ["eager", "torchscript", "onnx", "dense", "int8"]
+
+
+def time_backend(func, iterations, warmup):
+    import torch
+    latencies = []
+    with torch.no_grad():
+        for _ in range(warmup):
+            func()
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="+", default=[19, 22, 32])
+    parser.add_argument("--backends", nargs="+", default=BACKENDS, choices=BACKENDS)
+    parser.add_argument("--batch", type=int, default=1, help="Graphs per forward pass")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--threads", type=int, help="torch/onnxruntime intra-op threads")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    if args.threads:
+        os.environ["OMP_NUM_THREADS"] = str(args.threads)
+    import torch
+    from torch_geometric.data import Batch, Data
+    from app.models import gnn_export
+    from app.models.gnn_dense import DenseGNNRunner
+    from app.models.gnn_quantized import QuantizedGNNRunner
+    from app.models.gnn_classifier import load_model
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model().eval()
+    input_dim = model.conv1.in_channels
+
+    workdir = tempfile.mkdtemp(prefix="gnn-backends-")
+    weights_path = os.path.join(workdir, "gnn_model.pth")
+    runners = {"eager": model, "dense": DenseGNNRunner(model), "int8": QuantizedGNNRunner(model)}
+    exports = {}
+    for backend in args.backends:
+        if backend in runners:
+            continue
+        try:
+            exports[backend] = gnn_export.export(model, backend, weights_path)
+            if exports[backend]["passed"]:
+                runners[backend] = gnn_export.RUNNERS[backend](exports[backend]["path"])
+        except Exception as e:
+            exports[backend] = {"backend": backend, "error": f"{type(e).__name__}: {e}"}
+
+    results = []
+    for n_nodes in args.nodes:
+        edge_index = gnn_export.fully_connected_edges(n_nodes)
+        features = torch.randn(args.batch, n_nodes, input_dim)
+        graphs = Batch.from_data_list([Data(x=x, edge_index=edge_index) for x in features])
+        for backend in args.backends:
+            if backend not in runners:
+                results.append({"nodes": n_nodes, "backend": backend,
+                                "error": exports[backend].get("error", "parity check failed")})
+                continue
+            runner = runners[backend]
+            if backend in ("dense", "int8"):
+                func = lambda: runner.forward_batch(features, edge_index)
+            else:
+                func = lambda: runner(graphs)
+            latencies = time_backend(func, args.iterations, args.warmup)
+            results.append({
+                "nodes": n_nodes,
+                "backend": backend,
+                "batch": args.batch,
+                "p50_ms": percentile(latencies, 50) * 1000,
+                "p99_ms": percentile(latencies, 99) * 1000,
+                "per_graph_us": percentile(latencies, 50) * 1e6 / args.batch,
+                "max_abs_diff": 0.0 if backend == "eager" else gnn_export.check_parity(
+                    model, runners[backend], input_dim, node_counts=(n_nodes,)),
+            })
+
+    eager_p50 = {r["nodes"]: r["p50_ms"] for r in results if r["backend"] == "eager" and "p50_ms" in r}
+    print(f"torch {torch.__version__}, {torch.get_num_threads()} threads, input_dim {input_dim}")
+    print(f"{'nodes':>5} {'backend':<12} {'p50 ms':>8} {'p99 ms':>8} {'us/graph':>9} {'speedup':>8} {'max |dp|':>9}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['nodes']:>5} {result['backend']:<12} error: {result['error']}")
+            continue
+        eager = eager_p50.get(result["nodes"])
+        speedup = f"{eager / result['p50_ms']:>7.2f}x" if eager and result["p50_ms"] else f"{'n/a':>8}"
+        print(f"{result['nodes']:>5} {result['backend']:<12} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} "
+              f"{result['per_graph_us']:>9.1f} {speedup} {result['max_abs_diff']:>9.1e}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "exports": exports, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+GNN quantization report: accuracy drift, latency and weight size of the int8 backend
+
+Builds the float eager model, the BatchNorm-folded float model and the int8
+dynamically quantized model (app.models.gnn_quantized) from the same weights,
+then on a held-out set of feature graphs reports:
+
+    drift     top-1 agreement, max/mean |p_float - p_int8| and mean KL per variant
+    latency   p50/p99 of one forward pass per graph
+    size      serialized state dict size
+
+The held-out set is either stored graphs (--graphs file.pt, a list of
+torch_geometric Data objects saved with torch.save) or seeded synthetic graphs
+with 19-32 fully connected nodes.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/gnn_quantization.py --synthetic 500 --threads 1 --output gnn_quantization.json
+    python benchmarks/gnn_quantization.py --graphs holdout_graphs.pt
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import percentile
+
+
+def synthetic_graphs(count, input_dim, seed):
+    import torch
+    from torch_geometric.data import Data
+    from app.models.gnn_export import fully_connected_edges
+    generator = torch.Generator().manual_seed(seed)
+    sizes = (19, 21, 22, 32)
+    return [
+        Data(x=torch.randn(sizes[index % len(sizes)], input_dim, generator=generator),
+             edge_index=fully_connected_edges(sizes[index % len(sizes)]))
+        for index in range(count)
+    ]
+
+
+def latency(model, graphs, repeats):
+    import torch
+    latencies = []
+    with torch.no_grad():
+        for graph in graphs[:min(len(graphs), 20)]:
+            model(graph)
+        for _ in range(repeats):
+            for graph in graphs:
+                start = time.perf_counter()
+                model(graph)
+                latencies.append(time.perf_counter() - start)
+    return {"p50_ms": percentile(latencies, 50) * 1000, "p99_ms": percentile(latencies, 99) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--graphs", help="torch.save'd list of Data objects to use as the held-out set")
+    parser.add_argument("--synthetic", type=int, default=200, help="Number of synthetic graphs without --graphs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed passes over the held-out set")
+    parser.add_argument("--threads", type=int, help="torch intra-op threads")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    import torch
+    from app.models.gnn_classifier import load_model
+    from app.models.gnn_dense import DenseGNNRunner
+    from app.models.gnn_quantized import FoldedGNN, QuantizedGNNRunner, drift_report, serialized_size
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model().eval()
+    input_dim = model.conv1.in_channels
+    if args.graphs:
+        graphs = torch.load(args.graphs)
+        source = args.graphs
+    else:
+        graphs = synthetic_graphs(args.synthetic, input_dim, args.seed)
+        source = f"{args.synthetic} synthetic graphs (seed {args.seed})"
+
+    folded = DenseGNNRunner(model)
+    folded.module = FoldedGNN(model).eval()
+    quantized = QuantizedGNNRunner(model)
+    variants = {"float": model, "folded": folded, "int8": quantized}
+
+    results = {}
+    for name, runner in variants.items():
+        module = runner if name == "float" else runner.module
+        results[name] = {
+            "size_kb": serialized_size(module) / 1024,
+            **latency(runner, graphs, args.repeats),
+            "drift": drift_report(model, runner, graphs) if name != "float" else None,
+        }
+
+    print(f"Held-out set: {source}; torch {torch.__version__}, {torch.get_num_threads()} threads, "
+          f"engine {torch.backends.quantized.engine}")
+    print(f"{'variant':<8} {'size KB':>8} {'p50 ms':>8} {'p99 ms':>8} {'top-1':>7} {'max |dp|':>9} "
+          f"{'mean |dp|':>10} {'mean KL':>9}")
+    for name, result in results.items():
+        drift = result["drift"]
+        drift_columns = (f"{drift['top1_agreement']:>7.1%} {drift['max_abs_diff']:>9.1e} "
+                         f"{drift['mean_abs_diff']:>10.1e} {drift['mean_kl']:>9.1e}") if drift else f"{'ref':>7}"
+        print(f"{name:<8} {result['size_kb']:>8.1f} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} {drift_columns}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "held_out": source, "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+"""
+HTTP load test for the full API with local stand-ins for MongoDB and the LLM
+
+Starts the stub LLM server (benchmarks/stub_llm.py) and the API (serve.py) with
+an in-memory mongomock database, registers test accounts, then ramps up virtual
+users running scripted scenarios:
+
+    doctor   login -> upload EDF -> process -> list reports -> download PDF
+    patient  login -> /me -> list reports -> chatbot question
+
+Throughput and p50/p95/p99 latency are reported per endpoint and per load
+level, along with the first level at which the API saturates (throughput stops
+growing, errors appear or a p99 exceeds --slo-ms).
+
+Usage (from the epileptech-api directory; needs mongomock installed for the app):
+    python benchmarks/loadtest.py --users 4 16 64 --duration 30 --doctor-ratio 0.3 \
+        --llm-latency 0.8 --llm-tokens-per-second 40 --output loadtest.json
+
+Use --url to drive an already running deployment (with its own database and
+LLM) instead; test accounts are registered there as well.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import datetime
+import tempfile
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from concurrency import free_port, percentile
+from stub_llm import StubConfig, start_stub_server
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "loadtest-password"
+
+PATIENT_QUESTIONS = [
+    "What is the difference between epileptic and psychogenic seizures?",
+    "Can stress trigger a seizure?",
+    "How long does an EEG recording usually take?",
+    "What should I do if I see someone having a seizure?",
+]
+
+
+class Recorder:
+    """Thread-safe collection of (level, endpoint, seconds, status) samples"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, level, endpoint, seconds, status):
+        with self._lock:
+            self.samples.append((level, endpoint, seconds, status))
+
+
+def multipart(fields, files):
+    """Encode form fields and (name, filename, bytes) files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+        )
+    for name, filename, content in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode("utf-8") + content + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class Client:
+    """One virtual user's HTTP client"""
+
+    def __init__(self, base_url, recorder, level):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.level = level
+        self.token = None
+
+    def call(self, method, path, endpoint, json_body=None, body=None, content_type=None, timeout=300):
+        headers = {}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if json_body is not None:
+            body = json.dumps(json_body).encode("utf-8")
+            content_type = "application/json"
+        if content_type:
+            headers["Content-Type"] = content_type
+
+        request = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                payload = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            payload = e.read()
+            status = e.code
+        except Exception:
+            payload = b""
+            status = 0
+        self.recorder.add(self.level, f"{method} {endpoint}", time.perf_counter() - start, status)
+        return status, payload
+
+    def login(self, username):
+        status, payload = self.call("POST", "/api/auth/login", "/api/auth/login",
+                                    json_body={"username": username, "password": PASSWORD})
+        self.token = json.loads(payload).get("access_token") if status == 200 else None
+        return self.token is not None
+
+
+def doctor_visit(client, username, edf_bytes, think):
+    if not client.login(username):
+        return
+    time.sleep(random.expovariate(1 / think) if think else 0)
+
+    eeg_id = f"LT-{uuid.uuid4().hex[:12]}"
+    patient = {"firstName": "Load", "lastName": f"Test{random.randint(1, 50)}", "age": 40, "gender": "Male",
+               "notes": "Load test upload"}
+    body, content_type = multipart(
+        {"eeg_id": eeg_id, "record_date": datetime.date.today().isoformat(), "patient_info": json.dumps(patient)},
+        [("file", f"{eeg_id}.edf", edf_bytes)],
+    )
+    status, _ = client.call("POST", "/api/eeg/upload", "/api/eeg/upload", body=body, content_type=content_type)
+    if status != 200:
+        return
+
+    status, _ = client.call("POST", f"/api/eeg/process/{eeg_id}", "/api/eeg/process/<eeg_id>")
+    time.sleep(random.expovariate(1 / think) if think else 0)
+    client.call("GET", "/api/eeg/reports", "/api/eeg/reports")
+    if status == 200:
+        client.call("GET", f"/api/eeg/reports/{eeg_id}/download", "/api/eeg/reports/<eeg_id>/download")
+
+
+def patient_visit(client, username, think):
+    if not client.login(username):
+        return
+    client.call("GET", "/api/auth/me", "/api/auth/me")
+    time.sleep(random.expovariate(1 / think) if think else 0)
+    client.call("GET", "/api/reports/", "/api/reports/")
+    time.sleep(random.expovariate(1 / think) if think else 0)
+    client.call("POST", "/api/chatbot/chat", "/api/chatbot/chat",
+                json_body={"message": random.choice(PATIENT_QUESTIONS), "session_id": str(uuid.uuid4())})
+
+
+def register_accounts(base_url, role, count):
+    recorder = Recorder()
+    client = Client(base_url, recorder, "setup")
+    names = []
+    for i in range(count):
+        username = f"loadtest-{role}-{i}"
+        client.call("POST", "/api/auth/register", "/api/auth/register", json_body={
+            "username": username,
+            "email": f"{username}@example.com",
+            "password": PASSWORD,
+            "first_name": "Load",
+            "last_name": f"Test {i}",
+            "is_doctor": role == "doctor",
+            "role": role,
+        })
+        names.append(username)
+    return names
+
+
+def run_level(base_url, users, duration, doctor_ratio, doctors, patients, edf_bytes, think, recorder):
+    """Run `users` virtual users for `duration` seconds; return wall time"""
+    deadline = time.monotonic() + duration
+
+    def virtual_user(index):
+        client = Client(base_url, recorder, users)
+        is_doctor = index < round(users * doctor_ratio)
+        username = doctors[index % len(doctors)] if is_doctor else patients[index % len(patients)]
+        while time.monotonic() < deadline:
+            if is_doctor:
+                doctor_visit(client, username, edf_bytes, think)
+            else:
+                patient_visit(client, username, think)
+
+    threads = [threading.Thread(target=virtual_user, args=(i,), daemon=True) for i in range(users)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.monotonic() - started
+
+
+def summarize(samples, wall):
+    latencies = [seconds for _, _, seconds, _ in samples]
+    errors = sum(1 for _, _, _, status in samples if status == 0 or status >= 500)
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": errors / len(samples) if samples else 0.0,
+        "throughput_rps": len(samples) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def find_saturation(levels, slo_ms, min_gain=0.10, max_error_rate=0.01):
+    """First level where throughput stops scaling, errors appear or a p99 breaks the SLO"""
+    previous = None
+    for level in levels:
+        reasons = []
+        total = level["total"]
+        if previous and total["throughput_rps"] < previous["total"]["throughput_rps"] * (1 + min_gain):
+            reasons.append("throughput stopped growing")
+        if total["error_rate"] > max_error_rate:
+            reasons.append(f"error rate {total['error_rate']:.1%}")
+        slow = [name for name, stats in level["endpoints"].items() if slo_ms and stats["p99_ms"] > slo_ms]
+        if slow:
+            reasons.append(f"p99 over {slo_ms:g} ms on {', '.join(sorted(slow))}")
+        if reasons:
+            return {"users": level["users"], "reasons": reasons}
+        previous = level
+    return None
+
+
+def synthetic_edf_bytes(channels, sfreq, duration):
+    path = os.path.join(tempfile.mkdtemp(prefix="loadtest-"), "upload.edf")
+    try:
+        from synthetic_edf import write_synthetic_edf
+        write_synthetic_edf(path, channels, sfreq, duration, seizure=(duration / 4, min(15, duration / 4)))
+    except ImportError:
+        # Without numpy the upload still exercises the API; the decoder uses its dummy-data fallback
+        print("numpy not available, uploading a placeholder file")
+        with open(path, "wb") as f:
+            f.write(b"0" * 256)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def start_api(mode, llm_url, workdir):
+    port = free_port()
+    env = dict(
+        os.environ,
+        MONGODB_URL="mongomock://localhost",
+        DB_NAME="loadtest",
+        USE_LOCAL_MODEL="False",
+        LLM_API_URL=f"{llm_url}/v1/chat/completions",
+        LLM_API_KEY="stub",
+        OPENAI_BASE_URL=f"{llm_url}/v1",
+        OPENAI_API_KEY="stub",
+        REPORT_STORE_DIR=os.path.join(workdir, "report_store"),
+    )
+    log = open(os.path.join(workdir, "api.log"), "w")
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(API_ROOT, "serve.py"), "--mode", mode, "--host", "127.0.0.1",
+         "--port", str(port)],
+        cwd=API_ROOT,
+        env=env,
+        stdout=log,
+        stderr=subprocess.STDOUT,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"{base_url}/", timeout=1).read()
+            return process, base_url
+        except Exception:
+            if process.poll() is not None:
+                raise RuntimeError(f"API exited with code {process.returncode}, see {log.name}")
+            time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"API did not start, see {log.name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Drive this running deployment instead of starting one")
+    parser.add_argument("--mode", choices=["green", "threaded"], default="green")
+    parser.add_argument("--users", nargs="+", type=int, default=[2, 8, 32], help="Virtual users per load level")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per load level")
+    parser.add_argument("--doctor-ratio", type=float, default=0.3)
+    parser.add_argument("--think", type=float, default=0.5, help="Mean think time between steps (seconds)")
+    parser.add_argument("--slo-ms", type=float, default=0, help="p99 latency budget per endpoint")
+    parser.add_argument("--edf-channels", type=int, default=22)
+    parser.add_argument("--edf-sfreq", type=int, default=256)
+    parser.add_argument("--edf-duration", type=float, default=60.0)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-tokens", type=int, default=200)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-api-")
+    process = None
+    stub = None
+    base_url = args.url
+    if base_url is None:
+        stub, llm_url = start_stub_server(config=StubConfig(
+            args.llm_latency, 0.2 * args.llm_latency, args.llm_tokens, args.llm_tokens_per_second, args.llm_error_rate
+        ))
+        process, base_url = start_api(args.mode, llm_url, workdir)
+        print(f"API ({args.mode}) at {base_url}, stub LLM at {llm_url}, logs in {workdir}")
+
+    try:
+        edf_bytes = synthetic_edf_bytes(args.edf_channels, args.edf_sfreq, args.edf_duration)
+        max_users = max(args.users)
+        doctors = register_accounts(base_url, "doctor", max(1, round(max_users * args.doctor_ratio)))
+        patients = register_accounts(base_url, "patient", max(1, max_users - len(doctors)))
+
+        recorder = Recorder()
+        levels = []
+        for users in args.users:
+            print(f"\n== {users} virtual users for {args.duration:g}s")
+            start_index = len(recorder.samples)
+            wall = run_level(base_url, users, args.duration, args.doctor_ratio, doctors, patients,
+                             edf_bytes, args.think, recorder)
+            samples = recorder.samples[start_index:]
+            endpoints = {}
+            for name in sorted({endpoint for _, endpoint, _, _ in samples}):
+                endpoints[name] = summarize([s for s in samples if s[1] == name], wall)
+            level = {"users": users, "wall_seconds": wall, "total": summarize(samples, wall), "endpoints": endpoints}
+            levels.append(level)
+
+            print(f"  {'endpoint':<44} {'req':>6} {'req/s':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'err':>5}")
+            for name, stats in list(endpoints.items()) + [("TOTAL", level["total"])]:
+                print(f"  {name:<44} {stats['requests']:>6} {stats['throughput_rps']:>7.2f} {stats['p50_ms']:>9.1f} "
+                      f"{stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f} {stats['errors']:>5}")
+
+        saturation = find_saturation(levels, args.slo_ms)
+        if saturation:
+            print(f"\nSaturation at {saturation['users']} users: {'; '.join(saturation['reasons'])}")
+        else:
+            print("\nNo saturation observed; try more users")
+
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump({
+                    "generated_at": datetime.datetime.now().isoformat(),
+                    "mode": "external" if args.url else args.mode,
+                    "settings": vars(args),
+                    "llm_requests": stub.config.requests if stub else None,
+                    "levels": levels,
+                    "saturation": saturation,
+                }, f, indent=2)
+            print(f"Results written to {args.output}")
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if stub is not None:
+            stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+End-to-end EEG pipeline benchmark
+
+Generates synthetic EDF recordings (see benchmarks/synthetic_edf.py) and times
+each stage of the pipeline on them:
+
+    decode            app.utils.file_handlers.process_eeg_file
+    filter            signal_filters.preprocess_signal (resample, band-pass, notch)
+    preprocess        gnn_classifier.preprocess_eeg_to_graph
+    model_forward     GNNModel forward pass (no grad)
+    detect_intervals  gnn_classifier.detect_seizure_intervals
+    report_mock       llm_report_generator.build_prompt + generate_mock_report
+    pdf               llm_report_generator.create_pdf_report
+
+Each recording configuration runs in a fresh interpreter so peak RSS and model
+load time are not shared between configurations. Everything runs offline on the
+CPU: CUDA is hidden and the report stage uses the mock generator.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/pipeline.py --channels 22 64 --sfreq 256 --duration 60 600 \
+        --iterations 5 --output pipeline.json
+    python benchmarks/pipeline.py --output new.json --compare pipeline.json --threshold 0.15
+
+With --compare the p50 of every stage is checked against the baseline file and
+the exit code is 1 if any stage got slower by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import datetime
+import itertools
+import statistics
+import subprocess
+import tempfile
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STAGES = ["decode", "filter", "preprocess", "model_forward", "detect_intervals", "report_mock", "pdf"]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM on Linux, giving a per-stage peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def time_stage(func, iterations, warmup):
+    """Run func warmup + iterations times; return (latencies, peak_rss_mb, last result)"""
+    result = None
+    for _ in range(warmup):
+        result = func()
+    reset_peak_rss()
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        result = func()
+        latencies.append(time.perf_counter() - start)
+    return latencies, peak_rss_mb(), result
+
+
+def summarize(latencies, peak_rss_mb, recording_seconds):
+    mean = statistics.mean(latencies)
+    p50 = percentile(latencies, 50)
+    return {
+        "iterations": len(latencies),
+        "p50_ms": p50 * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": mean * 1000,
+        "ops_per_s": 1 / mean if mean else 0.0,
+        # Seconds of EEG handled per second of compute
+        "realtime_factor": recording_seconds / p50 if p50 else 0.0,
+        "peak_rss_mb": peak_rss_mb,
+    }
+
+
+def run_configuration(config, iterations, warmup, seed):
+    """Benchmark one recording configuration inside the current interpreter"""
+    sys.path.insert(0, API_ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    # Keep generated PDFs out of the real report store
+    os.environ["REPORT_STORE_DIR"] = os.path.join(workdir, "report_store")
+
+    from synthetic_edf import write_synthetic_edf
+
+    duration = config["duration"]
+    edf_path = os.path.join(workdir, "synthetic.edf")
+    start = time.perf_counter()
+    write_synthetic_edf(
+        edf_path, config["channels"], config["sfreq"], duration, seed=seed, seizure=(duration / 4, min(15, duration / 4))
+    )
+    result = {
+        "config": config,
+        "edf_mb": os.path.getsize(edf_path) / (1024 * 1024),
+        "generate_seconds": time.perf_counter() - start,
+        "stages": {},
+    }
+
+    from app.utils import file_handlers
+    from app.models import llm_report_generator
+
+    state = {}
+
+    def decode():
+        return file_handlers.process_eeg_file(edf_path)
+
+    def filter_signal():
+        from app.utils import signal_filters
+        return signal_filters.preprocess_signal(state["eeg_data"])
+
+    def preprocess():
+        return gnn_classifier.preprocess_eeg_to_graph(state["eeg_data"])
+
+    def model_forward():
+        import torch
+        with torch.no_grad():
+            return state["model"](state["graph"])
+
+    def detect_intervals():
+        return gnn_classifier.detect_seizure_intervals(state["eeg_data"])
+
+    def report_mock():
+        return llm_report_generator.generate_mock_report(llm_report_generator.build_prompt(state["eeg_case"]))
+
+    def pdf():
+        return llm_report_generator.create_pdf_report(state["report_text"], state["eeg_case"])
+
+    gnn_classifier = None
+    try:
+        from app.models import gnn_classifier
+        start = time.perf_counter()
+        state["model"] = gnn_classifier.get_model()
+        result["model_load_ms"] = (time.perf_counter() - start) * 1000
+        result["model_version"] = gnn_classifier.model_version()
+    except Exception as e:
+        result["model_load_error"] = f"{type(e).__name__}: {e}"
+
+    state["eeg_case"] = {
+        "eeg_id": "benchmark",
+        "first_name": "Synthetic",
+        "last_name": "Patient",
+        "age": 35,
+        "gender": "Female",
+        "clinical_notes": "Synthetic recording generated for benchmarking.",
+        "classification": "epileptic",
+        "confidence": {"epileptic": 81.5, "non-epileptic": 12.0, "psychogenic": 6.5},
+        "seizure_intervals": [],
+    }
+
+    steps = [
+        ("decode", decode, "eeg_data"),
+        ("filter", filter_signal, "eeg_data"),
+        ("preprocess", preprocess, "graph"),
+        ("model_forward", model_forward, None),
+        ("detect_intervals", detect_intervals, "intervals"),
+        ("report_mock", report_mock, "report_text"),
+        ("pdf", pdf, None),
+    ]
+    for name, func, output in steps:
+        try:
+            latencies, peak, value = time_stage(func, iterations, warmup)
+        except Exception as e:
+            result["stages"][name] = {"error": f"{type(e).__name__}: {e}"}
+            continue
+        result["stages"][name] = summarize(latencies, peak, duration)
+        if output:
+            state[output] = value
+        if name == "decode":
+            # The decoder silently substitutes random data when MNE cannot read the file
+            result["decode_fallback"] = bool(value.get("is_dummy_data", False))
+        if name == "detect_intervals":
+            state["eeg_case"]["seizure_intervals"] = value
+
+    result["peak_rss_mb"] = peak_rss_mb()
+    return result
+
+
+def run_child(config, iterations, warmup, seed):
+    """Run one configuration in a fresh interpreter and parse its JSON line"""
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="", USE_LOCAL_MODEL="False", TRACING_ENABLED="False")
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", json.dumps(config),
+         "--iterations", str(iterations), "--warmup", str(warmup), "--seed", str(seed)],
+        cwd=API_ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+    if not lines:
+        tail = proc.stderr.strip().splitlines()[-1:] or ["no output"]
+        return {"config": config, "error": tail[0], "stages": {}}
+    return json.loads(lines[-1])
+
+
+def config_key(config):
+    return f"{config['channels']}ch/{config['sfreq']}Hz/{config['duration']:g}s"
+
+
+def compare(results, baseline_path, threshold):
+    """Print p50 changes against a baseline file; return the regressed stages"""
+    with open(baseline_path) as f:
+        baseline = {config_key(r["config"]): r for r in json.load(f)["results"]}
+
+    regressions = []
+    print(f"\nComparison with {baseline_path} (p50, threshold {threshold:.0%})")
+    for result in results:
+        key = config_key(result["config"])
+        old = baseline.get(key)
+        if old is None:
+            print(f"  {key}: not in baseline")
+            continue
+        for stage in STAGES:
+            new_stats = result["stages"].get(stage, {})
+            old_stats = old["stages"].get(stage, {})
+            if "p50_ms" not in new_stats or "p50_ms" not in old_stats or not old_stats["p50_ms"]:
+                continue
+            change = new_stats["p50_ms"] / old_stats["p50_ms"] - 1
+            flag = "REGRESSION" if change > threshold else ""
+            print(f"  {key:<22} {stage:<17} {old_stats['p50_ms']:>10.2f} -> {new_stats['p50_ms']:>10.2f} ms "
+                  f"{change:>+8.1%} {flag}")
+            if flag:
+                regressions.append((key, stage, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", nargs="+", type=int, default=[22])
+    parser.add_argument("--sfreq", nargs="+", type=int, default=[256])
+    parser.add_argument("--duration", nargs="+", type=float, default=[60.0], help="Recording length in seconds")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed p50 slowdown before failing")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_configuration(json.loads(args.child), args.iterations, args.warmup, args.seed)))
+        return
+
+    configs = [
+        {"channels": channels, "sfreq": sfreq, "duration": duration}
+        for channels, sfreq, duration in itertools.product(args.channels, args.sfreq, args.duration)
+    ]
+    results = []
+    for config in configs:
+        print(f"\n== {config_key(config)}")
+        result = run_child(config, args.iterations, args.warmup, args.seed)
+        results.append(result)
+        if result.get("error"):
+            print(f"  failed: {result['error']}")
+            continue
+        if result.get("decode_fallback"):
+            print("  warning: MNE could not read the file, decode timings are for the dummy-data fallback")
+        if "model_load_ms" in result:
+            print(f"  model load {result['model_load_ms']:.1f} ms, peak RSS {result['peak_rss_mb']:.1f} MB")
+        print(f"  {'stage':<17} {'p50 ms':>10} {'p99 ms':>10} {'ops/s':>9} {'x realtime':>11} {'peak MB':>9}")
+        for stage in STAGES:
+            stats = result["stages"].get(stage, {})
+            if "error" in stats:
+                print(f"  {stage:<17} error: {stats['error']}")
+            elif stats:
+                print(f"  {stage:<17} {stats['p50_ms']:>10.2f} {stats['p99_ms']:>10.2f} {stats['ops_per_s']:>9.2f} "
+                      f"{stats['realtime_factor']:>11.1f} {stats['peak_rss_mb']:>9.1f}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "generated_at": datetime.datetime.now().isoformat(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "iterations": args.iterations,
+                "warmup": args.warmup,
+                "seed": args.seed,
+                "results": results,
+            }, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Signal memory benchmark: peak RSS of decode + feature extraction + detection per SIGNAL_DTYPE
+
+For every dtype policy a fresh interpreter imports the pipeline, writes down its
+baseline RSS, then decodes a synthetic EDF, builds the graph features and runs
+seizure interval detection. The reported peak is the high-water mark above that
+baseline, so the torch/MNE import cost does not hide the signal arrays.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/signal_memory.py --channels 64 --sfreq 512 --duration 1800 --output signal_memory.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import peak_rss_mb, reset_peak_rss
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+POLICIES = ["float64", "float32", "int16"]
+
+
+def run_policy(edf_path):
+    """Runs in the child interpreter with SIGNAL_DTYPE already set"""
+    sys.path.insert(0, API_ROOT)
+    from app.utils import file_handlers
+    from app.utils.signal_dtype import signal_nbytes
+    from app.models import gnn_classifier
+
+    reset_peak_rss()
+    baseline = peak_rss_mb()
+    timings = {}
+
+    start = time.perf_counter()
+    eeg_data = file_handlers.process_eeg_file(edf_path)
+    timings["decode_s"] = time.perf_counter() - start
+    after_decode = peak_rss_mb()
+
+    start = time.perf_counter()
+    graph = gnn_classifier.preprocess_eeg_to_graph(eeg_data)
+    timings["preprocess_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    intervals = gnn_classifier.detect_seizure_intervals(eeg_data)
+    timings["detect_s"] = time.perf_counter() - start
+
+    return {
+        "policy": os.environ.get("SIGNAL_DTYPE"),
+        "fallback": bool(eeg_data.get("is_dummy_data", False)),
+        "signal_mb": signal_nbytes(eeg_data) / (1024 * 1024),
+        "decode_peak_mb": after_decode - baseline,
+        "peak_mb": peak_rss_mb() - baseline,
+        "baseline_mb": baseline,
+        "n_features": int(graph.x.shape[1]),
+        "intervals": intervals,
+        **timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--channels", type=int, default=64)
+    parser.add_argument("--sfreq", type=int, default=512)
+    parser.add_argument("--duration", type=float, default=900.0)
+    parser.add_argument("--policies", nargs="+", default=POLICIES, choices=POLICIES)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_policy(args.child)))
+        return
+
+    from synthetic_edf import write_synthetic_edf
+    edf_path = os.path.join(tempfile.mkdtemp(prefix="signal-memory-"), "synthetic.edf")
+    write_synthetic_edf(edf_path, args.channels, args.sfreq, args.duration, seizure=(args.duration / 4, 20))
+    print(f"{args.channels} ch x {args.sfreq} Hz x {args.duration:g} s "
+          f"({os.path.getsize(edf_path) / (1024 * 1024):.0f} MB EDF)")
+
+    results = []
+    for policy in args.policies:
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", edf_path],
+            cwd=API_ROOT,
+            env=dict(os.environ, SIGNAL_DTYPE=policy, CUDA_VISIBLE_DEVICES=""),
+            capture_output=True,
+            text=True,
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            results.append({"policy": policy, "error": (proc.stderr.strip().splitlines() or ["no output"])[-1]})
+        else:
+            results.append(json.loads(lines[-1]))
+
+    reference = next((r for r in results if r.get("policy") == "float64" and "peak_mb" in r), None)
+    print(f"{'policy':<9} {'signal MB':>10} {'decode peak':>12} {'total peak':>11} {'saved':>11} "
+          f"{'decode s':>9} {'features s':>11} {'detect s':>9}")
+    for result in results:
+        if "error" in result:
+            print(f"{result['policy']:<9} error: {result['error']}")
+            continue
+        saving = f"{1 - result['peak_mb'] / reference['peak_mb']:>10.0%}" if reference and reference["peak_mb"] else "n/a"
+        print(f"{result['policy']:<9} {result['signal_mb']:>10.1f} {result['decode_peak_mb']:>12.1f} "
+              f"{result['peak_mb']:>11.1f} {saving:>11} {result['decode_s']:>9.2f} "
+              f"{result['preprocess_s']:>11.2f} {result['detect_s']:>9.2f}")
+        if result["fallback"]:
+            print(f"  warning: {result['policy']} decoded the dummy-data fallback, not the EDF")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
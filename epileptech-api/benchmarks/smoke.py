@@ -0,0 +1,114 @@
+"""
+Offline smoke checks for code paths the mongomock load test does not reach
+
+Each check runs the real library code with the pinned dependencies, without a
+MongoDB server or model weights, and prints ok/FAIL. The exit code is 1 if
+any check fails.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/smoke.py [check ...]
+"""
+import os
+import sys
+import argparse
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def check_mongo_client():
+    """The production MongoClient accepts the configured options and listeners"""
+    from app.database.database import MongoConnectionManager
+    # connect=False: building the client validates its options without a server
+    client = MongoConnectionManager("mongodb://localhost:27017")._create_client()
+    client.close()
+
+
+def check_mongo_ping_timeout():
+    """ping() against an unreachable server gives up after its own timeout, not the client's"""
+    import time
+    from app.database.database import MongoConnectionManager
+    manager = MongoConnectionManager("mongodb://127.0.0.1:1")
+    start = time.perf_counter()
+    ok, _ = manager.ping(timeout_ms=300)
+    elapsed = time.perf_counter() - start
+    manager.close()
+    if ok or elapsed > 2:
+        raise ValueError(f"ping returned {ok} after {elapsed:.1f} s")
+
+
+def check_blob_gc_race():
+    """A put() that revives a key while garbage collection deletes its object leaves the object stored"""
+    import time
+    import tempfile
+    import threading
+    import mongomock
+    from app.utils.blob_storage import BlobStore, LocalBlobBackend
+    backend = LocalBlobBackend(tempfile.mkdtemp())
+    store = BlobStore(backend=backend, collection=mongomock.MongoClient().db.blobs)
+    key = store.put_bytes(b"recording", "a.edf")
+    store.release(key)
+
+    delete = backend.delete
+    writers = []
+
+    def delete_while_revived(k):
+        writer = threading.Thread(target=store.put_bytes, args=(b"recording", "a.edf"))
+        writer.start()
+        writers.append(writer)
+        time.sleep(0.3)
+        delete(k)
+
+    backend.delete = delete_while_revived
+    store.collect_garbage(grace_seconds=0)
+    for writer in writers:
+        writer.join()
+    if not backend.exists(key):
+        raise ValueError("revived blob was deleted")
+
+
+def check_preprocess_signal():
+    """preprocess_signal runs end to end (resample, filters) for every storage policy"""
+    import numpy as np
+    from app.utils.signal_dtype import POLICIES, from_array
+    from app.utils.signal_filters import preprocess_signal
+    signal = np.random.default_rng(0).standard_normal((4, 10 * 256)) * 50e-6
+    for policy in POLICIES:
+        data, scales = from_array(signal, policy)
+        eeg_data = {"data": data, "scales": scales, "dtype": policy, "sampling_rate": 256.0,
+                    "n_samples": data.shape[1], "duration": 10.0}
+        processed = preprocess_signal(eeg_data)
+        if not np.isfinite(processed["data"]).all():
+            raise ValueError(f"{policy}: non-finite output")
+
+
+CHECKS = {
+    "mongo_client": check_mongo_client,
+    "mongo_ping_timeout": check_mongo_ping_timeout,
+    "blob_gc_race": check_blob_gc_race,
+    "preprocess_signal": check_preprocess_signal,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("checks", nargs="*", help=f"Checks to run (default all): {', '.join(CHECKS)}")
+    args = parser.parse_args()
+    unknown = set(args.checks) - set(CHECKS)
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(sorted(unknown))}")
+
+    failed = 0
+    for name in args.checks or CHECKS:
+        try:
+            CHECKS[name]()
+            print(f"ok    {name}")
+        except Exception:
+            failed += 1
+            print(f"FAIL  {name}")
+            traceback.print_exc()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Startup benchmark: import time and resident memory per module
+
+Each module is imported in a fresh interpreter so the numbers are not skewed by
+modules already loaded by an earlier measurement.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/startup.py [--output startup.json] [--repeat 3] [module ...]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULES = [
+    "flask",
+    "pymongo",
+    "openai",
+    "fpdf",
+    "numpy",
+    "scipy.signal",
+    "mne",
+    "matplotlib.pyplot",
+    "torch",
+    "torch_geometric",
+    "transformers",
+    "app.routers.auth",
+    "app.routers.reports",
+    "app.routers.chatbot",
+    "app.routers.eeg",
+    "app.models.gnn_classifier",
+]
+
+# Runs inside the child interpreter; prints one JSON line
+_PROBE = r"""
+import json, resource, sys, time
+
+def rss_kb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+name = sys.argv[1]
+rss_before = rss_kb()
+modules_before = len(sys.modules)
+start = time.perf_counter()
+error = None
+try:
+    __import__(name)
+except Exception as e:
+    error = f"{type(e).__name__}: {e}"
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "rss_mb": (rss_kb() - rss_before) / 1024,
+    "modules_loaded": len(sys.modules) - modules_before,
+    "heavy_loaded": [m for m in ("torch", "torch_geometric", "mne", "transformers", "matplotlib") if m in sys.modules],
+    "error": error,
+}))
+"""
+
+
+def measure(module, repeat):
+    """Import a module `repeat` times in fresh interpreters and summarize"""
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-c", _PROBE, module],
+            cwd=API_ROOT,
+            capture_output=True,
+            text=True,
+        )
+        lines = [line for line in proc.stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            return {"module": module, "error": proc.stderr.strip().splitlines()[-1:] or "no output"}
+        runs.append(json.loads(lines[-1]))
+
+    seconds = [run["seconds"] for run in runs]
+    return {
+        "module": module,
+        "import_seconds_median": statistics.median(seconds),
+        "import_seconds_min": min(seconds),
+        "rss_mb": statistics.median(run["rss_mb"] for run in runs),
+        "modules_loaded": runs[-1]["modules_loaded"],
+        "heavy_loaded": runs[-1]["heavy_loaded"],
+        "error": runs[-1]["error"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'module':<30} {'seconds':>9} {'rss MB':>9}  heavy deps pulled in")
+    for module in args.modules:
+        result = measure(module, args.repeat)
+        results.append(result)
+        if result.get("error") and "import_seconds_median" not in result:
+            print(f"{module:<30} {'error':>9}  {result['error']}")
+            continue
+        heavy = ", ".join(result["heavy_loaded"]) or "-"
+        suffix = f"  ({result['error']})" if result["error"] else ""
+        print(f"{module:<30} {result['import_seconds_median']:>9.3f} {result['rss_mb']:>9.1f}  {heavy}{suffix}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
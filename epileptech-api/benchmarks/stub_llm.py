@@ -0,0 +1,159 @@
+"""
+Stub OpenAI-compatible chat completions server for load tests
+
+Answers POST /v1/chat/completions (plain and streamed) with canned text after a
+configurable delay, so report generation (LLM_API_URL) and the chatbot
+(OPENAI_BASE_URL) can be load-tested without a real model or API key.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/stub_llm.py --port 9200 --latency 0.8 --tokens-per-second 40 --tokens 300
+
+Then start the API with:
+    LLM_API_URL=http://127.0.0.1:9200/v1/chat/completions LLM_API_KEY=stub USE_LOCAL_MODEL=False
+    OPENAI_BASE_URL=http://127.0.0.1:9200/v1 OPENAI_API_KEY=stub
+"""
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "the recording shows background activity within normal limits with intermittent "
+    "sharp waveforms over the temporal leads clinical correlation is recommended and "
+    "follow up monitoring should be considered if events recur"
+).split()
+
+
+class StubConfig:
+    def __init__(self, latency=0.5, jitter=0.2, tokens=200, tokens_per_second=50.0, error_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens = tokens
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+
+
+def make_handler(config):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send_json(200, {"status": "ok", "requests": config.requests})
+            else:
+                self._send_json(404, {"error": "Not found"})
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": "Not found"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            config.count()
+
+            time.sleep(max(0.0, config.latency + random.uniform(-config.jitter, config.jitter)))
+            if random.random() < config.error_rate:
+                self._send_json(503, {"error": {"message": "stub overloaded"}})
+                return
+
+            tokens = [random.choice(WORDS) for _ in range(config.tokens)]
+            if request.get("stream"):
+                self._stream(request, tokens)
+            else:
+                # Simulate generation time for the whole completion
+                time.sleep(len(tokens) / config.tokens_per_second if config.tokens_per_second else 0)
+                self._send_json(200, {
+                    "id": f"chatcmpl-{uuid.uuid4().hex}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(tokens)},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                })
+
+        def _stream(self, request, tokens):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            delay = 1 / config.tokens_per_second if config.tokens_per_second else 0
+            for index, token in enumerate(tokens):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": request.get("model", "stub"),
+                    "choices": [{"index": 0, "delta": {"content": token + " "}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return StubHandler
+
+
+def start_stub_server(host="127.0.0.1", port=0, config=None):
+    """
+    Start the stub in a background thread
+
+    Returns:
+        (server, base_url): The running server and its http://host:port URL
+    """
+    config = config or StubConfig()
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    server.config = config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9200)
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds before the first token")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    config = StubConfig(args.latency, args.jitter, args.tokens, args.tokens_per_second, args.error_rate)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config))
+    print(f"Stub LLM listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Synthetic EEG recordings written as EDF files, for benchmarks and load tests
+
+The signal follows the fallback generator in app.utils.file_handlers (a mix of
+5, 10, 15 and 20 Hz oscillations with per-channel weights plus Gaussian noise),
+optionally with a high-amplitude 3 Hz spike-and-wave burst standing in for a
+seizure. Data is generated and written one block of records at a time, so hour
+long, high-density recordings do not have to fit in memory.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/synthetic_edf.py out.edf --channels 22 --sfreq 256 --duration 600 --seizure 120 20
+"""
+import argparse
+import datetime
+
+import numpy as np
+
+# Oscillations mixed into every channel, as in process_eeg_file's fallback
+BASE_FREQUENCIES_HZ = (10, 20, 5, 15)
+AMPLITUDE_UV = 25.0
+NOISE_UV = 10.0
+SEIZURE_AMPLITUDE_UV = 150.0
+PHYSICAL_RANGE_UV = 500.0
+RECORDS_PER_BLOCK = 60
+
+
+def _field(value, width):
+    text = str(value)
+    if len(text) > width:
+        raise ValueError(f"EDF header value {text!r} does not fit in {width} characters")
+    return text.ljust(width).encode("ascii")
+
+
+def edf_header(channel_names, sfreq, n_records, record_seconds=1, start=None):
+    """
+    Build the fixed and per-signal EDF header
+
+    Args:
+        channel_names: Signal labels
+        sfreq: Samples per second (an integer, so each record holds whole samples)
+        n_records: Number of data records
+        record_seconds: Duration of one data record
+        start: Recording start datetime
+
+    Returns:
+        header: Header bytes (256 * (n_signals + 1) long)
+    """
+    start = start or datetime.datetime(2024, 1, 1)
+    n_signals = len(channel_names)
+    header = b"".join([
+        _field("0", 8),
+        _field("X X X Synthetic", 80),
+        _field("Startdate X X X EpilepTech benchmark", 80),
+        _field(start.strftime("%d.%m.%y"), 8),
+        _field(start.strftime("%H.%M.%S"), 8),
+        _field(256 * (n_signals + 1), 8),
+        _field("", 44),
+        _field(n_records, 8),
+        _field(record_seconds, 8),
+        _field(n_signals, 4),
+    ])
+    per_signal = [
+        (16, lambda name: name),
+        (80, lambda name: "AgAgCl electrode"),
+        (8, lambda name: "uV"),
+        (8, lambda name: int(-PHYSICAL_RANGE_UV)),
+        (8, lambda name: int(PHYSICAL_RANGE_UV)),
+        (8, lambda name: -32768),
+        (8, lambda name: 32767),
+        (80, lambda name: "HP:0.1Hz LP:70Hz"),
+        (8, lambda name: int(sfreq * record_seconds)),
+        (32, lambda name: ""),
+    ]
+    for width, value in per_signal:
+        header += b"".join(_field(value(name), width) for name in channel_names)
+    return header
+
+
+def synthetic_block(rng, weights, sfreq, start_s, n_samples, seizure=None):
+    """
+    Generate one block of synthetic EEG in microvolts
+
+    Args:
+        rng: numpy Generator
+        weights: (n_channels, len(BASE_FREQUENCIES_HZ)) mixing weights
+        sfreq: Sampling rate in Hz
+        start_s: Time of the first sample in seconds
+        n_samples: Samples per channel in this block
+        seizure: Optional (start_s, duration_s) of a spike-and-wave burst
+
+    Returns:
+        data: (n_channels, n_samples) float array
+    """
+    t = start_s + np.arange(n_samples) / sfreq
+    oscillations = np.sin(2 * np.pi * np.outer(BASE_FREQUENCIES_HZ, t)) * AMPLITUDE_UV
+    data = weights @ oscillations
+    data += rng.normal(0, NOISE_UV, data.shape)
+
+    if seizure is not None:
+        onset, length = seizure
+        mask = (t >= onset) & (t < onset + length)
+        if mask.any():
+            phase = 2 * np.pi * 3 * (t[mask] - onset)
+            # Sharp spike followed by a slow wave, repeating at 3 Hz
+            burst = np.sin(phase) ** 15 - 0.4 * np.cos(phase / 2) ** 2
+            data[:, mask] += SEIZURE_AMPLITUDE_UV * burst
+    return data
+
+
+def write_synthetic_edf(path, n_channels=22, sfreq=256, duration=60, seed=0, seizure=None):
+    """
+    Write a synthetic EEG recording to an EDF file
+
+    Args:
+        path: Output file path
+        n_channels: Number of EEG channels
+        sfreq: Sampling rate in Hz (integer)
+        duration: Length in seconds (rounded up to whole seconds)
+        seed: Random seed, so the same arguments always produce the same file
+        seizure: Optional (start_s, duration_s) of a simulated seizure
+
+    Returns:
+        path: The written file path
+    """
+    sfreq = int(sfreq)
+    n_records = int(np.ceil(duration))
+    channel_names = [f"EEG{i + 1}" for i in range(n_channels)]
+    rng = np.random.default_rng(seed)
+    weights = rng.uniform(0.5, 1.5, (n_channels, len(BASE_FREQUENCIES_HZ)))
+    scale = 32767 / PHYSICAL_RANGE_UV
+
+    with open(path, "wb") as f:
+        f.write(edf_header(channel_names, sfreq, n_records))
+        for first in range(0, n_records, RECORDS_PER_BLOCK):
+            records = min(RECORDS_PER_BLOCK, n_records - first)
+            data = synthetic_block(rng, weights, sfreq, first, records * sfreq, seizure)
+            digital = np.clip(np.round(data * scale), -32768, 32767).astype("<i2")
+            # EDF stores each record as all samples of signal 1, then signal 2, ...
+            digital = digital.reshape(n_channels, records, sfreq).transpose(1, 0, 2)
+            f.write(digital.tobytes())
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    parser.add_argument("--channels", type=int, default=22)
+    parser.add_argument("--sfreq", type=int, default=256)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seizure", nargs=2, type=float, metavar=("START", "LENGTH"))
+    args = parser.parse_args()
+
+    write_synthetic_edf(args.path, args.channels, args.sfreq, args.duration, args.seed, args.seizure)
+    print(f"Wrote {args.path}")
+
+
+if __name__ == "__main__":
+    main()
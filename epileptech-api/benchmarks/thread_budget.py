@@ -0,0 +1,177 @@
+"""
+Thread budget sweep: throughput of worker x thread layouts on this host
+
+For every (workers, threads per worker) layout, starts that many worker
+processes at the same moment. Each one applies the CPU budget
+(app.utils.cpu_budget) and then repeats a classification-shaped job for
+--duration seconds. The job has three parts:
+
+    features  gnn_classifier.preprocess_eeg_to_graph on a synthetic recording (NumPy/SciPy)
+    forward   one GNN forward pass (torch)
+    blas      a float32 matrix product (BLAS)
+
+For each layout it reports jobs/second over all workers, job latency and
+contention: the share of thread time spent runnable but waiting for a core,
+plus involuntary context switches per job. --threads 0 leaves every library
+at its default (one thread per core), as before the governor existed.
+
+Usage (from the epileptech-api directory):
+    python benchmarks/thread_budget.py --workers 1 2 4 8 --threads 0 1 2 4 --duration 20 --output thread_budget.json
+    python benchmarks/thread_budget.py --workers 4 --threads 2 --affinity auto
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import subprocess
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pipeline import percentile
+
+API_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_worker(index, workers, threads, duration, start_at, channels, sfreq, seconds):
+    """Runs in a child interpreter: apply the budget, wait for the common start, then loop"""
+    sys.path.insert(0, API_ROOT)
+    from app.utils import cpu_budget
+    budget = cpu_budget.apply_process_budget(worker_index=index, workers=workers) if threads else None
+
+    import numpy as np
+    import torch
+    from torch_geometric.data import Data
+    from app.models import gnn_classifier
+    from app.models.gnn_export import fully_connected_edges
+
+    model = gnn_classifier.get_model()
+    rng = np.random.default_rng(index)
+    eeg_data = {"data": rng.standard_normal((channels, int(sfreq * seconds))).astype(np.float32), "sampling_rate": sfreq}
+    graph = Data(x=torch.randn(channels, model.conv1.in_channels), edge_index=fully_connected_edges(channels))
+    matrix = rng.standard_normal((512, 512)).astype(np.float32)
+
+    def job():
+        gnn_classifier.preprocess_eeg_to_graph(eeg_data)
+        with torch.no_grad():
+            model(graph)
+        matrix @ matrix
+
+    job()
+    while time.time() < start_at:
+        time.sleep(0.005)
+    _, running_before, waiting_before, switches_before = cpu_budget.task_stats()
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        begin = time.perf_counter()
+        job()
+        latencies.append(time.perf_counter() - begin)
+    threads_alive, running, waiting, switches = cpu_budget.task_stats()
+    return {
+        "index": index,
+        "jobs": len(latencies),
+        "latencies": latencies,
+        "threads_alive": threads_alive,
+        "torch_threads": torch.get_num_threads(),
+        "running_s": running - running_before,
+        "waiting_s": waiting - waiting_before,
+        "involuntary_switches": switches - switches_before,
+        "affinity": budget["affinity"] if budget else None,
+    }
+
+
+def run_layout(workers, threads, args):
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES="", CPU_BUDGET_ENABLED="true",
+               CPU_THREAD_BUDGET=str(threads), CPU_AFFINITY=args.affinity)
+    if not threads:
+        env["CPU_BUDGET_ENABLED"] = "false"
+        for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+            env.pop(name, None)
+    # Leave the children time to import torch before the common start
+    start_at = time.time() + args.startup
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--child", str(index), str(workers), str(threads),
+             str(args.duration), repr(start_at), str(args.channels), str(args.sfreq), str(args.seconds)],
+            cwd=API_ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+        )
+        for index in range(workers)
+    ]
+    outputs = []
+    for proc in procs:
+        stdout, stderr = proc.communicate()
+        lines = [line for line in stdout.splitlines() if line.startswith("{")]
+        if not lines:
+            return {"workers": workers, "threads": threads, "error": (stderr.strip().splitlines() or ["no output"])[-1]}
+        outputs.append(json.loads(lines[-1]))
+
+    latencies = [value for output in outputs for value in output["latencies"]]
+    jobs = sum(output["jobs"] for output in outputs)
+    running = sum(output["running_s"] for output in outputs)
+    waiting = sum(output["waiting_s"] for output in outputs)
+    return {
+        "workers": workers,
+        "threads": threads,
+        "jobs_per_s": jobs / args.duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "threads_alive": sum(output["threads_alive"] for output in outputs),
+        "torch_threads": outputs[0]["torch_threads"],
+        "wait_share": waiting / (running + waiting) if running + waiting else 0.0,
+        "switches_per_job": sum(output["involuntary_switches"] for output in outputs) / jobs if jobs else 0.0,
+        "affinity": [output["affinity"] for output in outputs],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, nargs="+", default=[0, 1, 2],
+                        help="Threads per worker; 0 = library defaults (no governor)")
+    parser.add_argument("--affinity", default="none", help="CPU_AFFINITY for the workers: none or auto")
+    parser.add_argument("--duration", type=float, default=15.0, help="Seconds each layout runs")
+    parser.add_argument("--startup", type=float, default=20.0, help="Seconds allowed for worker start-up")
+    parser.add_argument("--channels", type=int, default=22)
+    parser.add_argument("--sfreq", type=float, default=256.0)
+    parser.add_argument("--seconds", type=float, default=60.0, help="Length of each worker's synthetic recording")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--child", nargs=8, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        index, workers, threads, duration, start_at, channels, sfreq, seconds = args.child
+        print(json.dumps(run_worker(int(index), int(workers), int(threads), float(duration), float(start_at),
+                                    int(channels), float(sfreq), float(seconds))))
+        return
+
+    print(f"{os.cpu_count()} cores; {args.channels} ch x {args.sfreq:g} Hz x {args.seconds:g} s per job")
+    print(f"{'workers':>7} {'threads':>7} {'total':>6} {'jobs/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'alive':>6} {'waiting':>8} {'switch/job':>10}")
+    results = []
+    for workers, threads in itertools.product(args.workers, args.threads):
+        result = run_layout(workers, threads, args)
+        results.append(result)
+        label = threads or "default"
+        if "error" in result:
+            print(f"{workers:>7} {label:>7} error: {result['error']}")
+            continue
+        total = workers * threads if threads else workers * (os.cpu_count() or 1)
+        print(f"{workers:>7} {label:>7} {total:>6} {result['jobs_per_s']:>8.2f} {result['p50_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['threads_alive']:>6} {result['wait_share']:>8.1%} "
+              f"{result['switches_per_job']:>10.1f}")
+
+    best = max((r for r in results if "jobs_per_s" in r), key=lambda r: r["jobs_per_s"], default=None)
+    if best:
+        print(f"\nBest layout: {best['workers']} workers x {best['threads'] or 'default'} threads "
+              f"({best['jobs_per_s']:.2f} jobs/s)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Production entry point with a choice of serving mode
+
+    python serve.py --mode green     # eventlet: one process, many concurrent requests
+    python serve.py --mode threaded  # werkzeug threaded server, one OS thread per request
+
+In green mode the standard library is monkey-patched before the app is
+imported, so waits on MongoDB (pymongo), the OpenAI API and the LLM/inference
+HTTP calls yield to other requests instead of parking a thread. CPU-bound
+classification is handed to native threads by app.utils.executors.
+
+Either way the CPU thread budget (app.utils.cpu_budget) is applied before the
+app, and with it NumPy and torch, is imported.
+"""
+import os
+import argparse
+
+def apply_cpu_budget():
+    from app.utils.cpu_budget import apply_process_budget
+    from app.utils.executors import CPU_WORKERS
+    apply_process_budget(concurrent_jobs=CPU_WORKERS)
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the EpilepTech API")
+    parser.add_argument("--mode", choices=["green", "threaded"], default=os.environ.get("SERVE_MODE", "green"))
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "9000")))
+    parser.add_argument("--max-connections", type=int, default=int(os.environ.get("MAX_CONNECTIONS", "1000")),
+                        help="Maximum concurrent green threads (green mode only)")
+    args = parser.parse_args()
+
+    if args.mode == "green":
+        # Must happen before anything imports socket, threading or ssl
+        import eventlet
+        eventlet.monkey_patch()
+        import eventlet.wsgi
+        apply_cpu_budget()
+        from app.main import app
+
+        eventlet.wsgi.server(
+            eventlet.listen((args.host, args.port)),
+            app,
+            max_size=args.max_connections,
+            log_output=False,
+        )
+    else:
+        from werkzeug.serving import run_simple
+        apply_cpu_budget()
+        from app.main import app
+
+        run_simple(args.host, args.port, app, threaded=True)
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,11 @@ import {
 } from "react-icons/fa";
 
 // API endpoint for the chatbot - using relative path with proxy
-const API_ENDPOINT = "/api/chatbot/chat";
+const API_ENDPOINT = "/api/chatbot/chat/stream";
+
+// Create a random identifier for this browser tab's chat session
+const createSessionId = () =>
+  `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
 
 const AIAssistant = () => {
   const [messages, setMessages] = useState([
@@ -29,6 +33,7 @@ const AIAssistant = () => {
   const [error, setError] = useState(null);
   const messagesEndRef = useRef(null);
   const inputRef = useRef(null);
+  const sessionIdRef = useRef(createSessionId());
   
   // Mock suggested questions - expanded with more relevant options
   const suggestedQuestions = [
@@ -54,20 +59,13 @@ const AIAssistant = () => {
     }
   ];
   
-  // Function to call the OpenAI API through our Flask backend
-  const callOpenAI = async (userMessage) => {
-    console.log("Sending message to OpenAI API:", userMessage);
+  // Function to call the OpenAI API through our Flask backend.
+  // The reply is streamed as server-sent events and passed to onToken piece by piece.
+  const callOpenAI = async (userMessage, onToken) => {
     setIsTyping(true);
     setError(null);
     
     try {
-      // For debugging - log the request
-      console.log("API Request:", {
-        url: API_ENDPOINT,
-        method: "POST",
-        body: { message: userMessage }
-      });
-      
       const response = await fetch(API_ENDPOINT, {
         method: "POST",
         headers: {
@@ -75,34 +73,74 @@ const AIAssistant = () => {
           // Add any authentication headers if needed
           // "Authorization": `Bearer ${localStorage.getItem("token")}`
         },
-        body: JSON.stringify({ message: userMessage }),
+        body: JSON.stringify({ message: userMessage, session_id: sessionIdRef.current }),
         credentials: "include" // Include cookies for session authentication
       });
       
-      // For debugging - log the response status
-      console.log("API Response Status:", response.status);
-      
       if (!response.ok) {
         const errorData = await response.json();
         console.error("API Error:", errorData);
         throw new Error(errorData.error || "Failed to get response from AI assistant");
       }
       
-      const data = await response.json();
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = "";
+      let reply = "";
       
-      // For debugging - log the response data
-      console.log("API Response Data:", data);
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split("\n\n");
+        buffer = events.pop();
+        
+        for (const event of events) {
+          if (!event.startsWith("data: ")) continue;
+          const payload = JSON.parse(event.slice(6));
+          
+          if (payload.error) {
+            throw new Error(payload.error);
+          }
+          if (payload.token) {
+            // Hide the typing indicator once the first token arrives
+            setIsTyping(false);
+            reply += payload.token;
+            onToken(reply);
+          }
+          if (payload.session_id) {
+            sessionIdRef.current = payload.session_id;
+          }
+        }
+      }
       
-      return data.reply;
+      return reply;
     } catch (error) {
       console.error("Error calling OpenAI API:", error);
       setError(error.message);
-      return "I'm sorry, I encountered an error. Please try again later.";
+      onToken("I'm sorry, I encountered an error. Please try again later.");
     } finally {
       setIsTyping(false);
     }
   };
   
+  // Stream the assistant's answer into a new message bubble
+  const askAssistant = async (text) => {
+    const replyId = `assistant-${Date.now()}`;
+    
+    await callOpenAI(text, (partialReply) => {
+      setMessages(prev => {
+        if (!prev.some(message => message.id === replyId)) {
+          return [...prev, { id: replyId, type: "assistant", text: partialReply }];
+        }
+        return prev.map(message =>
+          message.id === replyId ? { ...message, text: partialReply } : message
+        );
+      });
+    });
+  };
+  
   // Helper function to simulate AI response with better responses
   const simulateResponse = (userMessage) => {
     setIsTyping(true);
@@ -153,21 +191,7 @@ const AIAssistant = () => {
     setInput("");
     
     // Call the OpenAI API instead of simulating a response
-    try {
-      const aiResponse = await callOpenAI(input);
-      
-      setMessages(prev => [
-        ...prev, 
-        {
-          id: prev.length + 1,
-          type: "assistant",
-          text: aiResponse
-        }
-      ]);
-    } catch (error) {
-      console.error("Error in handleSendMessage:", error);
-      setError(error.message);
-    }
+    await askAssistant(input);
   };
   
   // Handle clicking a suggested question
@@ -181,21 +205,7 @@ const AIAssistant = () => {
     setMessages(prev => [...prev, userMessage]);
     
     // Call the OpenAI API instead of simulating a response
-    try {
-      const aiResponse = await callOpenAI(question.text);
-      
-      setMessages(prev => [
-        ...prev, 
-        {
-          id: prev.length + 1,
-          type: "assistant",
-          text: aiResponse
-        }
-      ]);
-    } catch (error) {
-      console.error("Error in handleSuggestionClick:", error);
-      setError(error.message);
-    }
+    await askAssistant(question.text);
     
     // Hide suggestions after clicking one
     setShowSuggestions(false);